@@ -2,6 +2,8 @@
 ASGI config for backend project.
 
 It exposes the ASGI callable as a module-level variable named ``application``.
+HTTP requests go to Django; WebSocket connections to /ws/employees/kiosk/
+are served by the kiosk face-login stream (employees/kiosk.py).
 
 For more information on this file, see
 https://docs.djangoproject.com/en/3.2/howto/deployment/asgi/
@@ -13,4 +15,20 @@ from django.core.asgi import get_asgi_application
 
 os.environ.setdefault('DJANGO_SETTINGS_MODULE', 'backend.settings')
 
-application = get_asgi_application()
+django_application = get_asgi_application()
+
+# Imported after Django is set up
+from employees.kiosk import kiosk_application  # noqa: E402
+
+KIOSK_PATH = '/ws/employees/kiosk/'
+
+
+async def application(scope, receive, send):
+    if scope['type'] == 'websocket':
+        if scope['path'].rstrip('/') + '/' == KIOSK_PATH:
+            return await kiosk_application(scope, receive, send)
+        # Unknown WebSocket path: reject the handshake
+        await receive()
+        await send({'type': 'websocket.close', 'code': 4404})
+        return
+    return await django_application(scope, receive, send)
@@ -140,4 +140,97 @@ MEDIA_URL = "/media/"
 MEDIA_ROOT = os.path.join(BASE_DIR, "media")
 
 
+# ---------------- FACE RECOGNITION ----------------
+
+# Maximum Euclidean distance between a probe and an enrolled encoding for a match
+FACE_MATCH_TOLERANCE = 0.6
+# Number of nearest employees returned by the gallery search
+FACE_MATCH_TOP_K = 3
+# Company whose employees a kiosk searches when the login request names none
+# (None searches every company)
+FACE_LOGIN_COMPANY_ID = None
+# Each employee keeps at most FACE_MAX_EXEMPLARS encodings (k-medoids over the enrollment images)
+FACE_MAX_EXEMPLARS = 5
+# Exact matching scores exemplars of the FACE_MATCH_SHORTLIST employees with the closest centroids (0: score all)
+FACE_MATCH_SHORTLIST = 64
+# Enrollment looks up the FACE_DUPLICATE_TOP_K nearest employees of the company for every new
+# exemplar; one within FACE_DUPLICATE_TOLERANCE is a duplicate face, which
+# FACE_DUPLICATE_CHECK 'reject's (409), 'flag's (logged, returned as duplicate_face) or ignores ('off')
+FACE_DUPLICATE_CHECK = 'flag'
+FACE_DUPLICATE_TOLERANCE = 0.5
+FACE_DUPLICATE_TOP_K = 3
+# One process packs the searchable gallery into a file that every worker maps read-only
+# (FACE_GALLERY_SHARED_DIR, e.g. '/dev/shm'; None keeps it next to the face store)
+FACE_GALLERY_SHARED = True
+FACE_GALLERY_SHARED_DIR = None
+# Storage of the searchable exemplars: 'float32', 'float16' or 'int8' (per-dimension scaled);
+# compare match decisions with `manage.py face_precision_report` before lowering it
+FACE_GALLERY_PRECISION = 'float32'
+# Models each worker loads in the background after it starts (see employees/ml_models.py)
+FACE_WARM_MODELS = ['face_recognition', 'fer']
+# 'brute' scores every exemplar exactly; 'ivf' uses the approximate IVF/PQ index
+# for partitions with at least FACE_ANN_MIN_ROWS exemplars
+FACE_MATCHER = 'brute'
+FACE_ANN_MIN_ROWS = 20000
+FACE_ANN_NLIST = 256
+FACE_ANN_NPROBE = 16
+# Product-quantization sub-vectors per encoding (0 keeps exact float32 vectors in the lists)
+FACE_ANN_PQ_M = 0
+# Journal records after which the face store is compacted into a new segment (0 disables)
+FACE_STORE_COMPACT_RECORDS = 256
+# Processes used to detect and encode enrollment photos in parallel
+# (None: one per CPU, at most 4; 0: encode in the request thread)
+FACE_ENROLL_WORKERS = None
+# Camera frames are decoded at a reduced JPEG scale down to about this longest side,
+# faces are detected on a copy no larger than FACE_DETECT_MAX_SIDE, and only the
+# face crop (plus FACE_CROP_MARGIN of the box size on each side) is encoded
+FACE_DECODE_MAX_SIDE = 1280
+FACE_DETECT_MAX_SIDE = 640
+FACE_CROP_MARGIN = 0.25
+# FER threads running next to face encoding in face_login, and how long a login
+# waits for the emotion before answering without it
+FACE_EMOTION_WORKERS = 1
+FACE_EMOTION_DEADLINE_MS = 300
+# Face crops of up to FACE_EMOTION_BATCH_SIZE concurrent frames share one emotion CNN pass;
+# a batch of several frames waits at most FACE_EMOTION_BATCH_WAIT_MS for more (1 disables batching)
+FACE_EMOTION_BATCH_SIZE = 8
+FACE_EMOTION_BATCH_WAIT_MS = 5
+# Emotion snapshots (EmotionData rows + images) are written by a background thread
+# in batches; a full queue blocks a request for at most FACE_WRITE_BEHIND_PUT_TIMEOUT_MS
+# and then drops the snapshot. False writes them in the request.
+FACE_WRITE_BEHIND = True
+FACE_WRITE_BEHIND_QUEUE_SIZE = 1000
+FACE_WRITE_BEHIND_BATCH_SIZE = 100
+FACE_WRITE_BEHIND_FLUSH_INTERVAL = 0.5
+FACE_WRITE_BEHIND_PUT_TIMEOUT_MS = 50
+# Face logins update Employee.last_login in batches: every FACE_LAST_LOGIN_FLUSH_INTERVAL
+# seconds, or sooner once FACE_LAST_LOGIN_BATCH_SIZE employees are pending
+FACE_LAST_LOGIN_FLUSH_INTERVAL = 5.0
+FACE_LAST_LOGIN_BATCH_SIZE = 500
+# Cache alias and lifetime (seconds) of the per-employee face login profile
+FACE_LOGIN_PROFILE_CACHE = 'default'
+FACE_LOGIN_PROFILE_TTL = 300
+# Kiosk stream (/ws/employees/kiosk/): a match needs FACE_KIOSK_VOTE_MIN of the last
+# FACE_KIOSK_VOTE_FRAMES encoded frames; a face is tracked while its box overlaps the
+# previous one by FACE_KIOSK_TRACK_IOU and is lost after FACE_KIOSK_MAX_MISSES empty frames.
+# A matched face is re-encoded every FACE_KIOSK_REVERIFY_FRAMES frames or FACE_KIOSK_REVERIFY_SECONDS
+# and its track dropped if it is no longer the matched employee
+FACE_KIOSK_VOTE_FRAMES = 5
+FACE_KIOSK_VOTE_MIN = 3
+FACE_KIOSK_TRACK_IOU = 0.5
+FACE_KIOSK_MAX_MISSES = 3
+FACE_KIOSK_REVERIFY_FRAMES = 10
+FACE_KIOSK_REVERIFY_SECONDS = 2.0
+# Largest raw image/* request body accepted by face_login and capture_emotion (bytes)
+FACE_UPLOAD_MAX_BYTES = 10 * 1024 * 1024
+# Quality gate run on a FACE_QUALITY_MAX_SIDE subsampled copy before kiosk frames
+# (FACE_QUALITY_GATE) and face_login captures (FACE_LOGIN_QUALITY_GATE) reach the face
+# models; FACE_QUALITY_THRESHOLDS overrides any of employees.quality.DEFAULT_THRESHOLDS
+# (min/max_brightness, min_contrast, min_sharpness, and min_skin_ratio, which is off unless set)
+FACE_QUALITY_GATE = True
+FACE_LOGIN_QUALITY_GATE = False
+FACE_QUALITY_MAX_SIDE = 160
+FACE_QUALITY_THRESHOLDS = {}
+
+
 DEFAULT_AUTO_FIELD = 'django.db.models.BigAutoField'
@@ -0,0 +1,253 @@
+"""
+Approximate nearest-neighbour index for large face galleries (pure NumPy).
+
+IVFIndex is an inverted file: a coarse k-means quantizer splits the gallery
+into nlist cells, and a search only scans the nprobe cells whose centroids are
+closest to the probe. With pq_m > 0 the vectors in each cell are stored as
+product-quantization codes of their residual to the cell centroid (pq_m bytes
+per exemplar instead of 512) and scored with asymmetric distance tables.
+
+Each stored row carries a label (the employee id); search returns the k best
+labels with the distance of their closest row, like GalleryIndex.search.
+"""
+import numpy as np
+
+
+def _sq_dists(a, b):
+    """Pairwise squared Euclidean distances between rows of a and rows of b"""
+    d = np.einsum('ij,ij->i', a, a)[:, None] - 2.0 * (a @ b.T) + np.einsum('ij,ij->i', b, b)[None, :]
+    return np.maximum(d, 0.0, out=d)
+
+
+def kmeans(vectors, k, iterations=20, seed=0, init='kmeans++'):
+    """
+    Lloyd's k-means; returns (centroids, assignments).
+    init is 'kmeans++' (better cells, slower to seed) or 'random' (sampled vectors).
+    """
+    vectors = np.asarray(vectors, dtype=np.float32)
+    rng = np.random.default_rng(seed)
+    n = len(vectors)
+    k = min(k, n)
+
+    if init == 'random':
+        centroids = vectors[rng.choice(n, size=k, replace=False)].copy()
+    else:
+        centroids = np.empty((k, vectors.shape[1]), dtype=np.float32)
+        centroids[0] = vectors[rng.integers(n)]
+        closest = np.sum((vectors - centroids[0]) ** 2, axis=1, dtype=np.float64)
+        for i in range(1, k):
+            total = closest.sum()
+            pick = np.searchsorted(np.cumsum(closest), rng.random() * total) if total > 0 else rng.integers(n)
+            centroids[i] = vectors[min(pick, n - 1)]
+            np.minimum(closest, np.sum((vectors - centroids[i]) ** 2, axis=1, dtype=np.float64), out=closest)
+
+    assignments = np.zeros(n, dtype=np.int64)
+    for _ in range(iterations):
+        assignments = _sq_dists(vectors, centroids).argmin(axis=1)
+        counts = np.bincount(assignments, minlength=k)
+        # Per-cluster sums via a sort + segmented reduction (much faster than np.add.at)
+        order = np.argsort(assignments, kind='stable')
+        starts = np.concatenate([[0], np.cumsum(counts)[:-1]])
+        non_empty = counts > 0
+        sums = np.add.reduceat(vectors[order], starts[non_empty], axis=0, dtype=np.float64)
+        new_centroids = centroids.copy()
+        new_centroids[non_empty] = (sums / counts[non_empty, None]).astype(np.float32)
+        # Re-seed empty cells on random vectors so every list stays usable
+        empty = np.flatnonzero(~non_empty)
+        if len(empty):
+            new_centroids[empty] = vectors[rng.choice(n, size=len(empty), replace=False)]
+        if np.allclose(new_centroids, centroids):
+            break
+        centroids = new_centroids
+    return centroids, assignments
+
+
+class IVFIndex:
+    """Inverted-file index with optional product quantization"""
+
+    # k-means is trained on at most this many points per cell / codeword
+    TRAINING_POINTS_PER_CENTROID = 64
+
+    def __init__(self, nlist=64, nprobe=8, pq_m=0, pq_bits=8, seed=0):
+        self.nlist = nlist
+        self.nprobe = nprobe
+        self.pq_m = pq_m
+        self.pq_bits = pq_bits
+        self.seed = seed
+        self.metadata = {}
+        self.trained_size = 0
+        self.dim = None
+        self.centroids = None
+        self.codebooks = None  # (pq_m, 2 ** pq_bits, dim // pq_m) when PQ is enabled
+        self._cell_terms = None
+        self._lists = []  # per cell: (payload, labels) with payload float32 rows or uint8 codes
+
+    def _precompute_tables(self):
+        """Query-independent part of the PQ distance tables, per cell: |r_j|^2 + 2<c_j, r_j>"""
+        if not self.pq_m:
+            self._cell_terms = None
+            return
+        sub_centroids = self.centroids.reshape(self.nlist, self.pq_m, -1)
+        norms = np.einsum('mks,mks->mk', self.codebooks, self.codebooks)
+        self._cell_terms = norms[None] + 2.0 * np.einsum('cms,mks->cmk', sub_centroids, self.codebooks)
+
+    @property
+    def is_trained(self):
+        return self.centroids is not None
+
+    def __len__(self):
+        return sum(len(labels) for _, labels in self._lists)
+
+    def labels(self):
+        if not self._lists:
+            return np.empty(0, dtype=object)
+        return np.concatenate([labels for _, labels in self._lists])
+
+    # ---------------- Build ----------------
+
+    def _sample(self, vectors, k):
+        limit = k * self.TRAINING_POINTS_PER_CENTROID
+        if len(vectors) <= limit:
+            return vectors
+        rng = np.random.default_rng(self.seed)
+        return vectors[np.sort(rng.choice(len(vectors), size=limit, replace=False))]
+
+    def train(self, vectors):
+        vectors = np.asarray(vectors, dtype=np.float32)
+        self.dim = vectors.shape[1]
+        self.trained_size = len(vectors)
+        self.centroids, _ = kmeans(self._sample(vectors, self.nlist), self.nlist, seed=self.seed)
+        self.nlist = len(self.centroids)
+
+        if self.pq_m:
+            if self.dim % self.pq_m:
+                raise ValueError(f"pq_m={self.pq_m} must divide the encoding dimension {self.dim}")
+            sample = self._sample(vectors, 2 ** self.pq_bits)
+            residuals = sample - self.centroids[_sq_dists(sample, self.centroids).argmin(axis=1)]
+            sub_dim = self.dim // self.pq_m
+            codebooks = np.zeros((self.pq_m, 2 ** self.pq_bits, sub_dim), dtype=np.float32)
+            for j in range(self.pq_m):
+                sub = residuals[:, j * sub_dim:(j + 1) * sub_dim]
+                book, _ = kmeans(sub, 2 ** self.pq_bits, iterations=10, seed=self.seed + j + 1, init='random')
+                codebooks[j, :len(book)] = book
+            self.codebooks = codebooks
+        self._precompute_tables()
+        self._lists = [(self._empty_payload(), np.empty(0, dtype=object)) for _ in range(self.nlist)]
+
+    def build(self, vectors, labels):
+        """Train the quantizers on vectors and add them"""
+        self.train(vectors)
+        self.add(vectors, labels)
+        return self
+
+    def _empty_payload(self):
+        if self.pq_m:
+            return np.empty((0, self.pq_m), dtype=np.uint8)
+        return np.empty((0, self.dim), dtype=np.float32)
+
+    def _encode(self, residuals):
+        sub_dim = self.dim // self.pq_m
+        codes = np.empty((len(residuals), self.pq_m), dtype=np.uint8)
+        for j in range(self.pq_m):
+            sub = residuals[:, j * sub_dim:(j + 1) * sub_dim]
+            codes[:, j] = _sq_dists(sub, self.codebooks[j]).argmin(axis=1)
+        return codes
+
+    def add(self, vectors, labels):
+        if not self.is_trained:
+            raise ValueError("IVFIndex must be trained before adding vectors")
+        vectors = np.asarray(vectors, dtype=np.float32).reshape(-1, self.dim)
+        labels = np.asarray(labels, dtype=object)
+        cells = _sq_dists(vectors, self.centroids).argmin(axis=1)
+        payload = self._encode(vectors - self.centroids[cells]) if self.pq_m else vectors
+        for cell in np.unique(cells):
+            mask = cells == cell
+            old_payload, old_labels = self._lists[cell]
+            self._lists[cell] = (np.concatenate([old_payload, payload[mask]]),
+                                 np.concatenate([old_labels, labels[mask]]))
+
+    def remove(self, labels):
+        """Remove every row carrying one of the given labels"""
+        drop = np.asarray(list(labels), dtype=str)
+        for cell, (payload, cell_labels) in enumerate(self._lists):
+            if not len(cell_labels):
+                continue
+            keep = ~np.isin(cell_labels.astype(str), drop)
+            if not keep.all():
+                self._lists[cell] = (payload[keep], cell_labels[keep])
+
+    # ---------------- Search ----------------
+
+    def search(self, probe, k=1, nprobe=None):
+        """Return [(label, distance), ...] for the k best labels, best first"""
+        if not self.is_trained or not len(self):
+            return []
+        q = np.asarray(probe, dtype=np.float32).reshape(1, -1)
+        nprobe = min(nprobe or self.nprobe, self.nlist)
+        coarse = _sq_dists(q, self.centroids)[0]
+        cells = np.argpartition(coarse, nprobe - 1)[:nprobe]
+
+        cells = [cell for cell in cells if len(self._lists[cell][1])]
+        if not cells:
+            return []
+        payload = np.concatenate([self._lists[cell][0] for cell in cells])
+        labels = np.concatenate([self._lists[cell][1] for cell in cells])
+        if self.pq_m:
+            # IVFADC: |q - c - r|^2 = |q - c|^2 + sum_j (|r_j|^2 + 2<c_j, r_j>) - 2<q_j, r_j>
+            q_terms = -2.0 * np.einsum('ms,mks->mk', q[0].reshape(self.pq_m, -1), self.codebooks)
+            tables = (self._cell_terms[cells] + q_terms).reshape(-1)
+            # Row i of the candidates uses the tables of its cell: flat index = cell, sub-quantizer, code
+            n_codes = 2 ** self.pq_bits
+            position = np.repeat(np.arange(len(cells)), [len(self._lists[cell][1]) for cell in cells])
+            flat = (position * self.pq_m)[:, None] * n_codes + np.arange(self.pq_m) * n_codes + payload
+            dists = np.take(tables, flat).sum(axis=1) + coarse[cells][position]
+        else:
+            dists = _sq_dists(q, payload)[0]
+
+        order = np.argsort(dists, kind='stable')
+        results = []
+        seen = set()
+        for i in order:
+            if labels[i] in seen:
+                continue
+            seen.add(labels[i])
+            results.append((labels[i], float(np.sqrt(max(dists[i], 0.0)))))
+            if len(results) == k:
+                break
+        return results
+
+    # ---------------- Persistence ----------------
+
+    def save(self, path, **metadata):
+        """Write the index to path (an .npz file); metadata arrays are stored alongside"""
+        if not self.is_trained:
+            raise ValueError("cannot save an untrained IVFIndex")
+        sizes = np.array([len(labels) for _, labels in self._lists], dtype=np.int64)
+        np.savez(
+            path,
+            params=np.array([self.nlist, self.nprobe, self.pq_m, self.pq_bits, self.seed, self.dim,
+                             self.trained_size], dtype=np.int64),
+            centroids=self.centroids,
+            codebooks=self.codebooks if self.codebooks is not None else np.empty(0, dtype=np.float32),
+            payload=np.concatenate([payload for payload, _ in self._lists]),
+            labels=np.concatenate([labels for _, labels in self._lists]).astype(str),
+            sizes=sizes,
+            **{f"meta_{name}": np.asarray(value) for name, value in metadata.items()},
+        )
+
+    @classmethod
+    def load(cls, path):
+        with np.load(path) as data:
+            nlist, nprobe, pq_m, pq_bits, seed, dim, trained_size = (int(v) for v in data['params'])
+            index = cls(nlist=nlist, nprobe=nprobe, pq_m=pq_m, pq_bits=pq_bits, seed=seed)
+            index.dim = dim
+            index.trained_size = trained_size
+            index.metadata = {name[len('meta_'):]: data[name] for name in data.files if name.startswith('meta_')}
+            index.centroids = data['centroids']
+            index.codebooks = data['codebooks'] if pq_m else None
+            payload = data['payload']
+            labels = data['labels'].astype(object)
+            bounds = np.concatenate([[0], np.cumsum(data['sizes'])])
+        index._lists = [(payload[bounds[i]:bounds[i + 1]], labels[bounds[i]:bounds[i + 1]]) for i in range(nlist)]
+        index._precompute_tables()
+        return index
@@ -0,0 +1,315 @@
+"""
+Benchmark cases of the face pipeline, run by the bench_face_pipeline command.
+
+Cases are written like pytest-benchmark tests: each receives a `benchmark`
+callable (benchmark(fn, *args) runs fn for the warm-up and timed rounds and
+returns its result) and the BenchEnvironment. Frame cases (decode,
+quality_gate, detect, encode, emotion_concurrent) run once; gallery cases
+run for every synthetic gallery size. A case that does not call `benchmark`
+(emotion_concurrent without FER) is left out of the report.
+
+Synthetic galleries hold random 128-d encodings drawn like
+MockFaceRecognition's (uniform in [0, 1)) plus one target employee enrolled
+from the benchmark frame itself, so face_login has a real match to find.
+Everything runs against a throwaway test database and a temporary
+MEDIA_ROOT (see bench_environment).
+"""
+import base64
+import json
+import os
+import shutil
+import subprocess
+import sys
+import tempfile
+import time
+from contextlib import contextmanager
+
+import numpy as np
+from django.conf import settings
+from django.db import connection
+from django.test import Client, override_settings
+from django.test.utils import setup_test_environment, teardown_test_environment
+
+from . import face_store, write_behind
+from .emotion import EmotionBatcher, classify_emotions
+from .gallery import get_gallery
+from .last_login import get_recorder
+from .ml_models import registry
+from .preprocess import decode_frame, detect_faces, encode_faces, process_frame
+from .quality import check_frame
+from .recognition import using_mock
+
+# name -> (case function, runs once per gallery size)
+CASES = {}
+
+
+def case(name, per_gallery=False):
+    def register(fn):
+        CASES[name] = (fn, per_gallery)
+        return fn
+    return register
+
+
+def summarize(samples):
+    """Statistics (in milliseconds) of per-round durations in seconds"""
+    ms = np.asarray(samples) * 1000
+    return {
+        'rounds': len(ms),
+        'min_ms': round(float(ms.min()), 4),
+        'median_ms': round(float(np.median(ms)), 4),
+        'mean_ms': round(float(ms.mean()), 4),
+        'p95_ms': round(float(np.percentile(ms, 95)), 4),
+        'max_ms': round(float(ms.max()), 4),
+        'stddev_ms': round(float(ms.std()), 4),
+    }
+
+
+class Benchmark:
+    """The `benchmark` callable handed to a case; keeps the stats of its last call"""
+
+    def __init__(self, rounds=20, warmup=3):
+        self.rounds = rounds
+        self.warmup = warmup
+        self.stats = None
+        self.extra = {}
+
+    def __call__(self, fn, *args, **kwargs):
+        for _ in range(self.warmup):
+            fn(*args, **kwargs)
+        samples = []
+        result = None
+        for _ in range(self.rounds):
+            start = time.perf_counter()
+            result = fn(*args, **kwargs)
+            samples.append(time.perf_counter() - start)
+        self.stats = summarize(samples)
+        return result
+
+
+class BenchEnvironment:
+    def __init__(self, frame, per_employee=3, seed=0):
+        self.frame = frame
+        self.per_employee = per_employee
+        self.rng = np.random.default_rng(seed)
+        self.client = Client()
+        self.company = None
+        self.gallery_size = None
+        self.target = None
+        self.probe = None
+
+    def populate(self, size):
+        """Enroll a synthetic gallery of `size` employees (the target included) in a fresh company"""
+        from company.models import Company
+        from .models import Employee
+
+        # Earlier galleries stay in the database but drop out of the active membership
+        Employee.objects.filter(is_active=True).update(is_active=False)
+        self.company = Company.objects.create(
+            name=f"Benchmark {size}", email=f"bench-{size}-{time.time_ns()}@example.com", password='x',
+        )
+        employees = [
+            Employee(company=self.company, first_name='Bench', last_name=str(i),
+                     email=f"bench-{self.company.id}-{i}@example.com", is_active=True)
+            for i in range(size)
+        ]
+        Employee.objects.bulk_create(employees, batch_size=1000)
+        self.target = employees[0]
+
+        target_encodings = process_frame(self.frame)['encodings']
+        encodings = {}
+        for emp in employees[1:]:
+            encodings[str(emp.id)] = list(self.rng.random((self.per_employee, face_store.ENCODING_DIM)))
+        encodings[str(self.target.id)] = target_encodings[:1] or [self.rng.random(face_store.ENCODING_DIM)]
+        face_store.replace_all(encodings, dict.fromkeys(encodings, self.company.id))
+        get_gallery().load(wait=True)
+        self.gallery_size = size
+        self.probe = encodings[str(self.target.id)][0]
+
+    def login(self, raw=False):
+        if raw:
+            return self.client.post(f"/api/employees/face-login/?company_id={self.company.id}",
+                                    self.frame, content_type='image/jpeg')
+        body = {'image': 'data:image/jpeg;base64,' + base64.b64encode(self.frame).decode(), 'company_id': self.company.id}
+        return self.client.post('/api/employees/face-login/', json.dumps(body), content_type='application/json')
+
+
+@contextmanager
+def bench_environment():
+    """A throwaway test database and MEDIA_ROOT; background writers are drained before teardown"""
+    media_root = tempfile.mkdtemp(prefix='bench_face_')
+    if connection.vendor == 'sqlite':
+        # A file rather than the shared-cache in-memory test database, whose table locks
+        # would make the write-behind and last_login threads fail against the request thread
+        connection.settings_dict['TEST'] = {**connection.settings_dict.get('TEST', {}),
+                                            'NAME': os.path.join(media_root, 'bench.sqlite3')}
+    setup_test_environment()
+    old_name = connection.creation.create_test_db(verbosity=0, autoclobber=True, serialize=False)
+    try:
+        # The quality gate is timed by its own case
+        with override_settings(MEDIA_ROOT=media_root, FACE_QUALITY_GATE=False, FACE_LOGIN_QUALITY_GATE=False):
+            try:
+                yield
+            finally:
+                write_behind.get_writer().flush()
+                get_recorder().flush()
+    finally:
+        connection.creation.destroy_test_db(old_name, verbosity=0)
+        teardown_test_environment()
+        shutil.rmtree(media_root, ignore_errors=True)
+
+
+# ---------------- Cases ----------------
+
+@case('decode')
+def bench_decode(benchmark, env):
+    benchmark(decode_frame, env.frame)
+
+
+@case('detect')
+def bench_detect(benchmark, env):
+    image = decode_frame(env.frame)
+    boxes = benchmark(detect_faces, image)
+    benchmark.extra['faces'] = len(boxes)
+
+
+@case('quality_gate')
+def bench_quality_gate(benchmark, env):
+    image = decode_frame(env.frame)
+    result = benchmark(check_frame, image)
+    benchmark.extra['reason'] = result['reason']
+
+
+@case('encode')
+def bench_encode(benchmark, env):
+    image = decode_frame(env.frame)
+    benchmark(encode_faces, image, detect_faces(image))
+
+
+@case('gallery_load', per_gallery=True)
+def bench_gallery_load(benchmark, env):
+    benchmark(get_gallery().load)
+
+
+@case('match', per_gallery=True)
+def bench_match(benchmark, env):
+    gallery = get_gallery()
+    results = benchmark(gallery.search, env.probe, 3, env.company.id)
+    benchmark.extra['matched'] = bool(results) and results[0][0] == str(env.target.id)
+
+
+def _bench_login(benchmark, env, raw):
+    response = benchmark(env.login, raw)
+    benchmark.extra['status'] = response.status_code
+    benchmark.extra['matched'] = response.status_code == 200 and response.json().get('employee_id') == str(env.target.id)
+
+
+@case('face_login_json', per_gallery=True)
+def bench_face_login_json(benchmark, env):
+    _bench_login(benchmark, env, raw=False)
+
+
+@case('face_login_raw', per_gallery=True)
+def bench_face_login_raw(benchmark, env):
+    _bench_login(benchmark, env, raw=True)
+
+
+@case('emotion_concurrent')
+def bench_emotion_concurrent(benchmark, env, clients=16):
+    """`clients` concurrent frames through the emotion batcher; skipped without FER"""
+    if not registry.available('fer'):
+        return
+    image = decode_frame(env.frame)
+    box = (detect_faces(image) or [None])[0]
+    batcher = EmotionBatcher(classify_emotions, max_batch=getattr(settings, 'FACE_EMOTION_BATCH_SIZE', 8),
+                             max_wait_ms=getattr(settings, 'FACE_EMOTION_BATCH_WAIT_MS', 5),
+                             workers=getattr(settings, 'FACE_EMOTION_WORKERS', 1))
+
+    def round_trip():
+        for future in [batcher.submit(image, box) for _ in range(clients)]:
+            future.result()
+
+    benchmark(round_trip)
+    benchmark.extra['clients'] = clients
+    benchmark.extra['frames_per_s'] = round(clients / (benchmark.stats['median_ms'] / 1000), 1)
+    benchmark.extra['mean_batch'] = batcher.stats()['mean_batch']
+
+
+# ---------------- Suite ----------------
+
+def _git_commit():
+    try:
+        return subprocess.run(['git', 'rev-parse', '--short', 'HEAD'], cwd=settings.BASE_DIR,
+                              capture_output=True, text=True, timeout=5).stdout.strip() or None
+    except (OSError, subprocess.SubprocessError):
+        return None
+
+
+def run_suite(frame, sizes, cases=None, rounds=20, warmup=3, per_employee=3, report=None):
+    """
+    Run the selected cases (all by default) and return the JSON-serializable report:
+    {'meta': {...}, 'results': [{'case', 'gallery_size', 'rounds', 'median_ms', ...}]}
+    report(result) is called after each case.
+    """
+    selected = [name for name in CASES if cases is None or name in cases]
+    results = []
+
+    def run(name, env, gallery_size=None):
+        benchmark = Benchmark(rounds=rounds, warmup=warmup)
+        CASES[name][0](benchmark, env)
+        if benchmark.stats is None:
+            # The case skipped itself (e.g. FER is not installed)
+            return
+        result = {'case': name, 'gallery_size': gallery_size, **benchmark.stats, **benchmark.extra}
+        results.append(result)
+        if report is not None:
+            report(result)
+
+    with bench_environment():
+        env = BenchEnvironment(frame, per_employee=per_employee)
+        for name in selected:
+            if not CASES[name][1]:
+                run(name, env)
+        gallery_cases = [name for name in selected if CASES[name][1]]
+        if gallery_cases:
+            for size in sizes:
+                env.populate(size)
+                for name in gallery_cases:
+                    run(name, env, size)
+
+    return {
+        'meta': {
+            'commit': _git_commit(),
+            'created': time.strftime('%Y-%m-%dT%H:%M:%S'),
+            'python': sys.version.split()[0],
+            'numpy': np.__version__,
+            'recognizer': 'mock' if using_mock() else 'face_recognition',
+            'frame_bytes': len(frame),
+            'rounds': rounds,
+            'warmup': warmup,
+            'per_employee': per_employee,
+        },
+        'results': results,
+    }
+
+
+def compare(report, baseline, threshold=0.1):
+    """
+    Compare median timings with a previous report; returns one row per case present in both,
+    flagged as a regression when it got slower by more than threshold (a fraction).
+    """
+    previous = {(r['case'], r['gallery_size']): r for r in baseline['results']}
+    rows = []
+    for result in report['results']:
+        before = previous.get((result['case'], result['gallery_size']))
+        if before is None:
+            continue
+        ratio = result['median_ms'] / before['median_ms'] if before['median_ms'] else float('inf')
+        rows.append({
+            'case': result['case'],
+            'gallery_size': result['gallery_size'],
+            'baseline_ms': before['median_ms'],
+            'median_ms': result['median_ms'],
+            'ratio': round(ratio, 3),
+            'regression': ratio > 1 + threshold,
+        })
+    return rows
@@ -0,0 +1,71 @@
+"""
+Duplicate-face check at enrollment.
+
+employee_register, onboard_employee and generate_encodings used to store a
+new face without asking whether it already belongs to someone else in the
+company. Two employees sharing a face make face_login pick whichever scores
+a little closer that day. check_duplicates() runs the enrollment encodings
+(reduced to FACE_MAX_EXEMPLARS exemplars first, as set_employee would)
+through the gallery's top-k search (the centroid shortlist or the ANN index,
+the same path face_login takes) and reports every other employee within
+FACE_DUPLICATE_TOLERANCE of any of them.
+
+FACE_DUPLICATE_CHECK decides what happens to a hit:
+
+    'reject'   the enrollment is refused (409) and nothing is stored
+    'flag'     the enrollment goes through; the matches are logged and returned
+    'off'      no check
+
+Being a handful of top-k searches over an already loaded index, the check
+costs about as much as a face login's matching step (a few milliseconds
+even for large galleries); its time is returned as 'ms'.
+"""
+import time
+
+import numpy as np
+from django.conf import settings
+
+from .exemplars import reduce_exemplars
+from .gallery import get_gallery
+
+REJECT = 'reject'
+FLAG = 'flag'
+OFF = 'off'
+
+
+def check_mode():
+    return getattr(settings, 'FACE_DUPLICATE_CHECK', FLAG)
+
+
+def check_duplicates(encodings, company_id=None, exclude=None, gallery=None):
+    """
+    Look for enrolled employees of company_id (every active employee if None) whose face is within
+    FACE_DUPLICATE_TOLERANCE of any of encodings; exclude is the employee being (re-)enrolled.
+    Returns {'action', 'matches', 'ms'}: action is 'reject' or 'flag' if something matched
+    under that mode, else None; matches are [{'employee_id', 'distance'}] closest first.
+    """
+    mode = check_mode()
+    if mode == OFF or encodings is None or not len(encodings):
+        return {'action': None, 'matches': [], 'ms': 0.0}
+
+    start = time.perf_counter()
+    if gallery is None:
+        gallery = get_gallery()
+    tolerance = getattr(settings, 'FACE_DUPLICATE_TOLERANCE', 0.5)
+    exclude = None if exclude is None else str(exclude)
+    # One extra candidate so that excluding the employee itself still leaves top_k others
+    k = getattr(settings, 'FACE_DUPLICATE_TOP_K', 3) + (exclude is not None)
+
+    closest = {}
+    for probe in reduce_exemplars(encodings):
+        for emp_id, dist in gallery.search(probe, k=k, company_id=company_id):
+            if dist <= tolerance and emp_id != exclude and dist < closest.get(emp_id, np.inf):
+                closest[emp_id] = dist
+
+    matches = [{'employee_id': emp_id, 'distance': round(float(dist), 4)}
+               for emp_id, dist in sorted(closest.items(), key=lambda item: item[1])]
+    ms = round((time.perf_counter() - start) * 1000, 2)
+    if matches:
+        print(f"Duplicate face check ({mode}): {len(matches)} enrolled employee(s) within {tolerance}, "
+              f"closest {matches[0]['employee_id']} at {matches[0]['distance']} ({ms} ms)")
+    return {'action': mode if matches else None, 'matches': matches, 'ms': ms}
@@ -0,0 +1,278 @@
+"""
+Emotion detection (FER with MTCNN) for face_login and capture_emotion.
+
+face_login must not wait for FER before it can authenticate, so the frame is
+handed to the emotion batcher (TensorFlow releases the GIL during inference)
+as soon as its face is detected, and face encoding + matching run meanwhile
+in the request thread. emotion_result() then waits at most FACE_EMOTION_DEADLINE_MS
+from submission; a late result is dropped and the login goes ahead without it.
+A login that ends without using the result (no match, no encoding) hands the
+job to cancel_emotion_detection() so the batcher skips it if it has not run.
+
+Faces are located once per frame, by the HOG detector that also feeds the
+128-d encoder (preprocess.detect_faces): callers pass that box along with the
+frame and FER's own MTCNN detector only runs for frames submitted without
+one. The batcher collects the frames of concurrent requests and the face
+crops of up to FACE_EMOTION_BATCH_SIZE frames go through the emotion CNN in
+one forward pass. A frame that arrives
+alone is classified at once; only when several are already waiting is the
+batch held open for up to FACE_EMOTION_BATCH_WAIT_MS for more, so latency at
+low load is unchanged.
+"""
+import queue
+import threading
+import time
+from concurrent.futures import Future
+from concurrent.futures import TimeoutError as FutureTimeout
+
+import numpy as np
+from django.conf import settings
+
+from .ml_models import registry
+
+# FER(mtcnn=True) loads TensorFlow: it is built on first use (or by the warm-up), not at import
+EMOTION_DETECTION_AVAILABLE = registry.available('fer')
+
+NEUTRAL = ('neutral', 0.0)
+
+# Labels and input of the emotion CNN bundled with FER (64x64 grayscale, scaled to [-1, 1])
+EMOTION_LABELS = ('angry', 'disgust', 'fear', 'happy', 'sad', 'surprise', 'neutral')
+EMOTION_INPUT_SIZE = (64, 64)
+FACE_PADDING = 40
+FACE_OFFSET = 10
+
+_batcher = None
+_batcher_lock = threading.Lock()
+_in_flight = None
+
+
+def _dominant(scores):
+    emotions_dict = {label: round(float(score), 2) for label, score in zip(EMOTION_LABELS, scores)}
+    # Find the emotion with highest confidence
+    detected_emotion = max(emotions_dict, key=emotions_dict.get)
+    return detected_emotion, emotions_dict[detected_emotion]
+
+
+def _fer_box(box):
+    """face_recognition (top, right, bottom, left) box as FER's (x, y, w, h)"""
+    top, right, bottom, left = box
+    return left, top, right - left, bottom - top
+
+
+def _face_crop(model, image, box=None):
+    """
+    Preprocessed crop around box (face_recognition order), cut the way
+    FER.detect_emotions does; without a box MTCNN looks for one. None if there is no face.
+    """
+    import cv2
+
+    if box is None:
+        boxes = model.find_faces(image, bgr=True)
+        if not len(boxes):
+            return None
+        x, y, w, h = boxes[0]
+    else:
+        x, y, w, h = _fer_box(box)
+    side = max(w, h)
+    x, y = x - (side - w) // 2 + FACE_PADDING - FACE_OFFSET, y - (side - h) // 2 + FACE_PADDING - FACE_OFFSET
+    side += 2 * FACE_OFFSET
+    gray = cv2.cvtColor(np.ascontiguousarray(image), cv2.COLOR_BGR2GRAY)
+    gray = cv2.copyMakeBorder(gray, FACE_PADDING, FACE_PADDING, FACE_PADDING, FACE_PADDING, cv2.BORDER_CONSTANT)
+    x, y = max(x, 0), max(y, 0)
+    face = gray[y:y + side, x:x + side]
+    if not face.size:
+        return None
+    face = cv2.resize(face, EMOTION_INPUT_SIZE).astype(np.float32) / 255.0
+    return ((face - 0.5) * 2.0)[:, :, np.newaxis]
+
+
+def classify_emotions(images, boxes=None):
+    """
+    (dominant emotion, confidence) for each image, with one CNN pass for all of
+    them. boxes[i] is the face to classify in images[i]; None lets MTCNN find it.
+
+    The single pass goes through FER's private _classify_emotions (fer is pinned
+    in requirements.txt for that reason). If the installed FER has no such method,
+    or it does not answer one row of EMOTION_LABELS scores per crop, every image
+    goes through the public detect_emotions instead.
+    """
+    model = registry.get('fer')
+    boxes = [None] * len(images) if boxes is None else boxes
+    classify = getattr(model, '_classify_emotions', None)
+    if classify is None:
+        return _detect_each(model, images, boxes)
+    crops = [_face_crop(model, image, box) for image, box in zip(images, boxes)]
+    found = [i for i, crop in enumerate(crops) if crop is not None]
+    results = [NEUTRAL] * len(images)
+    if found:
+        try:
+            scores = np.asarray(classify(np.stack([crops[i] for i in found])))
+        except (TypeError, ValueError, AttributeError) as e:
+            print(f"FER batch classification unavailable ({e}); using detect_emotions")
+            return _detect_each(model, images, boxes)
+        if scores.shape != (len(found), len(EMOTION_LABELS)):
+            print(f"FER batch classification returned {scores.shape} scores; using detect_emotions")
+            return _detect_each(model, images, boxes)
+        for i, face_scores in zip(found, scores):
+            results[i] = _dominant(face_scores)
+    return results
+
+
+def _detect_each(model, images, boxes):
+    """Public FER path: one detect_emotions call per image"""
+    return [_detect_one(model, image, box) for image, box in zip(images, boxes)]
+
+
+def _detect_one(model, image, box=None):
+    if box is None:
+        emotions = model.detect_emotions(image)
+    else:
+        emotions = model.detect_emotions(image, face_rectangles=[_fer_box(box)])
+    if emotions and len(emotions) > 0 and 'emotions' in emotions[0]:
+        emotions_dict = emotions[0]['emotions']
+        detected_emotion = max(emotions_dict, key=emotions_dict.get)
+        return detected_emotion, emotions_dict[detected_emotion]
+    return NEUTRAL
+
+
+class EmotionBatcher:
+    """Worker threads that classify the frames of concurrent requests in batches"""
+
+    def __init__(self, classify=classify_emotions, max_batch=8, max_wait_ms=5, workers=1):
+        self.classify = classify
+        self.max_batch = max(int(max_batch), 1)
+        self.max_wait = max_wait_ms / 1000
+        self.workers = workers
+        self._queue = queue.Queue()
+        self._threads = []
+        self._lock = threading.Lock()
+        self.counters = {'frames': 0, 'batches': 0, 'cancelled': 0, 'largest_batch': 0}
+
+    def _ensure_workers(self):
+        with self._lock:
+            self._threads = [thread for thread in self._threads if thread.is_alive()]
+            while len(self._threads) < self.workers:
+                thread = threading.Thread(target=self._run, name=f'emotion-batch-{len(self._threads)}', daemon=True)
+                thread.start()
+                self._threads.append(thread)
+
+    def submit(self, image, box=None):
+        """Queue a frame and its face box; returns a Future of (emotion, confidence)"""
+        self._ensure_workers()
+        future = Future()
+        self._queue.put((image, box, future))
+        return future
+
+    def _collect(self):
+        batch = [self._queue.get()]
+        # Frames that queued up while the previous batch ran join without waiting
+        while len(batch) < self.max_batch:
+            try:
+                batch.append(self._queue.get_nowait())
+            except queue.Empty:
+                break
+        # Requests are arriving together: hold the batch open briefly; a lone frame goes at once
+        if 1 < len(batch) < self.max_batch:
+            deadline = time.monotonic() + self.max_wait
+            while len(batch) < self.max_batch:
+                remaining = deadline - time.monotonic()
+                if remaining <= 0:
+                    break
+                try:
+                    batch.append(self._queue.get(timeout=remaining))
+                except queue.Empty:
+                    break
+        return batch
+
+    def _run(self):
+        while True:
+            batch = self._collect()
+            # Futures cancelled by emotion_result() after their deadline are skipped
+            live = [item for item in batch if item[2].set_running_or_notify_cancel()]
+            with self._lock:
+                self.counters['cancelled'] += len(batch) - len(live)
+                if live:
+                    self.counters['frames'] += len(live)
+                    self.counters['batches'] += 1
+                    self.counters['largest_batch'] = max(self.counters['largest_batch'], len(live))
+            if not live:
+                continue
+            try:
+                results = self.classify([image for image, _, _ in live], [box for _, box, _ in live])
+            except Exception as e:
+                for _, _, future in live:
+                    future.set_exception(e)
+                continue
+            for (_, _, future), result in zip(live, results):
+                future.set_result(result)
+
+    def stats(self):
+        with self._lock:
+            counters = dict(self.counters)
+        counters['queued'] = self._queue.qsize()
+        counters['mean_batch'] = round(counters['frames'] / counters['batches'], 2) if counters['batches'] else 0.0
+        return counters
+
+
+def get_batcher():
+    global _batcher, _in_flight
+    with _batcher_lock:
+        if _batcher is None:
+            workers = getattr(settings, 'FACE_EMOTION_WORKERS', 1)
+            max_batch = getattr(settings, 'FACE_EMOTION_BATCH_SIZE', 8)
+            _batcher = EmotionBatcher(max_batch=max_batch, max_wait_ms=getattr(settings, 'FACE_EMOTION_BATCH_WAIT_MS', 5),
+                                      workers=workers)
+            # Bound the backlog: with FER slower than logins arrive, queued frames would only expire
+            _in_flight = threading.BoundedSemaphore(2 * workers * _batcher.max_batch)
+        return _batcher
+
+
+def detect_emotion(image, box=None):
+    """Return (dominant emotion, confidence) for the face at box (the first face MTCNN finds without one)"""
+    if not EMOTION_DETECTION_AVAILABLE:
+        return NEUTRAL
+    return get_batcher().submit(image, box).result()
+
+
+def submit_emotion_detection(image, box=None):
+    """
+    Start emotion detection of the face at box in the background.
+    Returns (future, submitted_at), or None if FER is unavailable or the batcher is saturated.
+    """
+    if not registry.available('fer'):
+        return None
+    batcher = get_batcher()
+    if not _in_flight.acquire(blocking=False):
+        print("Emotion detection skipped: batcher busy")
+        return None
+    future = batcher.submit(image, box)
+    future.add_done_callback(lambda _: _in_flight.release())
+    return future, time.perf_counter()
+
+
+def emotion_result(job, deadline_ms=None):
+    """
+    Wait for a submitted job until its deadline.
+    Returns (emotion, confidence), or None if it was not submitted, failed or missed the deadline.
+    """
+    if job is None:
+        return None
+    future, submitted_at = job
+    if deadline_ms is None:
+        deadline_ms = getattr(settings, 'FACE_EMOTION_DEADLINE_MS', 300)
+    remaining = deadline_ms / 1000 - (time.perf_counter() - submitted_at)
+    try:
+        return future.result(timeout=max(remaining, 0))
+    except FutureTimeout:
+        # Not started yet: drop it so it does not delay the next login's frame
+        future.cancel()
+        print(f"Emotion detection missed the {deadline_ms} ms deadline")
+    except Exception as e:
+        print(f"Emotion detection error: {e}")
+    return None
+
+
+def cancel_emotion_detection(job):
+    """Drop a submitted job whose result is no longer wanted; a job already classified is left alone"""
+    if job is not None:
+        job[0].cancel()
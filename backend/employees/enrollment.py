@@ -0,0 +1,116 @@
+"""
+Enrollment pipeline shared by generate_encodings, employee_register and
+update_encodings_for_employee.
+
+Images are decoded in memory and face detection + encoding (see
+preprocess.py; HOG and the dlib ResNet, hundreds of milliseconds per image)
+run in a bounded process pool, one image per task, so enrolling 3-10 photos costs roughly the latency of
+the slowest one instead of their sum. Every image gets a result dict:
+
+    {'index': 0, 'face_found': True, 'face_count': 1, 'encoding': ndarray or None,
+     'error': None, 'timings': {'decode_ms': .., 'detect_ms': .., 'encode_ms': ..}}
+
+FACE_ENROLL_WORKERS sets the pool size (None: one per CPU, at most 4;
+0 runs everything in the calling thread).
+"""
+import multiprocessing
+import os
+import threading
+import time
+from concurrent.futures import ProcessPoolExecutor
+from concurrent.futures.process import BrokenProcessPool
+
+from django.conf import settings
+
+from .ml_models import registry
+from .preprocess import as_bytes, process_frame
+
+_pool = None
+_pool_lock = threading.Lock()
+
+
+def _elapsed_ms(start):
+    return round((time.perf_counter() - start) * 1000, 2)
+
+
+def encode_image(index, data):
+    """Decode one image, detect faces and encode the first one (runs in a pool worker)"""
+    result = {'index': index, 'face_found': False, 'face_count': 0, 'encoding': None, 'error': None, 'timings': {}}
+    try:
+        frame = process_frame(data)
+        result['timings'] = frame['timings']
+        result['face_count'] = len(frame['locations'])
+        if frame['encodings']:
+            # Use the first face found
+            result['encoding'] = frame['encodings'][0]
+            result['face_found'] = True
+    except Exception as e:
+        result['error'] = str(e)
+    return result
+
+
+def _warm_worker():
+    """Load the face models when a pool process starts rather than in its first task"""
+    registry.warm_up(['face_recognition'])
+
+
+def _workers():
+    workers = getattr(settings, 'FACE_ENROLL_WORKERS', None)
+    if workers is None:
+        workers = min(4, os.cpu_count() or 1)
+    return workers
+
+
+def _get_pool():
+    """Create the process pool on first use (per gunicorn worker, after the fork)"""
+    global _pool
+    with _pool_lock:
+        if _pool is None:
+            # spawn: forking a threaded server process that holds dlib state is not safe
+            _pool = ProcessPoolExecutor(max_workers=_workers(), mp_context=multiprocessing.get_context('spawn'),
+                                        initializer=_warm_worker)
+        return _pool
+
+
+def _reset_pool():
+    global _pool
+    with _pool_lock:
+        if _pool is not None:
+            _pool.shutdown(wait=False, cancel_futures=True)
+        _pool = None
+
+
+def _read(image):
+    if isinstance(image, (bytes, bytearray, memoryview)):
+        return as_bytes(image)
+    data = image.read()
+    if hasattr(image, 'seek'):
+        image.seek(0)
+    return data
+
+
+def encode_images(images):
+    """
+    Detect and encode one face per image (raw bytes or file-like objects).
+    Returns the per-image results in input order.
+    """
+    payloads = [_read(image) for image in images]
+    start = time.perf_counter()
+    if len(payloads) < 2 or _workers() < 2:
+        results = [encode_image(i, data) for i, data in enumerate(payloads)]
+    else:
+        try:
+            futures = [_get_pool().submit(encode_image, i, data) for i, data in enumerate(payloads)]
+            results = [future.result() for future in futures]
+        except (BrokenProcessPool, OSError) as e:
+            # A crashed worker breaks the whole pool: start a fresh one next time
+            print(f"Enrollment pool failed ({e}), encoding serially")
+            _reset_pool()
+            results = [encode_image(i, data) for i, data in enumerate(payloads)]
+    print(f"Enrollment: encoded {len(payloads)} image(s) in {_elapsed_ms(start)} ms")
+    return results
+
+
+def result_summary(result):
+    """JSON-safe view of a result (no encoding) for API responses"""
+    return {key: value for key, value in result.items() if key != 'encoding'}
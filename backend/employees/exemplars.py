@@ -0,0 +1,61 @@
+"""
+Bounded per-employee exemplars.
+
+An enrolled employee is represented by at most FACE_MAX_EXEMPLARS encodings.
+When an enrollment brings more images than that, they are reduced with
+k-medoids: the kept exemplars are actual encodings, spread over the poses and
+lighting the images cover, rather than an average that matches none of them.
+The gallery derives each employee's centroid from the kept exemplars and uses
+it to shortlist candidates before scoring exemplars (see GalleryIndex.search).
+"""
+import numpy as np
+from django.conf import settings
+
+from .face_store import ENCODING_DIM
+
+
+def pairwise_distances(points):
+    points = np.asarray(points, dtype=np.float64)
+    sq_norms = np.einsum('ij,ij->i', points, points)
+    sq_dists = sq_norms[:, None] - 2.0 * (points @ points.T) + sq_norms[None, :]
+    return np.sqrt(np.maximum(sq_dists, 0.0))
+
+
+def k_medoids(points, k, max_iter=20):
+    """
+    Indices (sorted) of k medoids of the points, by alternating assignment and
+    medoid update from a farthest-first start. Returns every index if len(points) <= k.
+    """
+    n = len(points)
+    if n <= k:
+        return np.arange(n)
+    dists = pairwise_distances(points)
+    # Start from the most central point and add the point farthest from those chosen so far
+    medoids = [int(np.argmin(dists.sum(axis=1)))]
+    while len(medoids) < k:
+        medoids.append(int(np.argmax(dists[:, medoids].min(axis=1))))
+
+    for _ in range(max_iter):
+        labels = np.argmin(dists[:, medoids], axis=1)
+        updated = []
+        for cluster, medoid in enumerate(medoids):
+            members = np.flatnonzero(labels == cluster)
+            if not len(members):
+                # Duplicate of another medoid: keep it rather than leave the cluster empty
+                updated.append(medoid)
+                continue
+            updated.append(int(members[np.argmin(dists[np.ix_(members, members)].sum(axis=1))]))
+        if updated == medoids:
+            break
+        medoids = updated
+    return np.array(sorted(set(medoids)), dtype=np.int64)
+
+
+def reduce_exemplars(encodings, max_exemplars=None):
+    """Keep at most max_exemplars (FACE_MAX_EXEMPLARS) diverse encodings of one employee"""
+    if max_exemplars is None:
+        max_exemplars = getattr(settings, 'FACE_MAX_EXEMPLARS', 5)
+    encodings = np.asarray(encodings, dtype=np.float64).reshape(-1, ENCODING_DIM)
+    if not max_exemplars or len(encodings) <= max_exemplars:
+        return list(encodings)
+    return list(encodings[k_medoids(encodings, max_exemplars)])
@@ -0,0 +1,200 @@
+"""
+Re-encoding of every active employee's stored face images into a new face
+store generation (the rebuild_face_index command).
+
+Face images live in two layouts under MEDIA_ROOT/faces/:
+
+    faces/<employee id>/<name>.(jpg|jpeg|png)           generate_encodings, upload_to
+    faces/employee_<employee id>_face_<n>.jpg           employee_register
+
+Employees are handed to a spawn process pool in batches (encode_batch runs
+in the workers: decode, detect, encode and reduce to FACE_MAX_EXEMPLARS,
+exactly as enrollment does). Each finished batch is written as one
+checkpoint file under face_gallery/rebuild/, so an interrupted run picks up
+where it stopped; the checkpoint records the pipeline settings it was made
+with (fingerprint()) and is only resumed under the same ones. Once every
+employee is done the results are swapped in as one new generation by
+face_store.replace_all, under the store's write lock.
+
+The checkpoint also keeps the per-employee checksums of the store as it was
+when the run started (face_store.employee_checksums). An employee who
+re-enrolls, or is enrolled or removed, while the run is going keeps that
+newer entry instead of the rebuilt one. A checkpoint without them is not
+resumed (the command asks for --restart).
+"""
+import io
+import json
+import os
+import re
+import shutil
+
+import numpy as np
+from django.conf import settings
+
+from . import face_store
+from .enrollment import encode_image
+from .exemplars import reduce_exemplars
+
+IMAGE_EXTENSIONS = ('.jpg', '.jpeg', '.png')
+FLAT_FACE_RE = re.compile(r'employee_([0-9a-fA-F-]{36})_face_\d+\.(jpe?g|png)$')
+
+
+def checkpoint_dir():
+    return os.path.join(face_store.store_dir(), 'rebuild')
+
+
+def face_image_paths(emp_ids):
+    """{employee_id: [image paths]} for both layouts; faces/ itself is listed once"""
+    faces_dir = os.path.join(settings.MEDIA_ROOT, 'faces')
+    wanted = {str(emp_id) for emp_id in emp_ids}
+    paths = {emp_id: [] for emp_id in wanted}
+    try:
+        entries = list(os.scandir(faces_dir))
+    except FileNotFoundError:
+        return paths
+    for entry in entries:
+        if entry.is_dir():
+            if entry.name in wanted:
+                paths[entry.name].extend(
+                    os.path.join(entry.path, name) for name in sorted(os.listdir(entry.path))
+                    if name.lower().endswith(IMAGE_EXTENSIONS)
+                )
+        else:
+            match = FLAT_FACE_RE.match(entry.name)
+            if match and match.group(1) in wanted:
+                paths[match.group(1)].append(entry.path)
+    return paths
+
+
+def fingerprint():
+    """Settings that change what an image encodes to; a checkpoint is only resumed under the same ones"""
+    from .ml_models import registry
+
+    registry.get('face_recognition')
+    return {
+        'recognizer': registry.status(['face_recognition'])['face_recognition']['implementation'],
+        'decode_max_side': getattr(settings, 'FACE_DECODE_MAX_SIDE', 1280),
+        'detect_max_side': getattr(settings, 'FACE_DETECT_MAX_SIDE', 640),
+        'crop_margin': getattr(settings, 'FACE_CROP_MARGIN', 0.25),
+        'max_exemplars': getattr(settings, 'FACE_MAX_EXEMPLARS', 5),
+    }
+
+
+def encode_batch(batch):
+    """
+    Encode the images of a batch of (employee_id, company_id, paths) (runs in a pool worker).
+    Returns one (employee_id, company_id, encodings array, images, faces, errors) per employee.
+    """
+    results = []
+    for emp_id, company_id, paths in batch:
+        encodings = []
+        errors = 0
+        for i, path in enumerate(paths):
+            try:
+                with open(path, 'rb') as f:
+                    result = encode_image(i, f.read())
+            except OSError:
+                errors += 1
+                continue
+            if result['face_found']:
+                encodings.append(result['encoding'])
+            elif result['error']:
+                errors += 1
+        reduced = reduce_exemplars(encodings) if encodings else np.empty((0, face_store.ENCODING_DIM))
+        results.append((emp_id, company_id, np.asarray(reduced, dtype=np.float32), len(paths), len(encodings), errors))
+    return results
+
+
+class Checkpoint:
+    """Finished batches of one rebuild run, one file each, plus the manifest the run was started with"""
+
+    def __init__(self, path=None):
+        self.path = path or checkpoint_dir()
+        self._manifest_path = os.path.join(self.path, 'manifest.json')
+        self._baseline_path = os.path.join(self.path, 'baseline.json')
+
+    def manifest(self):
+        try:
+            with open(self._manifest_path) as f:
+                return json.load(f)
+        except FileNotFoundError:
+            return None
+
+    def start(self, manifest, baseline):
+        """Begin a run; baseline is face_store.employee_checksums() as of now"""
+        self.clear()
+        os.makedirs(self.path, exist_ok=True)
+        self._write(self._baseline_path, json.dumps(baseline).encode())
+        self._write(self._manifest_path, json.dumps(manifest, indent=2).encode())
+
+    def baseline(self):
+        """Store checksums the run started from; every checkpoint has them"""
+        try:
+            with open(self._baseline_path) as f:
+                return json.load(f)
+        except FileNotFoundError:
+            raise face_store.FaceStoreError(f"{self.path}: checkpoint has no baseline")
+
+    def clear(self):
+        shutil.rmtree(self.path, ignore_errors=True)
+
+    def _write(self, path, data):
+        tmp_path = f"{path}.tmp.{os.getpid()}"
+        with open(tmp_path, 'wb') as f:
+            f.write(data)
+            f.flush()
+            os.fsync(f.fileno())
+        os.replace(tmp_path, path)
+
+    def save_batch(self, number, results):
+        """Write one finished batch atomically"""
+        counts = np.array([len(encs) for _, _, encs, _, _, _ in results], dtype=np.int64)
+        buffer = io.BytesIO()
+        np.savez(
+            buffer,
+            employee_ids=np.array([emp_id for emp_id, *_ in results], dtype='S64'),
+            company_ids=np.array([company_id or face_store.UNKNOWN_COMPANY for _, company_id, *_ in results],
+                                 dtype=np.int64),
+            counts=counts,
+            matrix=(np.concatenate([encs for _, _, encs, *_ in results]) if counts.sum()
+                    else np.empty((0, face_store.ENCODING_DIM), dtype=np.float32)),
+            stats=np.array([result[3:] for result in results], dtype=np.int64).reshape(-1, 3),
+        )
+        self._write(os.path.join(self.path, f"batch-{number:06d}.npz"), buffer.getvalue())
+
+    def batches(self):
+        if not os.path.isdir(self.path):
+            return []
+        return sorted(name for name in os.listdir(self.path) if name.startswith('batch-') and name.endswith('.npz'))
+
+    def next_number(self):
+        """Batches finish out of order, so numbering resumes after the highest one written"""
+        numbers = [int(name[len('batch-'):-len('.npz')]) for name in self.batches()]
+        return max(numbers) + 1 if numbers else 0
+
+    def load(self):
+        """({employee_id: encodings}, {employee_id: company_id}, {employee_id: (images, faces, errors)}) of every batch"""
+        encodings, companies, stats = {}, {}, {}
+        for name in self.batches():
+            with np.load(os.path.join(self.path, name)) as batch:
+                # Every item access of an NpzFile reads the array again
+                ids, company_ids, counts, matrix, batch_stats = (
+                    batch[key] for key in ('employee_ids', 'company_ids', 'counts', 'matrix', 'stats'))
+            offsets = np.concatenate([[0], np.cumsum(counts)])
+            for i, emp_id in enumerate(ids.astype(str)):
+                stats[emp_id] = tuple(int(v) for v in batch_stats[i])
+                if counts[i]:
+                    encodings[emp_id] = matrix[offsets[i]:offsets[i + 1]]
+                    company_id = int(company_ids[i])
+                    companies[emp_id] = None if company_id == face_store.UNKNOWN_COMPANY else company_id
+        return encodings, companies, stats
+
+
+def swap_in(encodings, companies, baseline, drop_missing=False):
+    """
+    Publish the rebuilt encodings as one new generation. Employees without a
+    usable image keep their stored encodings unless drop_missing; employees
+    whose stored entry changed since baseline keep it.
+    """
+    face_store.replace_all(encodings, companies, keep_others=not drop_missing, baseline=baseline)
+    return face_store.current_generation()
@@ -0,0 +1,693 @@
+"""
+Binary on-disk store for enrolled face encodings.
+
+Every enrollment path writes here instead of its own pickle layout. The store
+lives in MEDIA_ROOT/face_gallery/ and is made of generations. Generation g is:
+
+    gallery-<g>.fgs   base segment, written once and then only read
+    journal-<g>.log   append-only log of changes made since the segment was built
+    CURRENT           names the live generation; swapped with os.replace()
+
+A segment is designed to be opened with np.memmap by every worker without
+copying:
+
+    header   64 bytes   magic, format version, dimension, row/employee counts
+                        and the byte offsets of the two sections below
+    matrix   float32    n_rows x dim, the exemplars of all employees
+    index    records    (employee_id, company_id, start, count) for each
+                        employee, where matrix[start:start + count] are that
+                        employee's rows
+
+Employees are written sorted by company, so each company's exemplars form one
+contiguous block of the matrix that can be searched without copying.
+
+Enrollment appends one small, fsync'd, CRC-checked record to the journal
+under an exclusive file lock, so concurrent writers in different gunicorn
+workers never overwrite each other. A torn record at the end of the journal
+(a crash mid-append) is ignored by readers and cut off by the next writer.
+Once the journal grows past FACE_STORE_COMPACT_RECORDS, a background thread
+merges segment and journal into generation g + 1 and flips CURRENT, so readers
+always see either the old generation or the new one.
+
+Every change also bumps a counter in face_gallery/VERSION, a small file that
+each process memory-maps once. A worker compares the counters with the ones
+its gallery was built from on every request (a plain memory read) and
+reloads only the company partitions whose counter moved.
+"""
+import contextlib
+import mmap
+import os
+import pickle
+import re
+import struct
+import threading
+import zlib
+
+import numpy as np
+from django.conf import settings
+
+try:
+    import fcntl
+except ImportError:  # Windows: only the in-process lock is available
+    fcntl = None
+
+MAGIC = b'FGSTORE\0'
+FORMAT_VERSION = 2
+ENCODING_DIM = 128
+
+# magic, version, dim, n_rows, n_employees, matrix_offset, index_offset
+HEADER = struct.Struct('<8sIIQQQQ')
+HEADER_SIZE = 64
+INDEX_DTYPE = np.dtype([('employee_id', 'S64'), ('company_id', '<i8'), ('start', '<i8'), ('count', '<i8')])
+# company_id recorded for employees whose company is not known
+UNKNOWN_COMPANY = 0
+
+# Journal record: magic, op, rows, company_id, employee_id, crc32 of the record with crc=0
+RECORD = struct.Struct('<4sBxxxIq64sI')
+RECORD_MAGIC = b'FGJR'
+OP_PUT = 1
+OP_DELETE = 2
+
+# VERSION file: magic, global counter, then one counter per company slot
+VERSION_MAGIC = b'FGVERS\0\0'
+VERSION_SLOTS = 1024
+
+# One in-process lock per lock file name, so that holding 'compact' does not block 'write'
+_thread_locks = {}
+_thread_locks_guard = threading.Lock()
+_compaction_thread = None
+_version_maps = {}
+
+
+class FaceStoreError(Exception):
+    pass
+
+
+def _align(offset, alignment=64):
+    return (offset + alignment - 1) // alignment * alignment
+
+
+def store_dir():
+    return os.path.join(settings.MEDIA_ROOT, 'face_gallery')
+
+
+def segment_path(generation):
+    return os.path.join(store_dir(), f"gallery-{generation:06d}.fgs")
+
+
+def journal_path(generation):
+    return os.path.join(store_dir(), f"journal-{generation:06d}.log")
+
+
+def current_generation():
+    try:
+        with open(os.path.join(store_dir(), 'CURRENT')) as f:
+            return int(f.read().strip() or 0)
+    except FileNotFoundError:
+        return 0
+
+
+def store_path():
+    """Base segment of the live generation"""
+    return segment_path(current_generation())
+
+
+@contextlib.contextmanager
+def _locked(name='write'):
+    """Exclusive lock shared by every thread and process using this MEDIA_ROOT"""
+    os.makedirs(store_dir(), exist_ok=True)
+    with _thread_locks_guard:
+        thread_lock = _thread_locks.setdefault(name, threading.RLock())
+    with thread_lock:
+        with open(os.path.join(store_dir(), f".{name}.lock"), 'a') as lock_file:
+            if fcntl is not None:
+                fcntl.flock(lock_file, fcntl.LOCK_EX)
+            try:
+                yield
+            finally:
+                if fcntl is not None:
+                    fcntl.flock(lock_file, fcntl.LOCK_UN)
+
+
+def _fsync_dir(path):
+    if hasattr(os, 'O_DIRECTORY'):
+        fd = os.open(path, os.O_RDONLY | os.O_DIRECTORY)
+        try:
+            os.fsync(fd)
+        finally:
+            os.close(fd)
+
+
+# ---------------- Segments ----------------
+
+class Segment:
+    """Read-only, memory-mapped view of a segment file"""
+
+    def __init__(self, path):
+        self.path = path
+        with open(path, 'rb') as f:
+            raw = f.read(HEADER_SIZE)
+        if len(raw) < HEADER_SIZE:
+            raise FaceStoreError(f"{path}: truncated header")
+        magic, version, dim, n_rows, n_employees, matrix_offset, index_offset = HEADER.unpack_from(raw)
+        if magic != MAGIC:
+            raise FaceStoreError(f"{path}: not a face store file")
+        if version != FORMAT_VERSION:
+            raise FaceStoreError(f"{path}: unsupported format version {version}")
+
+        self.version = version
+        self.dim = dim
+        if n_rows:
+            self.matrix = np.memmap(path, dtype='<f4', mode='r', offset=matrix_offset, shape=(n_rows, dim))
+        else:
+            self.matrix = np.empty((0, dim), dtype=np.float32)
+        if n_employees:
+            self.index = np.memmap(path, dtype=INDEX_DTYPE, mode='r', offset=index_offset, shape=(n_employees,))
+        else:
+            self.index = np.empty(0, dtype=INDEX_DTYPE)
+
+    @classmethod
+    def empty(cls):
+        segment = cls.__new__(cls)
+        segment.path = None
+        segment.version = FORMAT_VERSION
+        segment.dim = ENCODING_DIM
+        segment.matrix = np.empty((0, ENCODING_DIM), dtype=np.float32)
+        segment.index = np.empty(0, dtype=INDEX_DTYPE)
+        return segment
+
+    def __len__(self):
+        return len(self.index)
+
+    @property
+    def employee_ids(self):
+        return [raw.decode('ascii') for raw in self.index['employee_id']]
+
+    @property
+    def company_ids(self):
+        return np.asarray(self.index['company_id'], dtype=np.int64)
+
+    @property
+    def offsets(self):
+        """Row offsets such that offsets[i]:offsets[i + 1] belong to employee i"""
+        return np.append(self.index['start'], len(self.matrix)).astype(np.int64)
+
+    def to_mapping(self):
+        """Copy the segment into an employee id -> (count, dim) array mapping"""
+        return {
+            emp_id: np.array(self.matrix[start:start + count])
+            for emp_id, start, count in zip(self.employee_ids, self.index['start'], self.index['count'])
+        }
+
+    def companies(self):
+        """Return the employee id -> company id mapping recorded in the segment"""
+        return dict(zip(self.employee_ids, self.company_ids.tolist()))
+
+
+def write_segment(path, encodings, companies=None):
+    """
+    Atomically write an employee id -> encodings mapping to path.
+    companies maps employee id -> company id; employees are laid out grouped by company.
+    """
+    companies = {str(k): v for k, v in (companies or {}).items()}
+    employee_ids = []
+    blocks = []
+    ordered = sorted(encodings.items(), key=lambda item: (companies.get(str(item[0])) or UNKNOWN_COMPANY, str(item[0])))
+    for emp_id, encs in ordered:
+        arr = np.asarray(encs, dtype='<f4')
+        if arr.ndim == 1:
+            arr = arr.reshape(1, -1)
+        if not len(arr):
+            continue
+        if arr.shape[1] != ENCODING_DIM:
+            raise FaceStoreError(f"employee {emp_id}: expected {ENCODING_DIM}-d encodings, got {arr.shape[1]}")
+        employee_ids.append(str(emp_id))
+        blocks.append(arr)
+
+    matrix = np.concatenate(blocks) if blocks else np.empty((0, ENCODING_DIM), dtype='<f4')
+    index = np.empty(len(employee_ids), dtype=INDEX_DTYPE)
+    start = 0
+    for i, (emp_id, block) in enumerate(zip(employee_ids, blocks)):
+        index[i] = (emp_id.encode('ascii'), companies.get(emp_id) or UNKNOWN_COMPANY, start, len(block))
+        start += len(block)
+
+    matrix_offset = HEADER_SIZE
+    index_offset = _align(matrix_offset + matrix.nbytes)
+    header = HEADER.pack(MAGIC, FORMAT_VERSION, ENCODING_DIM, len(matrix), len(index), matrix_offset, index_offset)
+
+    os.makedirs(os.path.dirname(path), exist_ok=True)
+    tmp_path = f"{path}.tmp.{os.getpid()}.{threading.get_ident()}"
+    with open(tmp_path, 'wb') as f:
+        f.write(header.ljust(HEADER_SIZE, b'\0'))
+        f.write(matrix.tobytes())
+        f.write(b'\0' * (index_offset - matrix_offset - matrix.nbytes))
+        f.write(index.tobytes())
+        f.flush()
+        os.fsync(f.fileno())
+    os.replace(tmp_path, path)
+
+
+# ---------------- Journal ----------------
+
+def _pack_record(op, emp_id, company_id, encodings):
+    payload = b''
+    rows = 0
+    if encodings is not None:
+        arr = np.asarray(encodings, dtype='<f4')
+        if arr.ndim == 1:
+            arr = arr.reshape(1, -1)
+        if arr.shape[1] != ENCODING_DIM:
+            raise FaceStoreError(f"employee {emp_id}: expected {ENCODING_DIM}-d encodings, got {arr.shape[1]}")
+        payload = arr.tobytes()
+        rows = len(arr)
+    fields = (RECORD_MAGIC, op, rows, company_id or UNKNOWN_COMPANY, str(emp_id).encode('ascii'))
+    crc = zlib.crc32(payload, zlib.crc32(RECORD.pack(*fields, 0)))
+    return RECORD.pack(*fields, crc) + payload
+
+
+def read_journal(path, start=0):
+    """
+    Parse the journal from byte offset start.
+    Returns ([(op, employee_id, company_id, encodings), ...], offset just past the last valid record).
+    Reading stops at the first torn or corrupt record.
+    """
+    records = []
+    try:
+        with open(path, 'rb') as f:
+            f.seek(start)
+            data = f.read()
+    except FileNotFoundError:
+        return records, start
+
+    pos = 0
+    while pos + RECORD.size <= len(data):
+        magic, op, rows, company_id, raw_id, crc = RECORD.unpack_from(data, pos)
+        end = pos + RECORD.size + rows * ENCODING_DIM * 4
+        if magic != RECORD_MAGIC or op not in (OP_PUT, OP_DELETE) or end > len(data):
+            break
+        payload = data[pos + RECORD.size:end]
+        fields = (magic, op, rows, company_id, raw_id)
+        if zlib.crc32(payload, zlib.crc32(RECORD.pack(*fields, 0))) != crc:
+            break
+        encodings = np.frombuffer(payload, dtype='<f4').reshape(rows, ENCODING_DIM) if op == OP_PUT else None
+        records.append((op, raw_id.rstrip(b'\0').decode('ascii'), company_id, encodings))
+        pos = end
+    return records, start + pos
+
+
+def _append(generation, record):
+    """Append one record to the live journal; caller holds the write lock"""
+    path = journal_path(generation)
+    _, valid_end = read_journal(path)
+    with open(path, 'ab') as f:
+        if f.tell() > valid_end:
+            f.truncate(valid_end)  # drop a torn tail left by a crashed writer
+        f.write(record)
+        f.flush()
+        os.fsync(f.fileno())
+    return valid_end + len(record)
+
+
+# ---------------- Reading the live store ----------------
+
+class FaceStore:
+    """
+    One generation of the store: the memory-mapped base segment plus the
+    journal replayed on top of it (overrides: employee_id -> (company_id, encodings or None))
+    """
+
+    def __init__(self, generation, segment, records):
+        self.generation = generation
+        self.segment = segment
+        self.journal_records = len(records)
+        self.overrides = {}
+        for op, emp_id, company_id, encodings in records:
+            self.overrides[emp_id] = (company_id, encodings if op == OP_PUT else None)
+
+    @property
+    def employee_ids(self):
+        ids = [emp_id for emp_id in self.segment.employee_ids if emp_id not in self.overrides]
+        return ids + [emp_id for emp_id, (_, encs) in self.overrides.items() if encs is not None]
+
+    def __len__(self):
+        return len(self.employee_ids)
+
+    def to_mapping(self):
+        mapping = self.segment.to_mapping()
+        for emp_id, (_, encodings) in self.overrides.items():
+            if encodings is None:
+                mapping.pop(emp_id, None)
+            else:
+                mapping[emp_id] = np.array(encodings)
+        return mapping
+
+    def companies(self):
+        companies = self.segment.companies()
+        for emp_id, (company_id, encodings) in self.overrides.items():
+            if encodings is None:
+                companies.pop(emp_id, None)
+            else:
+                companies[emp_id] = company_id
+        return companies
+
+
+def open_store():
+    """Open the live generation, or return None if nothing has been stored yet"""
+    for _ in range(3):
+        generation = current_generation()
+        try:
+            path = segment_path(generation)
+            segment = Segment(path) if os.path.exists(path) else None
+            records, _ = read_journal(journal_path(generation))
+        except FileNotFoundError:
+            continue  # a compaction swapped generations under us; retry
+        if segment is None and not records:
+            return None
+        return FaceStore(generation, segment or Segment.empty(), records)
+    raise FaceStoreError("face store kept changing while being opened")
+
+
+# ---------------- Writing ----------------
+
+def _set_current(generation):
+    path = os.path.join(store_dir(), 'CURRENT')
+    tmp_path = f"{path}.tmp.{os.getpid()}.{threading.get_ident()}"
+    with open(tmp_path, 'w') as f:
+        f.write(str(generation))
+        f.flush()
+        os.fsync(f.fileno())
+    os.replace(tmp_path, path)
+    _fsync_dir(store_dir())
+
+
+def _remove_generation(generation):
+    for path in (segment_path(generation), journal_path(generation)):
+        with contextlib.suppress(FileNotFoundError):
+            os.remove(path)
+
+
+def save_employee_encodings(emp_id, encodings, company_id=None):
+    """Replace the stored encodings of one employee (one journal append)"""
+    with _locked():
+        generation = current_generation()
+        store = open_store()
+        previous_company = store.companies().get(str(emp_id)) if store is not None else None
+        if company_id is None:
+            company_id = previous_company
+        _append(generation, _pack_record(OP_PUT, emp_id, company_id, encodings))
+        bump_version([company_id] if previous_company is None else [company_id, previous_company])
+    _maybe_compact()
+
+
+def remove_employee_encodings(emp_id):
+    with _locked():
+        store = open_store()
+        if store is None or str(emp_id) not in store.companies():
+            return
+        _append(store.generation, _pack_record(OP_DELETE, emp_id, None, None))
+        bump_version([store.companies()[str(emp_id)]])
+    _maybe_compact()
+
+
+def employee_checksums(store=None):
+    """{employee_id: crc32 of the stored float32 encodings} of the live store (or of store)"""
+    if store is None:
+        store = open_store()
+    if store is None:
+        return {}
+    return {emp_id: zlib.crc32(np.ascontiguousarray(encs, dtype='<f4').tobytes())
+            for emp_id, encs in store.to_mapping().items()}
+
+
+def replace_all(encodings, companies=None, keep_others=False, baseline=None):
+    """
+    Replace the whole store with the given mapping as a new generation.
+    With keep_others, employees missing from the mapping keep their stored
+    encodings (read under the same lock, so concurrent enrollments are not lost).
+    baseline is employee_checksums() as of when the mapping was computed: any
+    employee whose stored entry has changed since (re-enrolled, added or
+    removed) keeps the store's entry instead of the mapping's.
+    Takes the compaction lock as well: a compaction running meanwhile would
+    otherwise write its generation over this one.
+    """
+    with _locked('compact'), _locked():
+        generation = current_generation()
+        encodings = dict(encodings)
+        companies = dict(companies or {})
+        store = open_store() if keep_others or baseline is not None else None
+        if store is not None:
+            stored = store.to_mapping()
+            stored_companies = store.companies()
+            keep = set(stored) - set(encodings) if keep_others else set()
+            if baseline is not None:
+                checksums = employee_checksums(store)
+                changed = {emp_id for emp_id in set(checksums) | set(baseline)
+                           if checksums.get(emp_id) != baseline.get(emp_id)}
+                if changed:
+                    print(f"Face store: {len(changed)} employee(s) changed since the replacement was computed; "
+                          f"keeping their stored encodings")
+                for emp_id in changed - set(stored):
+                    encodings.pop(emp_id, None)
+                    companies.pop(emp_id, None)
+                keep |= changed & set(stored)
+            for emp_id in keep:
+                encodings[emp_id] = stored[emp_id]
+                companies[emp_id] = stored_companies.get(emp_id)
+        new_generation = generation + 1
+        write_segment(segment_path(new_generation), encodings, companies)
+        open(journal_path(new_generation), 'wb').close()
+        _set_current(new_generation)
+        _remove_generation(generation)
+        bump_version()
+
+
+# ---------------- Version stamp ----------------
+
+def version_slot(company_id):
+    """Counter slot of a company in the VERSION file (unknown company -> slot 0)"""
+    return int(company_id or UNKNOWN_COMPANY) % VERSION_SLOTS
+
+
+def _version_counters():
+    """
+    Writable uint64 view of the VERSION file: [0] global counter, [1:] per-slot counters.
+    The file is mapped once per process; MAP_SHARED makes other processes' bumps visible.
+    """
+    path = os.path.join(store_dir(), 'VERSION')
+    counters = _version_maps.get(path)
+    if counters is not None:
+        return counters
+
+    size = len(VERSION_MAGIC) + 8 * (1 + VERSION_SLOTS)
+    with _locked('version'):
+        fd = os.open(path, os.O_RDWR | os.O_CREAT, 0o644)
+        try:
+            if os.fstat(fd).st_size < size:
+                os.ftruncate(fd, size)
+                os.lseek(fd, 0, os.SEEK_SET)
+                os.write(fd, VERSION_MAGIC)
+            mapped = mmap.mmap(fd, size)
+        finally:
+            os.close(fd)
+    if mapped[:len(VERSION_MAGIC)] != VERSION_MAGIC:
+        raise FaceStoreError(f"{path}: not a face gallery version file")
+    counters = np.frombuffer(mapped, dtype='<u8', offset=len(VERSION_MAGIC))
+    _version_maps[path] = counters
+    return counters
+
+
+def read_version():
+    """Global change counter; a single memory read once the file is mapped"""
+    return int(_version_counters()[0])
+
+
+def read_slot_versions():
+    return _version_counters()[1:].copy()
+
+
+def bump_version(company_ids=None):
+    """Record a change to the given companies (None: everything changed)"""
+    counters = _version_counters()
+    with _locked('version'):
+        if company_ids is None:
+            counters[1:] += 1
+        else:
+            for slot in {version_slot(company_id) for company_id in company_ids}:
+                counters[1 + slot] += 1
+        counters[0] += 1
+
+
+# ---------------- Compaction ----------------
+
+def compact():
+    """
+    Merge the live segment and journal into a new generation.
+    Only the final swap holds the write lock, so enrollment is not blocked
+    while the new segment is being written. Returns the new generation, or
+    None if there was nothing to compact.
+    """
+    with _locked('compact'):
+        with _locked():
+            generation = current_generation()
+            store = open_store()
+            if store is None or not store.journal_records:
+                return None
+            _, merged_upto = read_journal(journal_path(generation))
+
+        new_generation = generation + 1
+        write_segment(segment_path(new_generation), store.to_mapping(), store.companies())
+
+        with _locked():
+            if current_generation() != generation:
+                # Only replace_all switches generations besides us, and it takes the compaction lock
+                # too; should it ever change under us, the merged segment is stale and must not go live
+                print(f"Face store generation moved from {generation} while compacting; compaction abandoned")
+                return None
+            # Carry over records appended while the new segment was being written
+            tail, _ = read_journal(journal_path(generation), start=merged_upto)
+            with open(journal_path(new_generation), 'wb') as f:
+                for op, emp_id, company_id, encodings in tail:
+                    f.write(_pack_record(op, emp_id, company_id, encodings))
+                f.flush()
+                os.fsync(f.fileno())
+            _set_current(new_generation)
+            # Keep the generation just replaced for readers that opened it a moment ago
+            _remove_generation(generation - 1)
+        return new_generation
+
+
+def _compact_in_background():
+    try:
+        compact()
+    except Exception as e:
+        print(f"Face store compaction failed: {e}")
+
+
+def _maybe_compact():
+    """Start a background compaction once the journal holds enough records"""
+    global _compaction_thread
+    threshold = getattr(settings, 'FACE_STORE_COMPACT_RECORDS', 256)
+    if not threshold:
+        return
+    if _compaction_thread is not None and _compaction_thread.is_alive():
+        return
+    try:
+        size = os.path.getsize(journal_path(current_generation()))
+    except FileNotFoundError:
+        return
+    # Cheap size estimate first: a record with 3 exemplars is ~1.6 KB
+    if size < threshold * RECORD.size:
+        return
+    records, _ = read_journal(journal_path(current_generation()))
+    if len(records) < threshold:
+        return
+    _compaction_thread = threading.Thread(target=_compact_in_background, name='face-store-compaction', daemon=True)
+    _compaction_thread.start()
+
+
+# ---------------- Onboarding staging ----------------
+
+def staged_encodings_path(token, extension='npy'):
+    """Where generate_encodings parks encodings until onboard_employee creates the employee"""
+    if not re.fullmatch(r'[A-Za-z0-9_-]+', str(token)):
+        raise FaceStoreError("invalid onboarding token")
+    return os.path.join(settings.MEDIA_ROOT, 'encodings', f"encodings_{token}.{extension}")
+
+
+def stage_encodings(token, encodings):
+    path = staged_encodings_path(token)
+    os.makedirs(os.path.dirname(path), exist_ok=True)
+    np.save(path, np.asarray(encodings, dtype='<f4'))
+    return path
+
+
+def _staged_file(token):
+    path = staged_encodings_path(token)
+    if os.path.exists(path):
+        return path
+    # Onboardings started before the face store existed staged a pickle
+    path = staged_encodings_path(token, extension='pkl')
+    return path if os.path.exists(path) else None
+
+
+def load_staged_encodings(token):
+    """Return the staged encodings for token without removing them, or None if nothing was staged"""
+    path = _staged_file(token)
+    if path is None:
+        return None
+    encodings = np.load(path) if path.endswith('.npy') else _as_matrix(_load_pickle(path))
+    if encodings.shape[-1] != ENCODING_DIM:
+        print(f"Discarding staged encodings for {token}: expected {ENCODING_DIM}-d, got {encodings.shape[-1]}")
+        return None
+    return encodings
+
+
+def pop_staged_encodings(token):
+    """Return and delete the staged encodings for token, or None if nothing was staged"""
+    path = _staged_file(token)
+    if path is None:
+        return None
+    encodings = load_staged_encodings(token)
+    os.remove(path)
+    return encodings
+
+
+# ---------------- Legacy pickle layouts ----------------
+
+def _load_pickle(path):
+    with open(path, 'rb') as f:
+        return pickle.load(f)
+
+
+def _as_matrix(value):
+    arr = np.asarray(value, dtype=np.float64)
+    if arr.ndim == 1:
+        arr = arr.reshape(1, -1)
+    return arr
+
+
+def legacy_encoding_files(media_root=None):
+    """
+    Yield (employee_id, path) for every legacy pickle, lowest priority first:
+      - media/encodings.pkl                                (update_encodings_for_employee)
+      - faces/employee_<id>_encodings.pkl                  (employee_register)
+      - employee_encodings/employee_<id>_encodings.pkl     (onboard_employee backup copy)
+      - employee_encodings/<id>/encodings.pkl              (generate_encodings / onboard_employee)
+    The mapping file yields (None, path) since it holds many employees.
+    """
+    media_root = media_root or settings.MEDIA_ROOT
+
+    mapping_path = os.path.join(media_root, 'encodings.pkl')
+    if os.path.exists(mapping_path):
+        yield None, mapping_path
+
+    for folder in ('faces', 'employee_encodings'):
+        folder_path = os.path.join(media_root, folder)
+        if not os.path.isdir(folder_path):
+            continue
+        for name in sorted(os.listdir(folder_path)):
+            if name.startswith('employee_') and name.endswith('_encodings.pkl'):
+                yield name[len('employee_'):-len('_encodings.pkl')], os.path.join(folder_path, name)
+
+    encodings_dir = os.path.join(media_root, 'employee_encodings')
+    if os.path.isdir(encodings_dir):
+        for emp_id in sorted(os.listdir(encodings_dir)):
+            path = os.path.join(encodings_dir, emp_id, 'encodings.pkl')
+            if os.path.exists(path):
+                yield emp_id, path
+
+
+def read_legacy_encodings(media_root=None):
+    """Merge every legacy pickle into one employee id -> encodings mapping"""
+    encodings = {}
+    for emp_id, path in legacy_encoding_files(media_root):
+        try:
+            value = _load_pickle(path)
+            if emp_id is None:
+                for key, enc in value.items():
+                    encodings[str(key)] = _as_matrix(enc)
+            else:
+                encodings[emp_id] = _as_matrix(value)
+        except Exception as e:
+            print(f"Skipping unreadable encodings file {path}: {e}")
+    return {emp_id: encs for emp_id, encs in encodings.items() if encs.shape[-1] == ENCODING_DIM}
@@ -0,0 +1,600 @@
+"""
+Process-resident face gallery used by face_login.
+
+The gallery is backed by the memory-mapped face store (see face_store.py),
+opened once per process. Enrollment endpoints write through the gallery, which
+re-opens the store after each write, so face_login never has to touch the
+disk or unpickle anything to match a face. Employees changed since the last
+compaction come from the store journal and are packed into a small delta
+index; partitions they do not touch stay zero-copy views of the segment.
+
+For matching, the gallery is exposed as a GalleryIndex: one contiguous
+float32 matrix holding every exemplar, the employee id array and the row
+offsets of each employee's exemplars. A probe is scored against all rows with
+a single matrix-vector product. Partitions with more than FACE_MATCH_SHORTLIST
+employees are matched in two stages: the probe is compared with each
+employee's centroid first, and only the closest FACE_MATCH_SHORTLIST employees
+have their exemplars (at most FACE_MAX_EXEMPLARS each, see exemplars.py)
+scored.
+
+The gallery is partitioned by Employee.company_id so a login can be limited
+to one tenant. Only active employees are searchable; which employees are
+active and which company they belong to always comes from the database.
+
+With FACE_MATCHER = 'ivf', partitions of at least FACE_ANN_MIN_ROWS exemplars
+are searched through an approximate IVF(/PQ) index (see ann.py) instead of
+the exact scan. The ANN indexes are persisted under face_gallery/ann/ and kept
+in sync with the store by per-employee checksums.
+
+Each gunicorn worker holds its own gallery. Writers bump the store's version
+stamp (face_store.bump_version), and every lookup compares it with the stamp
+the gallery was built from, so an enrollment made through one worker is
+searchable in all of them on their next request. Only the partitions whose
+company counter moved are rebuilt, only the members of those companies are
+queried, and the whole-gallery index is restacked from the partitions.
+
+With FACE_GALLERY_SHARED the partitions are not built per worker at all: one
+process packs them into a file that every worker maps read-only. After a
+version change workers keep searching the file they map until a background
+thread has packed the changed companies into a newer one (see shared_gallery.py).
+
+FACE_GALLERY_PRECISION stores the searchable exemplars and centroids as
+float16 or per-dimension scaled int8 instead of float32 (see quantize.py);
+the face store itself always keeps float32.
+"""
+import os
+import threading
+import uuid
+from collections import defaultdict
+
+import numpy as np
+from django.conf import settings
+from django.db.models import Value
+from django.db.models.functions import Coalesce, Mod
+
+from . import face_store, shared_gallery
+from .ann import IVFIndex
+from .exemplars import reduce_exemplars
+from .quantize import Codec
+
+
+class GalleryIndex:
+    """Immutable packed view of the gallery used for nearest-neighbour search"""
+
+    def __init__(self, employee_ids, matrix, offsets, sq_norms=None, centroids=None, centroid_sq_norms=None,
+                 codec=None):
+        if getattr(employee_ids, 'dtype', None) is not None and employee_ids.dtype.kind == 'S':
+            # Raw ids of a packed shared gallery, decoded only for the results returned
+            self.employee_ids = employee_ids
+        else:
+            self.employee_ids = np.asarray(employee_ids, dtype=object)
+        # With a codec (quantize.py) the exemplars and centroids are stored as its codes
+        self.codec = codec
+        self._stored = np.ascontiguousarray(matrix, dtype=np.float32 if codec is None else codec.dtype)
+        # offsets[i]:offsets[i + 1] are the matrix rows belonging to employee_ids[i]
+        self.offsets = np.asarray(offsets, dtype=np.int64)
+        if sq_norms is None:
+            decoded = self.matrix
+            sq_norms = np.einsum('ij,ij->i', decoded, decoded)
+        self._sq_norms = sq_norms
+        # Precomputed by the packed shared gallery, computed on first use otherwise
+        self._centroids = centroids
+        self._centroid_sq_norms = centroid_sq_norms
+
+    @classmethod
+    def from_mapping(cls, encodings):
+        """Pack an employee id -> list of encodings mapping"""
+        employee_ids = []
+        blocks = []
+        offsets = [0]
+        for emp_id, encs in encodings.items():
+            if not len(encs):
+                continue
+            employee_ids.append(emp_id)
+            blocks.append(np.asarray(encs, dtype=np.float32).reshape(len(encs), -1))
+            offsets.append(offsets[-1] + len(encs))
+        matrix = np.concatenate(blocks) if blocks else np.empty((0, face_store.ENCODING_DIM), dtype=np.float32)
+        return cls(employee_ids, matrix, offsets)
+
+    @classmethod
+    def concat(cls, indexes):
+        """Stack several indexes into one (employees must not overlap, all stored with the same codec)"""
+        indexes = list(indexes)
+        codec = indexes[0].codec if indexes else None
+        if any(index.codec != codec for index in indexes):
+            raise ValueError("cannot concatenate gallery indexes stored with different codecs")
+        indexes = [index for index in indexes if len(index)]
+        if len(indexes) == 1:
+            return indexes[0]
+        if not indexes:
+            dtype = np.float32 if codec is None else codec.dtype
+            return cls([], np.empty((0, face_store.ENCODING_DIM), dtype=dtype), [0], codec=codec)
+        starts = np.cumsum([0] + [len(index.stored()) for index in indexes[:-1]])
+        offsets = np.concatenate([[0]] + [index.offsets[1:] + start for index, start in zip(indexes, starts)])
+        return cls(np.concatenate([index.employee_ids for index in indexes]),
+                   np.concatenate([index.stored() for index in indexes]), offsets,
+                   sq_norms=np.concatenate([index.sq_norms() for index in indexes]), codec=codec)
+
+    def __len__(self):
+        return len(self.employee_ids)
+
+    @property
+    def matrix(self):
+        """Exemplars as float32 (dequantized into a new array when a codec is set)"""
+        return self._stored if self.codec is None else self.codec.decode(self._stored)
+
+    def stored(self):
+        """Exemplars as stored: float32, or the codec's codes"""
+        return self._stored
+
+    @property
+    def nbytes(self):
+        return self._stored.nbytes + self._sq_norms.nbytes
+
+    def quantized(self, codec):
+        """Copy of this float32 index with exemplars and centroids stored as codec codes (codec None: self)"""
+        if codec is None or self.codec is not None:
+            return self
+        stored = codec.encode(self._stored)
+        index = GalleryIndex(self.employee_ids, stored, self.offsets, codec=codec)
+        if len(self.employee_ids):
+            index.centroids()
+        return index
+
+    def _scores(self, stored, q):
+        """stored rows @ q, dequantizing block by block when a codec is set"""
+        if self.codec is None:
+            return stored @ q
+        return self.codec.dot(stored, q)
+
+    def _label(self, position):
+        emp_id = self.employee_ids[position]
+        return emp_id.decode('ascii') if isinstance(emp_id, bytes) else emp_id
+
+    def labels(self):
+        """Employee ids as str objects"""
+        if self.employee_ids.dtype.kind == 'S':
+            return np.char.decode(self.employee_ids, 'ascii').astype(object)
+        return self.employee_ids
+
+    def row_labels(self):
+        """Employee id of every matrix row"""
+        return np.repeat(self.labels(), np.diff(self.offsets))
+
+    def sq_norms(self):
+        return self._sq_norms
+
+    def centroid_sq_norms(self):
+        self._stored_centroids()
+        return self._centroid_sq_norms
+
+    def checksums(self):
+        """Cheap per-employee fingerprint of the exemplars, used to detect changed encodings"""
+        if not len(self.employee_ids):
+            return np.empty(0, dtype=np.float64)
+        return np.add.reduceat(self.matrix.sum(axis=1, dtype=np.float64), self.offsets[:-1])
+
+    def subset(self, positions):
+        """
+        Return a GalleryIndex over the employees at the given (sorted) positions.
+        A contiguous run of employees is sliced without copying the matrix.
+        """
+        positions = np.asarray(positions, dtype=np.int64)
+        if not len(positions):
+            return GalleryIndex([], self._stored[:0], [0], codec=self.codec)
+        first, last = positions[0], positions[-1]
+        if last - first + 1 == len(positions):
+            rows = slice(self.offsets[first], self.offsets[last + 1])
+            return GalleryIndex(self.employee_ids[first:last + 1], self._stored[rows],
+                                self.offsets[first:last + 2] - self.offsets[first],
+                                sq_norms=self._sq_norms[rows], codec=self.codec)
+
+        rows, new_offsets = self._rows_of(positions)
+        return GalleryIndex(self.employee_ids[positions], self._stored[rows], new_offsets,
+                            sq_norms=self._sq_norms[rows], codec=self.codec)
+
+    def centroids(self):
+        """Mean exemplar of every employee as float32 (computed on first use)"""
+        stored = self._stored_centroids()
+        return stored if self.codec is None else self.codec.decode(stored)
+
+    def _stored_centroids(self):
+        if self._centroids is None:
+            counts = np.diff(self.offsets).astype(np.float32)
+            matrix = self.matrix
+            if len(self.employee_ids):
+                sums = np.add.reduceat(matrix, self.offsets[:-1], axis=0)
+            else:
+                sums = np.empty((0, matrix.shape[1]), dtype=np.float32)
+            centroids = np.ascontiguousarray(sums / counts[:, None], dtype=np.float32)
+            if self.codec is not None:
+                centroids = self.codec.encode(centroids)
+                decoded = self.codec.decode(centroids)
+            else:
+                decoded = centroids
+            self._centroid_sq_norms = np.einsum('ij,ij->i', decoded, decoded)
+            self._centroids = centroids
+        return self._centroids
+
+    def stored_centroids(self):
+        """Centroids as stored: float32, or the codec's codes"""
+        return self._stored_centroids()
+
+    def _rows_of(self, positions):
+        """Matrix rows of the employees at positions, and the offsets of each one's rows in that selection"""
+        starts = self.offsets[positions]
+        counts = self.offsets[positions + 1] - starts
+        new_offsets = np.concatenate([[0], np.cumsum(counts)])
+        return np.repeat(starts - new_offsets[:-1], counts) + np.arange(new_offsets[-1]), new_offsets
+
+    def search(self, probe, k=1, shortlist=None):
+        """
+        Return the k closest employees as [(employee_id, distance), ...], best first.
+        An employee's distance is the Euclidean distance to their closest exemplar.
+
+        With shortlist, only the shortlist employees whose centroids are closest
+        to the probe have their exemplars scored (two-stage matching); the
+        distances returned are still exemplar distances.
+        """
+        if not len(self.employee_ids):
+            return []
+        q = np.asarray(probe, dtype=np.float32).ravel()
+        qq = np.dot(q, q)
+        if shortlist:
+            shortlist = max(shortlist, k)
+        if shortlist and len(self.employee_ids) > shortlist:
+            centroids = self._stored_centroids()
+            centroid_sq = self._centroid_sq_norms - 2.0 * self._scores(centroids, q) + qq
+            candidates = np.sort(np.argpartition(centroid_sq, shortlist - 1)[:shortlist])
+            rows, offsets = self._rows_of(candidates)
+            sq_dists = self._sq_norms[rows] - 2.0 * self._scores(self._stored[rows], q) + qq
+        else:
+            candidates = None
+            offsets = self.offsets
+            # |m - q|^2 = |m|^2 - 2 m.q + |q|^2 for every exemplar row at once
+            sq_dists = self._sq_norms - 2.0 * self._scores(self._stored, q) + qq
+        np.maximum(sq_dists, 0.0, out=sq_dists)
+        per_employee = np.minimum.reduceat(sq_dists, offsets[:-1])
+
+        k = min(k, len(per_employee))
+        top = np.argpartition(per_employee, k - 1)[:k]
+        top = top[np.argsort(per_employee[top])]
+        positions = top if candidates is None else candidates[top]
+        return [(self._label(p), float(np.sqrt(per_employee[i]))) for p, i in zip(positions, top)]
+
+
+def _active_employee_companies(slots=None):
+    """Return {employee_id: company_id} for every active employee, or those of companies in the given version slots"""
+    from .models import Employee
+
+    employees = Employee.objects.filter(is_active=True)
+    if slots is not None:
+        # face_store.version_slot in SQL: employees without a company count as UNKNOWN_COMPANY
+        company = Coalesce('company_id', Value(face_store.UNKNOWN_COMPANY))
+        employees = employees.annotate(version_slot=Mod(company, Value(face_store.VERSION_SLOTS))).filter(
+            version_slot__in=sorted(slots))
+    return {str(emp_id): company_id for emp_id, company_id in employees.values_list('id', 'company_id')}
+
+
+def employee_companies(emp_ids):
+    """Return {employee_id: company_id} for the given ids that exist in the database"""
+    from .models import Employee
+
+    valid_ids = []
+    for emp_id in emp_ids:
+        try:
+            valid_ids.append(uuid.UUID(str(emp_id)))
+        except ValueError:
+            continue
+    return {
+        str(emp_id): company_id
+        for emp_id, company_id in Employee.objects.filter(id__in=valid_ids).values_list('id', 'company_id')
+    }
+
+
+def gallery_precision():
+    return getattr(settings, 'FACE_GALLERY_PRECISION', 'float32')
+
+
+def _ann_params():
+    return {
+        'nlist': getattr(settings, 'FACE_ANN_NLIST', 256),
+        'nprobe': getattr(settings, 'FACE_ANN_NPROBE', 16),
+        'pq_m': getattr(settings, 'FACE_ANN_PQ_M', 0),
+    }
+
+
+def _ann_path(key):
+    return os.path.join(settings.MEDIA_ROOT, 'face_gallery', 'ann', f"{key}.npz")
+
+
+def _load_persisted_ann(key, params):
+    path = _ann_path(key)
+    if not os.path.exists(path):
+        return None
+    try:
+        ivf = IVFIndex.load(path)
+    except Exception as e:
+        print(f"Ignoring unreadable ANN index {path}: {e}")
+        return None
+    if ivf.pq_m != params['pq_m'] or ivf.metadata.get('nlist_requested') != params['nlist']:
+        return None
+    ivf.nprobe = params['nprobe']
+    return ivf
+
+
+def _persist_ann(key, ivf, checksums):
+    path = _ann_path(key)
+    os.makedirs(os.path.dirname(path), exist_ok=True)
+    tmp_path = f"{path}.tmp.{os.getpid()}"
+    with open(tmp_path, 'wb') as f:
+        ivf.save(f, nlist_requested=ivf.metadata['nlist_requested'],
+                 employee_ids=np.asarray(list(checksums), dtype=str),
+                 checksums=np.asarray(list(checksums.values()), dtype=np.float64))
+    os.replace(tmp_path, path)
+
+
+class FaceGallery:
+    """Process-wide view of the face store, partitioned by company and packed for search"""
+
+    def __init__(self, membership=None, shared=None):
+        self._lock = threading.Lock()
+        # Callable returning {employee_id: company_id} for the employees that may log in, given
+        # the version slots of the companies wanted (None: all)
+        self._membership = membership or _active_employee_companies
+        # Only the database-backed gallery is published to other processes
+        if shared is None:
+            shared = membership is None and getattr(settings, 'FACE_GALLERY_SHARED', True)
+        self._shared = shared
+        self._packed = None
+        self._index = None
+        self._partitions = {}
+        self._codec = None
+        self._precision = None
+        # (store generation, GalleryIndex of its segment, {employee_id: position in it})
+        self._segment = None
+        # partition key -> (IVFIndex, {employee_id: checksum} it was built from)
+        self._ann = {}
+        # Store generation and version stamp the partitions were built from
+        self._generation = None
+        self._version = None
+        self._slot_versions = None
+
+    def _sync_ann(self, key, index):
+        """Bring the ANN index of one partition in line with its exact GalleryIndex"""
+        params = _ann_params()
+        checksums = dict(zip(index.labels(), index.checksums().tolist()))
+
+        ivf, known = self._ann.get(key, (None, None))
+        if ivf is None:
+            ivf = _load_persisted_ann(key, params)
+            if ivf is not None:
+                known = dict(zip(ivf.metadata['employee_ids'].tolist(), ivf.metadata['checksums'].tolist()))
+        # Retrain once the partition has doubled since the quantizer was trained
+        if ivf is None or len(index.stored()) > 2 * ivf.trained_size:
+            ivf = IVFIndex(**params).build(index.matrix, index.row_labels())
+            ivf.metadata['nlist_requested'] = params['nlist']
+            _persist_ann(key, ivf, checksums)
+            return ivf, checksums
+
+        stale = [emp_id for emp_id, checksum in known.items() if checksums.get(emp_id) != checksum]
+        fresh = [position for position, emp_id in enumerate(index.labels())
+                 if known.get(emp_id) != checksums[emp_id]]
+        if stale:
+            ivf.remove(stale)
+        if fresh:
+            added = index.subset(fresh)
+            ivf.add(added.matrix, added.row_labels())
+        return ivf, checksums
+
+    def _build_ann(self, index, partitions, unchanged=()):
+        """Sync the ANN index of every large partition; companies in unchanged keep their current one"""
+        if getattr(settings, 'FACE_MATCHER', 'brute') != 'ivf':
+            return {}
+        min_rows = getattr(settings, 'FACE_ANN_MIN_ROWS', 20000)
+        ann = {}
+        for key, part, company_id in [('all', index, None)] + [(f"company_{cid}", part, cid)
+                                                                for cid, part in partitions.items()]:
+            if len(part.stored()) < min_rows:
+                continue
+            if company_id in unchanged and key in self._ann:
+                ann[key] = self._ann[key]
+            else:
+                ann[key] = self._sync_ann(key, part)
+        return ann
+
+    def _open_store(self):
+        """Open the face store, importing the legacy pickles on first use"""
+        store = face_store.open_store()
+        if store is None:
+            legacy = face_store.read_legacy_encodings()
+            if legacy:
+                print(f"Importing {len(legacy)} legacy pickle encodings into {face_store.store_path()}")
+                # The store was empty when read: anything written since (an enrollment, or another
+                # worker's import) is kept over the pickles
+                face_store.replace_all(legacy, employee_companies(legacy), keep_others=True, baseline={})
+                store = face_store.open_store()
+        return store
+
+    def _segment_index(self, store):
+        """GalleryIndex over the store's segment and its employee positions, built once per generation"""
+        cached = self._segment
+        if cached is None or cached[0] != store.generation:
+            segment = store.segment
+            base = GalleryIndex(segment.employee_ids, segment.matrix, segment.offsets)
+            cached = (store.generation, base, {emp_id: position for position, emp_id in enumerate(base.employee_ids)})
+            self._segment = cached
+        return cached[1], cached[2]
+
+    def _company_partitions(self, store, slots=None):
+        """
+        Pack {company_id: GalleryIndex} (float32) for the companies in the given
+        version slots (every company if None). Only the members of those
+        companies are queried and looked up in the store.
+        """
+        if store is None:
+            return {}
+        base, positions = self._segment_index(store)
+        overrides = store.overrides
+        delta = GalleryIndex.from_mapping(
+            {emp_id: encs for emp_id, (_, encs) in overrides.items() if encs is not None}
+        )
+
+        members = self._membership(slots)
+        if slots is not None:
+            members = {emp_id: company_id for emp_id, company_id in members.items()
+                       if face_store.version_slot(company_id) in slots}
+        # company_id -> (positions in base, positions in delta)
+        by_company = defaultdict(lambda: ([], []))
+        for emp_id, company_id in members.items():
+            position = positions.get(emp_id)
+            if position is not None and emp_id not in overrides:
+                by_company[company_id][0].append(position)
+        for position, emp_id in enumerate(delta.employee_ids):
+            if emp_id in members:
+                by_company[members[emp_id]][1].append(position)
+
+        partitions = {}
+        for company_id, (base_positions, delta_positions) in by_company.items():
+            partition = base.subset(sorted(base_positions))
+            if delta_positions:
+                partition = GalleryIndex.concat([partition, delta.subset(delta_positions)])
+            partitions[company_id] = partition
+        return partitions
+
+    def _build_partitions(self, slots=None):
+        """
+        Open the face store and pack the company partitions.
+        Returns (store generation, {company_id: GalleryIndex}, companies whose
+        partition was kept because their version slot is not in slots).
+        Rebuilt partitions are float32; kept ones are stored as before.
+        """
+        store = self._open_store()
+        generation = store.generation if store is not None else None
+        if generation != self._generation:
+            slots = None  # kept partitions would still point into the old segment
+        fresh = self._company_partitions(store, slots)
+        if slots is None:
+            return generation, fresh, set()
+        partitions = {company_id: partition for company_id, partition in self._partitions.items()
+                      if face_store.version_slot(company_id) not in slots}
+        unchanged = set(partitions)
+        partitions.update(fresh)
+        return generation, partitions, unchanged
+
+    def _shared_partitions(self, slots=None):
+        """build_partitions callback of shared_gallery.repack (may run in its background thread)"""
+        return self._company_partitions(self._open_store(), slots)
+
+    def load(self, slots=None, wait=False):
+        """
+        (Re)open the face store and rebuild the company partitions.
+        If slots (version slots that changed) is given, partitions of the other
+        companies are kept as they are. A shared gallery attaches to the newest
+        packed file instead, which may still be behind the store while a newer
+        one is packed in the background (see shared_gallery.py), unless wait
+        is set.
+        """
+        version = face_store.read_version()
+        slot_versions = face_store.read_slot_versions()
+        precision = gallery_precision()
+        if self._shared:
+            packed = shared_gallery.attach(version, self._shared_partitions, precision, current=self._packed,
+                                           wait=wait)
+            if packed is self._packed:
+                return len(self._index)  # still the newest file; a newer one is being packed
+            generation, index, partitions = None, packed.index, packed.partitions
+            version, slot_versions, codec = packed.version, packed.slot_versions, packed.codec
+            unchanged = ()
+            if self._packed is not None:
+                moved = packed.slot_versions != self._packed.slot_versions
+                unchanged = {company_id for company_id in partitions if not moved[face_store.version_slot(company_id)]}
+            ann = self._build_ann(index, partitions, unchanged)
+        else:
+            packed = None
+            if precision != self._precision:
+                slots = None
+            generation, partitions, unchanged = self._build_partitions(slots)
+            # Kept partitions are already stored with the current codec; a full build fits a new one
+            if unchanged:
+                codec = self._codec
+            elif precision == 'float32':
+                codec = None
+            else:
+                codec = Codec.fit(precision, GalleryIndex.concat(list(partitions.values())).matrix)
+            partitions = {company_id: part.quantized(codec) for company_id, part in partitions.items()}
+            # The whole-gallery index is stacked from the partitions, company by company
+            index = GalleryIndex.concat([partitions[company_id]
+                                         for company_id in sorted(partitions, key=lambda c: c or 0)])
+            # The ANN indexes are built from the exemplars as stored (dequantized)
+            ann = self._build_ann(index, partitions, unchanged)
+        with self._lock:
+            self._index = index
+            self._partitions = partitions
+            self._ann = ann
+            self._codec = codec
+            self._precision = precision
+            self._packed = packed
+            self._generation = generation
+            self._version = version
+            self._slot_versions = slot_versions
+        return len(index)
+
+    def check_version(self):
+        """Reload the partitions any process changed since the gallery was built"""
+        if face_store.read_version() == self._version:
+            return False
+        changed = np.flatnonzero(face_store.read_slot_versions() != self._slot_versions)
+        self.load(slots=set(changed.tolist()))
+        return True
+
+    def ensure_loaded(self):
+        """Load the gallery on first use, then pick up changes made by other workers"""
+        if self._index is None:
+            self.load()
+        else:
+            self.check_version()
+
+    def refresh(self):
+        """Reload after a change, unless this process has not used the gallery yet"""
+        if self._index is not None:
+            self.check_version()
+
+    def set_employee(self, emp_id, encodings, company_id=None):
+        """Store the encodings of one employee (reduced to FACE_MAX_EXEMPLARS exemplars) and make them searchable"""
+        if company_id is None:
+            company_id = employee_companies([emp_id]).get(str(emp_id))
+        face_store.save_employee_encodings(emp_id, reduce_exemplars(encodings), company_id)
+        self.refresh()
+
+    def remove_employee(self, emp_id):
+        face_store.remove_employee_encodings(emp_id)
+        self.refresh()
+
+    def index(self, company_id=None):
+        """Return the GalleryIndex of one company, or of every active employee"""
+        self.ensure_loaded()
+        if company_id is None:
+            return self._index
+        partition = self._partitions.get(company_id)
+        if partition is None:
+            return GalleryIndex.from_mapping({})
+        return partition
+
+    def search(self, probe, k=1, company_id=None):
+        index = self.index(company_id)
+        ann = self._ann.get('all' if company_id is None else f"company_{company_id}")
+        if ann is not None:
+            return ann[0].search(probe, k)
+        return index.search(probe, k, shortlist=getattr(settings, 'FACE_MATCH_SHORTLIST', 64))
+
+    def __len__(self):
+        return len(self.index())
+
+
+_gallery = FaceGallery()
+
+
+def get_gallery():
+    """Return the process-wide face gallery"""
+    return _gallery
@@ -0,0 +1,263 @@
+"""
+Kiosk streaming mode for face login.
+
+Instead of POSTing one base64 JSON frame per attempt to face-login/, a kiosk
+opens a WebSocket to /ws/employees/kiosk/?company_id=<id> and sends camera
+frames as binary JPEG messages. For each connection a KioskSession:
+
+    * detects the face in every frame and tracks it by box overlap
+      (FACE_KIOSK_TRACK_IOU), so once a tracked face has been identified it
+      is only encoded again every FACE_KIOSK_REVERIFY_FRAMES frames or
+      FACE_KIOSK_REVERIFY_SECONDS, to confirm it is still the same employee.
+      Someone who steps into the same spot is not confirmed: the track is
+      dropped ("lost") and voting starts over with them;
+    * votes over the last FACE_KIOSK_VOTE_FRAMES encoded frames and declares a
+      match once one employee has FACE_KIOSK_VOTE_MIN of them;
+    * pushes JSON text messages back on the same connection:
+
+        {"type": "ready"}
+        {"type": "match", "employee_id": ..., "name": ..., "distance": ..., "votes": 3, "frames": 4, ...}
+        {"type": "lost"}                       tracked face left the frame
+        {"type": "rejected", "reason": ...}    frames fail the quality gate (quality.py);
+                                               sent again only when the reason changes
+        {"type": "error", "detail": ...}
+
+Text messages {"type": "reset"} and {"type": "ping"} are also accepted.
+Frames that arrive while the previous one is still being processed replace
+each other, so a slow server never works on a stale backlog.
+
+The endpoint is plain ASGI (see backend/asgi.py) and needs an ASGI server
+with WebSocket support (uvicorn, daphne). The kiosk_stream management command
+drives it in-process with synthetic frames.
+"""
+import asyncio
+import json
+import time
+from collections import Counter, deque
+from urllib.parse import parse_qs
+
+from asgiref.sync import sync_to_async
+from django.conf import settings
+from django.db import close_old_connections
+from django.utils import timezone
+
+from .gallery import get_gallery
+from .last_login import record_login
+from .login_profile import get_login_profile
+from .preprocess import decode_frame, detect_faces, encode_faces
+from .quality import check_frame, gate_enabled
+
+
+def box_iou(a, b):
+    """Intersection over union of two (top, right, bottom, left) boxes"""
+    top, right = max(a[0], b[0]), min(a[1], b[1])
+    bottom, left = min(a[2], b[2]), max(a[3], b[3])
+    inter = max(0, bottom - top) * max(0, right - left)
+    area_a = (a[2] - a[0]) * (a[1] - a[3])
+    area_b = (b[2] - b[0]) * (b[1] - b[3])
+    union = area_a + area_b - inter
+    return inter / union if union > 0 else 0.0
+
+
+class FaceTrack:
+    def __init__(self, box, window):
+        self.box = box
+        self.misses = 0
+        self.votes = deque(maxlen=window)  # (employee_id or None, distance)
+        self.match = None
+        # Frames and time since the match was last confirmed by an encoding
+        self.unverified_frames = 0
+        self.verified_at = None
+
+    def confirm(self, emp_id):
+        self.match = emp_id
+        self.unverified_frames = 0
+        self.verified_at = time.monotonic()
+
+
+class KioskSession:
+    """Per-connection tracking and voting state; process() is synchronous and runs in a worker thread"""
+
+    def __init__(self, company_id=None):
+        self.company_id = company_id
+        self.track = None
+        self.window = getattr(settings, 'FACE_KIOSK_VOTE_FRAMES', 5)
+        self.min_votes = getattr(settings, 'FACE_KIOSK_VOTE_MIN', 3)
+        self.iou_threshold = getattr(settings, 'FACE_KIOSK_TRACK_IOU', 0.5)
+        self.max_misses = getattr(settings, 'FACE_KIOSK_MAX_MISSES', 3)
+        self.reverify_frames = getattr(settings, 'FACE_KIOSK_REVERIFY_FRAMES', 10)
+        self.reverify_seconds = getattr(settings, 'FACE_KIOSK_REVERIFY_SECONDS', 2.0)
+        self.tolerance = getattr(settings, 'FACE_MATCH_TOLERANCE', 0.6)
+        self.counters = {'frames': 0, 'rejected': 0, 'encoded': 0, 'skipped_encodes': 0, 'matches': 0,
+                         'reverified': 0, 'swapped': 0}
+        self.rejected_reason = None
+        self._reset_pending = False
+
+    def reset(self):
+        """
+        Forget the tracked face. Called from the connection's reader while process()
+        may be running in a worker thread, so it is only applied before the next frame.
+        """
+        self._reset_pending = True
+
+    def process(self, data):
+        """Handle one binary frame; returns the messages to push to the kiosk"""
+        if self._reset_pending:
+            self._reset_pending = False
+            self.track = None
+        self.counters['frames'] += 1
+        messages = []
+        image = decode_frame(data)
+        if gate_enabled('kiosk'):
+            quality = check_frame(image)
+            if not quality['ok']:
+                # Neither a hit nor a miss for the track: the frame says nothing about who is there
+                self.counters['rejected'] += 1
+                if quality['reason'] != self.rejected_reason:
+                    self.rejected_reason = quality['reason']
+                    messages.append({'type': 'rejected', 'reason': quality['reason']})
+                return messages
+        self.rejected_reason = None
+        boxes = detect_faces(image)
+
+        if not boxes:
+            if self.track is not None:
+                self.track.misses += 1
+                if self.track.misses > self.max_misses:
+                    self.track = None
+                    messages.append({'type': 'lost'})
+            return messages
+
+        # Follow the largest face
+        box = max(boxes, key=lambda b: (b[2] - b[0]) * (b[1] - b[3]))
+        if self.track is not None and box_iou(self.track.box, box) >= self.iou_threshold:
+            self.track.box = box
+            self.track.misses = 0
+        else:
+            if self.track is not None:
+                messages.append({'type': 'lost'})
+            self.track = FaceTrack(box, self.window)
+
+        if self.track.match is not None:
+            self.track.unverified_frames += 1
+            if (self.track.unverified_frames < self.reverify_frames
+                    and time.monotonic() - self.track.verified_at < self.reverify_seconds):
+                # Presumably the same person still in front of the kiosk: nothing to encode
+                self.counters['skipped_encodes'] += 1
+                return messages
+
+        encodings = encode_faces(image, [box])
+        if not encodings:
+            return messages
+        self.counters['encoded'] += 1
+
+        results = get_gallery().search(encodings[0], k=1, company_id=self.company_id)
+        distance = results[0][1] if results else None
+        emp_id = results[0][0] if results and distance <= self.tolerance else None
+        if self.track.match is not None:
+            if emp_id == self.track.match:
+                self.track.confirm(emp_id)
+                self.counters['reverified'] += 1
+                return messages
+            # Someone else took the tracked spot: their frames start a new vote
+            self.counters['swapped'] += 1
+            messages.append({'type': 'lost'})
+            self.track = FaceTrack(box, self.window)
+        self.track.votes.append((emp_id, distance))
+
+        counts = Counter(emp_id for emp_id, _ in self.track.votes if emp_id is not None)
+        if not counts:
+            return messages
+        emp_id, votes = counts.most_common(1)[0]
+        if votes < self.min_votes:
+            return messages
+
+        profile = get_login_profile(emp_id)
+        login_time = timezone.now()
+        record_login(emp_id, login_time)
+        self.track.confirm(emp_id)
+        self.counters['matches'] += 1
+        messages.append({
+            'type': 'match',
+            **profile,
+            'distance': round(min(d for e, d in self.track.votes if e == emp_id), 4),
+            'votes': votes,
+            'frames': len(self.track.votes),
+            'login_time': login_time.isoformat(),
+        })
+        return messages
+
+
+def _company_id(scope):
+    query = parse_qs(scope.get('query_string', b'').decode())
+    company_id = query.get('company_id', [None])[0] or getattr(settings, 'FACE_LOGIN_COMPANY_ID', None)
+    return int(company_id) if company_id is not None else None
+
+
+def _process(session, data):
+    try:
+        return session.process(data)
+    finally:
+        close_old_connections()
+
+
+async def kiosk_application(scope, receive, send):
+    """ASGI WebSocket application for /ws/employees/kiosk/"""
+    message = await receive()
+    if message['type'] != 'websocket.connect':
+        return
+    try:
+        session = KioskSession(_company_id(scope))
+    except ValueError:
+        await send({'type': 'websocket.close', 'code': 4400})
+        return
+    await send({'type': 'websocket.accept'})
+    await send({'type': 'websocket.send', 'text': json.dumps({'type': 'ready'})})
+
+    latest = {'frame': None}
+    frame_ready = asyncio.Event()
+    closed = asyncio.Event()
+
+    async def reader():
+        while True:
+            message = await receive()
+            if message['type'] == 'websocket.disconnect':
+                closed.set()
+                frame_ready.set()
+                return
+            if message.get('bytes') is not None:
+                # Newer frames replace one that has not been picked up yet
+                latest['frame'] = message['bytes']
+                frame_ready.set()
+            elif message.get('text'):
+                try:
+                    command = json.loads(message['text']).get('type')
+                except (ValueError, AttributeError):
+                    command = None
+                if command == 'reset':
+                    session.reset()
+                elif command == 'ping':
+                    await send({'type': 'websocket.send', 'text': json.dumps({'type': 'pong'})})
+
+    async def worker():
+        process = sync_to_async(_process, thread_sensitive=False)
+        while True:
+            await frame_ready.wait()
+            frame_ready.clear()
+            if closed.is_set():
+                return
+            data, latest['frame'] = latest['frame'], None
+            if data is None:
+                continue
+            start = time.perf_counter()
+            try:
+                replies = await process(session, data)
+            except Exception as e:
+                replies = [{'type': 'error', 'detail': str(e)}]
+            elapsed_ms = round((time.perf_counter() - start) * 1000, 2)
+            for reply in replies:
+                reply['ms'] = elapsed_ms
+                await send({'type': 'websocket.send', 'text': json.dumps(reply)})
+
+    await asyncio.gather(reader(), worker())
+    print(f"Kiosk stream closed: {session.counters}")
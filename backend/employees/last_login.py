@@ -0,0 +1,116 @@
+"""
+Coalesced Employee.last_login writes.
+
+face_login used to set last_login and call emp.save(), rewriting every
+column of the employee row (and bumping updated_at) on each login; during a
+morning login storm those writes serialize on the database writer. Logins
+are now recorded in memory and a background thread flushes them every
+FACE_LAST_LOGIN_FLUSH_INTERVAL seconds (or once FACE_LAST_LOGIN_BATCH_SIZE
+employees are pending) with one bulk UPDATE of last_login per batch.
+
+Employee instances loaded in this process see their pending timestamp (see
+signals.py), so reads never go backwards. Other processes see it after the
+next flush. Pending logins are flushed at interpreter exit.
+"""
+import atexit
+import threading
+
+from django.conf import settings
+from django.db import close_old_connections
+
+
+class LastLoginRecorder:
+    def __init__(self, flush_interval=5.0, batch_size=500):
+        self.flush_interval = flush_interval
+        self.batch_size = batch_size
+        self._pending = {}
+        self._lock = threading.Lock()
+        self._wake = threading.Event()
+        self._thread = None
+        self.counters = {'recorded': 0, 'flushed': 0, 'batches': 0, 'failed': 0}
+
+    def record(self, employee_id, when):
+        with self._lock:
+            current = self._pending.get(employee_id)
+            if current is None or when > current:
+                self._pending[employee_id] = when
+            self.counters['recorded'] += 1
+            pending = len(self._pending)
+            if self._thread is None or not self._thread.is_alive():
+                self._thread = threading.Thread(target=self._run, name='last-login-writer', daemon=True)
+                self._thread.start()
+        if pending >= self.batch_size:
+            self._wake.set()
+
+    def pending(self, employee_id):
+        return self._pending.get(employee_id)
+
+    def _run(self):
+        while True:
+            self._wake.wait(self.flush_interval)
+            self._wake.clear()
+            close_old_connections()
+            try:
+                self.flush()
+            finally:
+                close_old_connections()
+
+    def flush(self):
+        """Write every pending timestamp; returns the number of employees updated"""
+        from .models import Employee
+
+        with self._lock:
+            pending, self._pending = self._pending, {}
+        if not pending:
+            return 0
+        items = list(pending.items())
+        try:
+            for start in range(0, len(items), self.batch_size):
+                batch = [Employee(pk=emp_id, last_login=when) for emp_id, when in items[start:start + self.batch_size]]
+                # bulk_update issues one UPDATE ... SET last_login = CASE ... per batch and skips auto_now fields
+                Employee.objects.bulk_update(batch, ['last_login'])
+                with self._lock:
+                    self.counters['batches'] += 1
+        except Exception as e:
+            print(f"Failed to flush {len(items)} last_login update(s): {e}")
+            with self._lock:
+                self.counters['failed'] += len(items)
+                # Put them back unless a newer login arrived meanwhile
+                for emp_id, when in items:
+                    if emp_id not in self._pending or self._pending[emp_id] < when:
+                        self._pending[emp_id] = when
+            return 0
+        with self._lock:
+            self.counters['flushed'] += len(items)
+        return len(items)
+
+    def stats(self):
+        with self._lock:
+            return {**self.counters, 'pending': len(self._pending)}
+
+
+_recorder = None
+_recorder_lock = threading.Lock()
+
+
+def get_recorder():
+    global _recorder
+    with _recorder_lock:
+        if _recorder is None:
+            _recorder = LastLoginRecorder(
+                flush_interval=getattr(settings, 'FACE_LAST_LOGIN_FLUSH_INTERVAL', 5.0),
+                batch_size=getattr(settings, 'FACE_LAST_LOGIN_BATCH_SIZE', 500),
+            )
+            atexit.register(_recorder.flush)
+        return _recorder
+
+
+def record_login(employee_id, when):
+    """Record a login; it is persisted with the next batch"""
+    get_recorder().record(str(employee_id), when)
+
+
+def pending_last_login(employee_id):
+    if _recorder is None:
+        return None
+    return _recorder.pending(str(employee_id))
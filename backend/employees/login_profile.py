@@ -0,0 +1,73 @@
+"""
+Cached "login profile" of each employee: everything face_login returns about
+the employee besides the greeting (name, designation, department, company
+name, skills, photo URL and active projects).
+
+Building it costs the employee, company and active-project queries plus the
+skills JSON parse; caching it makes a successful face login one cache lookup.
+Profiles live in the FACE_LOGIN_PROFILE_CACHE cache alias for at most
+FACE_LOGIN_PROFILE_TTL seconds and are invalidated by the receivers in
+signals.py when an employee, its project membership, one of its projects or
+its company changes. With the default per-process LocMemCache the
+invalidation only reaches the process that made the change and the TTL
+bounds staleness elsewhere; point the alias at a shared cache (Redis,
+Memcached) to invalidate everywhere.
+"""
+from django.conf import settings
+from django.core.cache import caches
+
+KEY_PREFIX = 'face_login_profile'
+
+
+def _cache():
+    return caches[getattr(settings, 'FACE_LOGIN_PROFILE_CACHE', 'default')]
+
+
+def _key(employee_id):
+    return f"{KEY_PREFIX}:{employee_id}"
+
+
+def build_login_profile(employee_id):
+    """Load the profile from the database (raises Employee.DoesNotExist)"""
+    from .models import Employee
+
+    emp = Employee.objects.select_related('company').get(id=employee_id)
+    current_projects = []
+    for project in emp.projects.filter(status='active'):
+        current_projects.append({
+            'name': project.name,
+            'description': project.description,
+            'status': project.status,
+            'progress': project.progress_percentage,
+            'deadline': project.deadline.strftime('%Y-%m-%d') if project.deadline else None,
+            'role': 'Team Member'  # You can enhance this with EmployeeProject model
+        })
+    return {
+        'employee_id': str(emp.id),
+        'name': emp.name,
+        'first_name': emp.first_name,
+        'last_name': emp.last_name,
+        'email': emp.email,
+        'designation': emp.designation,
+        'department': emp.department,
+        'company': emp.company.name,
+        'current_projects': current_projects,
+        'skills': emp.get_skills_list(),
+        'experience': emp.experience,
+        'photo_url': emp.photo.url if emp.photo else None,
+    }
+
+
+def get_login_profile(employee_id):
+    cache = _cache()
+    profile = cache.get(_key(employee_id))
+    if profile is None:
+        profile = build_login_profile(employee_id)
+        cache.set(_key(employee_id), profile, getattr(settings, 'FACE_LOGIN_PROFILE_TTL', 300))
+    return profile
+
+
+def invalidate_login_profiles(employee_ids):
+    keys = [_key(employee_id) for employee_id in employee_ids]
+    if keys:
+        _cache().delete_many(keys)
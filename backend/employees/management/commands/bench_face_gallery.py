@@ -0,0 +1,97 @@
+"""
+Benchmark the per-login cost of finding and matching enrolled encodings.
+
+Compares the old per-request pickle scan of MEDIA_ROOT/employee_encodings
+against the resident FaceGallery backed by the memory-mapped face store
+(cold open plus batched top-k search) for synthetic galleries of increasing
+size:
+
+    python manage.py bench_face_gallery --sizes 10,1000,10000,50000
+"""
+import os
+import pickle
+import shutil
+import tempfile
+import time
+
+import numpy as np
+from django.core.management.base import BaseCommand
+from django.test import override_settings
+
+from employees import face_store
+from employees.gallery import FaceGallery
+
+
+def _write_synthetic_gallery(media_root, size, per_employee, rng):
+    encodings_dir = os.path.join(media_root, 'employee_encodings')
+    for i in range(size):
+        emp_dir = os.path.join(encodings_dir, f"bench_{i:06d}")
+        os.makedirs(emp_dir, exist_ok=True)
+        encs = [row for row in rng.random((per_employee, 128))]
+        with open(os.path.join(emp_dir, 'encodings.pkl'), 'wb') as f:
+            pickle.dump(encs, f)
+
+
+def _legacy_scan(media_root):
+    """The lookup face_login used to do on every request"""
+    enc_db = {}
+    encodings_dir = os.path.join(media_root, 'employee_encodings')
+    for emp_id in os.listdir(encodings_dir):
+        encodings_file = os.path.join(encodings_dir, emp_id, 'encodings.pkl')
+        if os.path.exists(encodings_file):
+            with open(encodings_file, 'rb') as f:
+                enc_db[emp_id] = pickle.load(f)
+    return enc_db
+
+
+def _time_ms(fn, repeat):
+    samples = []
+    for _ in range(repeat):
+        start = time.perf_counter()
+        fn()
+        samples.append((time.perf_counter() - start) * 1000)
+    return float(np.median(samples))
+
+
+class Command(BaseCommand):
+    help = "Benchmark per-login encoding lookup: legacy pickle scan vs resident gallery"
+
+    def add_arguments(self, parser):
+        parser.add_argument('--sizes', default='10,100,1000,10000,50000',
+                            help='Comma separated gallery sizes (enrolled employees)')
+        parser.add_argument('--per-employee', type=int, default=3, help='Encodings per employee')
+        parser.add_argument('--repeat', type=int, default=5, help='Timed logins per size')
+        parser.add_argument('--skip-legacy-above', type=int, default=50000,
+                            help='Do not time the legacy scan for galleries larger than this')
+
+    def handle(self, *args, **options):
+        sizes = [int(s) for s in options['sizes'].split(',') if s.strip()]
+        rng = np.random.default_rng(0)
+
+        self.stdout.write(
+            f"{'employees':>10} {'legacy scan ms':>15} {'store open ms':>14} {'search ms':>10}"
+        )
+        for size in sizes:
+            media_root = tempfile.mkdtemp(prefix='bench_gallery_')
+            try:
+                _write_synthetic_gallery(media_root, size, options['per_employee'], rng)
+                with override_settings(MEDIA_ROOT=media_root):
+                    if size <= options['skip_legacy_above']:
+                        legacy_ms = f"{_time_ms(lambda: _legacy_scan(media_root), options['repeat']):.3f}"
+                    else:
+                        legacy_ms = 'skipped'
+
+                    legacy = face_store.read_legacy_encodings()
+                    face_store.replace_all(legacy)
+                    # Synthetic employees are not in the database: treat them all as one active company
+                    gallery = FaceGallery(membership=lambda slots=None: dict.fromkeys(legacy, 1))
+                    open_ms = _time_ms(gallery.load, options['repeat'])
+                    assert len(gallery) == size
+                    probe = rng.random(face_store.ENCODING_DIM)
+                    search_ms = _time_ms(lambda: gallery.search(probe, k=3), options['repeat'])
+
+                self.stdout.write(
+                    f"{size:>10} {legacy_ms:>15} {open_ms:>14.3f} {search_ms:>10.3f}"
+                )
+            finally:
+                shutil.rmtree(media_root, ignore_errors=True)
@@ -0,0 +1,88 @@
+"""
+Run the face pipeline benchmark suite (employees/benchmarks.py) and emit the
+results as JSON, so runs on two commits can be compared:
+
+    python manage.py bench_face_pipeline --sizes 100,1000,10000 --output before.json
+    python manage.py bench_face_pipeline --sizes 100,1000,10000 --compare before.json
+
+Decode, detect and encode are timed on one frame (a synthetic one, or --image
+for a real photo, which the real face_recognition package needs to find a
+face); gallery load, match and end-to-end face_login are timed per gallery
+size. The suite creates and destroys its own test database.
+"""
+import contextlib
+import json
+import sys
+
+import numpy as np
+from django.core.management.base import BaseCommand, CommandError
+
+from employees.benchmarks import CASES, compare, run_suite
+from employees.management.commands.bench_face_preprocess import synthetic_frame
+
+
+class Command(BaseCommand):
+    help = "Benchmark decode, detect, encode, match and face_login on synthetic galleries (JSON report)"
+
+    def add_arguments(self, parser):
+        parser.add_argument('--sizes', default='100,1000,10000', help='Comma separated gallery sizes')
+        parser.add_argument('--cases', default='', help=f"Comma separated subset of: {', '.join(CASES)}")
+        parser.add_argument('--rounds', type=int, default=20, help='Timed rounds per case')
+        parser.add_argument('--warmup', type=int, default=3, help='Untimed rounds before each case')
+        parser.add_argument('--per-employee', type=int, default=3, help='Encodings per synthetic employee')
+        parser.add_argument('--frame-size', default='1280x720', help='WIDTHxHEIGHT of the synthetic frame')
+        parser.add_argument('--image', help='Use this JPEG instead of a synthetic frame')
+        parser.add_argument('--output', help='Write the JSON report to this file instead of stdout')
+        parser.add_argument('--compare', help='Previous JSON report to compare median timings with')
+        parser.add_argument('--threshold', type=float, default=0.1,
+                            help='Slowdown (fraction of the baseline median) reported as a regression')
+        parser.add_argument('--fail-on-regression', action='store_true',
+                            help='Exit with an error if --compare finds a regression')
+
+    def handle(self, *args, **options):
+        cases = [c.strip() for c in options['cases'].split(',') if c.strip()] or None
+        unknown = set(cases or ()) - set(CASES)
+        if unknown:
+            raise CommandError(f"Unknown case(s): {', '.join(sorted(unknown))}")
+        sizes = [int(s) for s in options['sizes'].split(',') if s.strip()]
+
+        if options['image']:
+            with open(options['image'], 'rb') as f:
+                frame = f.read()
+        else:
+            width, height = (int(v) for v in options['frame_size'].lower().split('x'))
+            frame = synthetic_frame(width, height, np.random.default_rng(0))
+
+        def progress(result):
+            size = f" [{result['gallery_size']}]" if result['gallery_size'] is not None else ''
+            self.stderr.write(f"{result['case']}{size}: median {result['median_ms']:.3f} ms, p95 {result['p95_ms']:.3f} ms")
+
+        # The views print diagnostics; keep stdout for the JSON report
+        with contextlib.redirect_stdout(sys.stderr):
+            report = run_suite(frame, sizes, cases=cases, rounds=options['rounds'], warmup=options['warmup'],
+                               per_employee=options['per_employee'], report=progress)
+
+        if options['compare']:
+            with open(options['compare']) as f:
+                baseline = json.load(f)
+            report['comparison'] = {
+                'baseline_commit': baseline.get('meta', {}).get('commit'),
+                'threshold': options['threshold'],
+                'cases': compare(report, baseline, options['threshold']),
+            }
+
+        output = json.dumps(report, indent=2)
+        if options['output']:
+            with open(options['output'], 'w') as f:
+                f.write(output + '\n')
+            self.stderr.write(f"Wrote {len(report['results'])} result(s) to {options['output']}")
+        else:
+            self.stdout.write(output)
+
+        regressions = [row for row in report.get('comparison', {}).get('cases', []) if row['regression']]
+        for row in regressions:
+            size = f" [{row['gallery_size']}]" if row['gallery_size'] is not None else ''
+            self.stderr.write(f"Regression: {row['case']}{size} {row['baseline_ms']:.3f} -> {row['median_ms']:.3f} ms "
+                              f"(x{row['ratio']})")
+        if regressions and options['fail_on_regression']:
+            raise CommandError(f"{len(regressions)} benchmark regression(s)")
@@ -0,0 +1,81 @@
+"""
+Benchmark frame preprocessing against decoding and detecting at full resolution:
+
+    python manage.py bench_face_preprocess --sizes 640x480,1280x720,1920x1080,3840x2160
+
+Detection timings are only meaningful with the real face_recognition package
+installed (the development mock does not run HOG).
+"""
+import io
+import json
+import time
+
+import numpy as np
+from django.core.management.base import BaseCommand
+from PIL import Image
+
+from employees.preprocess import process_frame
+from employees.recognition import face_recognition
+
+
+def synthetic_frame(width, height, rng, quality=90):
+    """A smooth, camera-like JPEG frame (pure noise would make decoding unrealistically slow)"""
+    y, x = np.mgrid[0:height, 0:width].astype(np.float32)
+    base = 128 + 60 * np.sin(x / 37.0)[..., None] * np.cos(y / 53.0)[..., None]
+    image = base + rng.normal(scale=8, size=(height, width, 3))
+    buffer = io.BytesIO()
+    Image.fromarray(np.clip(image, 0, 255).astype(np.uint8)).save(buffer, 'JPEG', quality=quality)
+    return buffer.getvalue()
+
+
+def full_resolution(data):
+    """What the views did before preprocessing: full decode, detect and encode on the whole frame"""
+    timings = {}
+    start = time.perf_counter()
+    image = np.array(Image.open(io.BytesIO(data)).convert('RGB'))
+    timings['decode_ms'] = (time.perf_counter() - start) * 1000
+    start = time.perf_counter()
+    locations = face_recognition.face_locations(image)
+    timings['detect_ms'] = (time.perf_counter() - start) * 1000
+    start = time.perf_counter()
+    face_recognition.face_encodings(image, locations[:1])
+    timings['encode_ms'] = (time.perf_counter() - start) * 1000
+    return timings
+
+
+def _median_timings(fn, data, repeat):
+    runs = [fn(data) for _ in range(repeat)]
+    return {stage: float(np.median([run.get(stage, 0.0) for run in runs]))
+            for stage in ('decode_ms', 'detect_ms', 'encode_ms')}
+
+
+class Command(BaseCommand):
+    help = "Benchmark reduced-size decode + downscaled detection against full-resolution processing"
+
+    def add_arguments(self, parser):
+        parser.add_argument('--sizes', default='640x480,1280x720,1920x1080,3840x2160',
+                            help='Comma separated WIDTHxHEIGHT frame sizes')
+        parser.add_argument('--repeat', type=int, default=5)
+        parser.add_argument('--json', action='store_true', help='Emit the report as JSON')
+
+    def handle(self, *args, **options):
+        rng = np.random.default_rng(0)
+        rows = []
+        for size in [s for s in options['sizes'].split(',') if s.strip()]:
+            width, height = (int(v) for v in size.lower().split('x'))
+            data = synthetic_frame(width, height, rng)
+            for method, fn in (('full', full_resolution), ('preprocess', lambda d: process_frame(d)['timings'])):
+                timings = _median_timings(fn, data, options['repeat'])
+                rows.append({'size': f"{width}x{height}", 'method': method, **timings,
+                             'total_ms': sum(timings.values())})
+
+        if options['json']:
+            self.stdout.write(json.dumps(rows, indent=2))
+            return
+
+        self.stdout.write(f"{'frame':>10} {'method':>11} {'decode ms':>10} {'detect ms':>10} {'encode ms':>10} {'total ms':>9}")
+        for row in rows:
+            self.stdout.write(
+                f"{row['size']:>10} {row['method']:>11} {row['decode_ms']:>10.2f} {row['detect_ms']:>10.2f} "
+                f"{row['encode_ms']:>10.2f} {row['total_ms']:>9.2f}"
+            )
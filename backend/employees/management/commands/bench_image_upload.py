@@ -0,0 +1,95 @@
+"""
+Compare parse time and peak memory of the three face_login upload forms
+(see employees/uploads.py) on large frames:
+
+    python manage.py bench_image_upload --sizes 2560x1440,3840x2160
+
+For each form the request body is built up front (it stands in for the bytes
+already received from the socket) and the measurement covers parsing it into
+image bytes and decoding the frame, which is what face_login does before
+detection. Peak memory is the tracemalloc peak above the starting allocation,
+after parsing (parse MB) and after decoding (peak MB).
+"""
+import base64
+import json
+import time
+import tracemalloc
+
+import numpy as np
+from django.core.management.base import BaseCommand
+from django.test import RequestFactory
+from rest_framework.parsers import FormParser, JSONParser, MultiPartParser
+from rest_framework.request import Request
+
+from employees.management.commands.bench_face_preprocess import synthetic_frame
+from employees.preprocess import decode_frame
+from employees.uploads import request_image
+
+
+def build_request(form, data):
+    factory = RequestFactory()
+    if form == 'json':
+        body = json.dumps({'image': 'data:image/jpeg;base64,' + base64.b64encode(data).decode()})
+        request = factory.post('/api/employees/face-login/', data=body, content_type='application/json')
+    elif form == 'multipart':
+        request = factory.post('/api/employees/face-login/', data={'image': _upload(data)})
+    else:
+        request = factory.post('/api/employees/face-login/', data=data, content_type='image/jpeg')
+    return Request(request, parsers=[JSONParser(), FormParser(), MultiPartParser()])
+
+
+def _upload(data):
+    from django.core.files.uploadedfile import SimpleUploadedFile
+    return SimpleUploadedFile('frame.jpg', data, content_type='image/jpeg')
+
+
+def measure(form, data):
+    request = build_request(form, data)
+    tracemalloc.start()
+    start = time.perf_counter()
+    image = request_image(request)
+    parse_ms = (time.perf_counter() - start) * 1000
+    _, parse_peak = tracemalloc.get_traced_memory()
+    decode_frame(image)
+    total_ms = (time.perf_counter() - start) * 1000
+    _, peak = tracemalloc.get_traced_memory()
+    tracemalloc.stop()
+    return {'parse_ms': parse_ms, 'parse_peak_mb': parse_peak / (1024 * 1024),
+            'total_ms': total_ms, 'peak_mb': peak / (1024 * 1024)}
+
+
+class Command(BaseCommand):
+    help = "Benchmark JSON/base64, multipart and raw image/jpeg uploads of large frames"
+
+    def add_arguments(self, parser):
+        parser.add_argument('--sizes', default='2560x1440,3840x2160',
+                            help='Comma separated WIDTHxHEIGHT frame sizes')
+        parser.add_argument('--quality', type=int, default=97, help='JPEG quality of the synthetic frames')
+        parser.add_argument('--repeat', type=int, default=5)
+        parser.add_argument('--json', action='store_true', help='Emit the report as JSON')
+
+    def handle(self, *args, **options):
+        rng = np.random.default_rng(0)
+        rows = []
+        for size in [s for s in options['sizes'].split(',') if s.strip()]:
+            width, height = (int(v) for v in size.lower().split('x'))
+            data = synthetic_frame(width, height, rng, quality=options['quality'])
+            for form in ('json', 'multipart', 'raw'):
+                runs = [measure(form, data) for _ in range(options['repeat'])]
+                rows.append({
+                    'size': f"{width}x{height}",
+                    'jpeg_mb': round(len(data) / (1024 * 1024), 2),
+                    'form': form,
+                    **{key: float(np.median([run[key] for run in runs])) for key in ('parse_ms', 'parse_peak_mb', 'total_ms', 'peak_mb')},
+                })
+
+        if options['json']:
+            self.stdout.write(json.dumps(rows, indent=2))
+            return
+
+        self.stdout.write(f"{'frame':>10} {'jpeg MB':>8} {'form':>10} {'parse ms':>9} {'parse MB':>9} {'total ms':>9} {'peak MB':>8}")
+        for row in rows:
+            self.stdout.write(
+                f"{row['size']:>10} {row['jpeg_mb']:>8.2f} {row['form']:>10} {row['parse_ms']:>9.2f} {row['parse_peak_mb']:>9.2f} "
+                f"{row['total_ms']:>9.2f} {row['peak_mb']:>8.2f}"
+            )
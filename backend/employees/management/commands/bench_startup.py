@@ -0,0 +1,129 @@
+"""
+Startup cost of the backend, measured with `python -X importtime` in fresh
+interpreters, for CI to track:
+
+    python manage.py bench_startup --output startup.json
+    python manage.py bench_startup --budget-ms urls=1500 --compare startup.json
+
+Scenarios:
+
+    setup   django.setup() (what every management command and migration pays)
+    urls    django.setup() plus the URLconf and every view module (a worker's
+            first request)
+
+For each scenario the report has the median wall time, the median import time
+summed over top-level imports, and the slowest top-level packages by
+cumulative import time. ML models are loaded lazily (employees/ml_models.py),
+so none of dlib, TensorFlow, FER or PyMuPDF should appear here.
+"""
+import json
+import os
+import subprocess
+import sys
+import time
+from collections import defaultdict
+
+import numpy as np
+from django.conf import settings
+from django.core.management.base import BaseCommand, CommandError
+
+SCENARIOS = {
+    'setup': "import django; django.setup()",
+    'urls': "import django; django.setup(); from django.urls import get_resolver; get_resolver().url_patterns",
+}
+
+
+def parse_importtime(stderr):
+    """[(depth, self_us, cumulative_us, module)] from -X importtime output"""
+    rows = []
+    for line in stderr.splitlines():
+        if not line.startswith('import time:') or 'self [us]' in line:
+            continue
+        fields = line[len('import time:'):].split('|')
+        if len(fields) != 3:
+            continue
+        self_us, cumulative_us, name = fields
+        # One space after the bar, then two per nesting level
+        depth = (len(name) - len(name.lstrip(' ')) - 1) // 2
+        rows.append((depth, int(self_us), int(cumulative_us), name.strip()))
+    return rows
+
+
+def run_scenario(code):
+    env = {**os.environ, 'DJANGO_SETTINGS_MODULE': os.environ.get('DJANGO_SETTINGS_MODULE', 'backend.settings')}
+    start = time.perf_counter()
+    result = subprocess.run([sys.executable, '-X', 'importtime', '-c', code], cwd=settings.BASE_DIR, env=env,
+                            capture_output=True, text=True)
+    wall_ms = (time.perf_counter() - start) * 1000
+    if result.returncode != 0:
+        raise CommandError(f"Startup scenario failed:\n{result.stderr[-2000:]}")
+    rows = parse_importtime(result.stderr)
+    packages = defaultdict(int)
+    for depth, _, cumulative_us, name in rows:
+        if depth == 0:
+            packages[name.split('.')[0]] += cumulative_us
+    return wall_ms, sum(packages.values()) / 1000, {name: us / 1000 for name, us in packages.items()}
+
+
+class Command(BaseCommand):
+    help = "Measure interpreter + Django startup with -X importtime (JSON report for CI)"
+
+    def add_arguments(self, parser):
+        parser.add_argument('--scenarios', default=','.join(SCENARIOS), help='Comma separated scenarios')
+        parser.add_argument('--repeat', type=int, default=5, help='Fresh interpreters per scenario')
+        parser.add_argument('--top', type=int, default=15, help='Slowest top-level packages to report')
+        parser.add_argument('--output', help='Write the JSON report to this file instead of stdout')
+        parser.add_argument('--compare', help='Previous report to compare median import times with')
+        parser.add_argument('--budget-ms', action='append', default=[],
+                            help='SCENARIO=MS: fail if the median import time of the scenario exceeds MS')
+
+    def handle(self, *args, **options):
+        scenarios = [s.strip() for s in options['scenarios'].split(',') if s.strip()]
+        unknown = set(scenarios) - set(SCENARIOS)
+        if unknown:
+            raise CommandError(f"Unknown scenario(s): {', '.join(sorted(unknown))}")
+
+        results = []
+        for name in scenarios:
+            runs = [run_scenario(SCENARIOS[name]) for _ in range(options['repeat'])]
+            packages = defaultdict(list)
+            for _, _, per_package in runs:
+                for package, ms in per_package.items():
+                    packages[package].append(ms)
+            slowest = sorted(((package, float(np.median(ms))) for package, ms in packages.items()),
+                             key=lambda item: -item[1])[:options['top']]
+            result = {
+                'scenario': name,
+                'repeat': options['repeat'],
+                'wall_ms': round(float(np.median([run[0] for run in runs])), 2),
+                'import_ms': round(float(np.median([run[1] for run in runs])), 2),
+                'slowest_packages': [{'package': package, 'cumulative_ms': round(ms, 2)} for package, ms in slowest],
+            }
+            results.append(result)
+            self.stderr.write(f"{name}: wall {result['wall_ms']:.1f} ms, imports {result['import_ms']:.1f} ms")
+
+        report = {'python': sys.version.split()[0], 'results': results}
+        if options['compare']:
+            with open(options['compare']) as f:
+                baseline = {r['scenario']: r for r in json.load(f)['results']}
+            report['comparison'] = [
+                {'scenario': r['scenario'], 'baseline_ms': baseline[r['scenario']]['import_ms'], 'import_ms': r['import_ms'],
+                 'ratio': round(r['import_ms'] / baseline[r['scenario']]['import_ms'], 3)}
+                for r in results if r['scenario'] in baseline and baseline[r['scenario']]['import_ms']
+            ]
+
+        output = json.dumps(report, indent=2)
+        if options['output']:
+            with open(options['output'], 'w') as f:
+                f.write(output + '\n')
+        else:
+            self.stdout.write(output)
+
+        over = []
+        for budget in options['budget_ms']:
+            scenario, _, limit = budget.partition('=')
+            for result in results:
+                if result['scenario'] == scenario and result['import_ms'] > float(limit):
+                    over.append(f"{scenario} {result['import_ms']:.1f} ms > {float(limit):.1f} ms")
+        if over:
+            raise CommandError(f"Startup budget exceeded: {'; '.join(over)}")
@@ -0,0 +1,29 @@
+"""
+Merge the face store journal into a new segment:
+
+    python manage.py compact_face_store
+"""
+from django.core.management.base import BaseCommand
+
+from employees import face_store
+
+
+class Command(BaseCommand):
+    help = "Compact the face store: fold the enrollment journal into a new base segment"
+
+    def handle(self, *args, **options):
+        store = face_store.open_store()
+        if store is None:
+            self.stdout.write("Face store is empty.")
+            return
+        self.stdout.write(
+            f"Generation {store.generation}: {len(store.segment)} employee(s) in the segment, "
+            f"{store.journal_records} journal record(s)."
+        )
+        generation = face_store.compact()
+        if generation is None:
+            self.stdout.write("Nothing to compact.")
+            return
+        self.stdout.write(self.style.SUCCESS(
+            f"Compacted into generation {generation} ({face_store.store_path()})."
+        ))
@@ -0,0 +1,126 @@
+"""
+Recall@1 versus latency of the approximate IVF(/PQ) index and of two-stage
+centroid-then-exemplar matching against exact search:
+
+    python manage.py face_ann_report --employees 100000 --nprobe 1,4,16,64 --pq-m 0,16
+    python manage.py face_ann_report --employees 20000 --per-employee 10 --shortlist 16,64 --max-exemplars 5
+
+With --max-exemplars the two-stage rows search a gallery whose employees were
+reduced to that many exemplars by k-medoids, as enrollment stores them.
+"""
+import json
+import time
+
+import numpy as np
+from django.core.management.base import BaseCommand
+
+from employees.ann import IVFIndex
+from employees.exemplars import reduce_exemplars
+from employees.gallery import GalleryIndex
+
+
+def synthetic_gallery(employees, per_employee, queries, rng, dim=128, spread=0.05):
+    """
+    Face-like synthetic data: each employee is a random identity vector of norm ~1
+    with exemplars and probes scattered around it.
+    """
+    identities = rng.normal(size=(employees, dim)).astype(np.float32)
+    identities /= np.linalg.norm(identities, axis=1, keepdims=True)
+    exemplars = np.repeat(identities, per_employee, axis=0)
+    exemplars += rng.normal(scale=spread, size=exemplars.shape).astype(np.float32)
+    employee_ids = np.array([f"emp_{i:07d}" for i in range(employees)], dtype=object)
+    offsets = np.arange(employees + 1) * per_employee
+
+    owners = rng.integers(employees, size=queries)
+    probes = identities[owners] + rng.normal(scale=spread, size=(queries, dim)).astype(np.float32)
+    return GalleryIndex(employee_ids, exemplars, offsets), probes
+
+
+def _latencies_ms(search, probes):
+    results = []
+    samples = []
+    for probe in probes:
+        start = time.perf_counter()
+        results.append(search(probe))
+        samples.append((time.perf_counter() - start) * 1000)
+    return results, np.array(samples)
+
+
+class Command(BaseCommand):
+    help = "Report recall@1 and latency of the IVF/PQ index and two-stage matching against exact search"
+
+    def add_arguments(self, parser):
+        parser.add_argument('--employees', type=int, default=100000)
+        parser.add_argument('--per-employee', type=int, default=3)
+        parser.add_argument('--queries', type=int, default=200)
+        parser.add_argument('--nlist', type=int, default=256)
+        parser.add_argument('--nprobe', default='1,4,16,64', help='Comma separated nprobe values to try')
+        parser.add_argument('--pq-m', default='0,16', help='Comma separated PQ sub-vector counts (0 = no PQ)')
+        parser.add_argument('--shortlist', default='',
+                            help='Comma separated centroid shortlist sizes to try with two-stage matching')
+        parser.add_argument('--max-exemplars', type=int, default=0,
+                            help='Reduce each employee to this many exemplars for the two-stage rows (0 keeps all)')
+        parser.add_argument('--seed', type=int, default=0)
+        parser.add_argument('--json', action='store_true', help='Emit the report as JSON')
+
+    def handle(self, *args, **options):
+        rng = np.random.default_rng(options['seed'])
+        exact, probes = synthetic_gallery(options['employees'], options['per_employee'], options['queries'], rng)
+        labels = exact.row_labels()
+
+        exact_results, exact_ms = _latencies_ms(lambda q: exact.search(q, k=1), probes)
+        truth = [result[0][0] for result in exact_results]
+        rows = [{
+            'method': 'exact', 'pq_m': 0, 'nprobe': None, 'recall_at_1': 1.0,
+            'mean_ms': float(exact_ms.mean()), 'p95_ms': float(np.percentile(exact_ms, 95)), 'build_s': 0.0,
+        }]
+
+        for pq_m in [int(v) for v in options['pq_m'].split(',') if v.strip()]:
+            start = time.perf_counter()
+            ivf = IVFIndex(nlist=options['nlist'], pq_m=pq_m, seed=options['seed']).build(exact.matrix, labels)
+            build_s = time.perf_counter() - start
+            for nprobe in [int(v) for v in options['nprobe'].split(',') if v.strip()]:
+                results, ms = _latencies_ms(lambda q: ivf.search(q, k=1, nprobe=nprobe), probes)
+                hits = sum(1 for result, expected in zip(results, truth) if result and result[0][0] == expected)
+                rows.append({
+                    'method': 'ivf' if not pq_m else 'ivf-pq', 'pq_m': pq_m, 'nprobe': nprobe,
+                    'recall_at_1': hits / len(truth), 'mean_ms': float(ms.mean()),
+                    'p95_ms': float(np.percentile(ms, 95)), 'build_s': build_s,
+                })
+
+        shortlists = [int(v) for v in options['shortlist'].split(',') if v.strip()]
+        if shortlists:
+            reduced = exact
+            if options['max_exemplars']:
+                reduced = GalleryIndex.from_mapping({
+                    emp_id: reduce_exemplars(exact.matrix[exact.offsets[i]:exact.offsets[i + 1]], options['max_exemplars'])
+                    for i, emp_id in enumerate(exact.employee_ids)
+                })
+            reduced.centroids()
+            for shortlist in shortlists:
+                results, ms = _latencies_ms(lambda q: reduced.search(q, k=1, shortlist=shortlist), probes)
+                hits = sum(1 for result, expected in zip(results, truth) if result and result[0][0] == expected)
+                rows.append({
+                    'method': 'two-stage', 'pq_m': 0, 'nprobe': shortlist,
+                    'recall_at_1': hits / len(truth), 'mean_ms': float(ms.mean()),
+                    'p95_ms': float(np.percentile(ms, 95)), 'build_s': 0.0, 'rows': len(reduced.matrix),
+                })
+
+        if options['json']:
+            self.stdout.write(json.dumps({
+                'employees': options['employees'], 'per_employee': options['per_employee'],
+                'queries': options['queries'], 'nlist': options['nlist'], 'results': rows,
+            }, indent=2))
+            return
+
+        self.stdout.write(
+            f"{options['employees']} employees x {options['per_employee']} exemplars, {options['queries']} queries"
+        )
+        # For two-stage rows the nprobe column is the centroid shortlist size
+        self.stdout.write(f"{'method':>9} {'pq_m':>5} {'nprobe':>7} {'recall@1':>9} {'mean ms':>9} {'p95 ms':>9} {'build s':>8}")
+        for row in rows:
+            nprobe = '-' if row['nprobe'] is None else row['nprobe']
+            self.stdout.write(
+                f"{row['method']:>9} {row['pq_m']:>5} {nprobe:>7} {row['recall_at_1']:>9.3f} "
+                f"{row['mean_ms']:>9.3f} {row['p95_ms']:>9.3f} {row['build_s']:>8.2f}"
+            )
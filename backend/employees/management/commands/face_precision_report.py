@@ -0,0 +1,170 @@
+"""
+Match decisions of the float32, float16 and int8 gallery precisions
+(FACE_GALLERY_PRECISION) compared with float64 on a held-out set:
+
+    python manage.py face_precision_report                      # the enrolled face store
+    python manage.py face_precision_report --synthetic --employees 20000 --json
+
+From the store, the last exemplar of every employee with at least two is held
+out as a genuine probe and --impostors of the employees are left out of the
+gallery entirely, their first exemplar probing as a stranger. A decision is
+the top-1 employee if within FACE_MATCH_TOLERANCE, else "no match"; the
+report counts the probes whose decision differs from float64 and how far the
+distances moved, next to the bytes per exemplar and the search latency.
+"""
+import json
+import time
+
+import numpy as np
+from django.conf import settings
+from django.core.management.base import BaseCommand, CommandError
+
+from employees import face_store
+from employees.gallery import GalleryIndex
+from employees.quantize import PRECISIONS, Codec
+
+
+def held_out_from_store(impostor_share, rng):
+    """({employee_id: gallery exemplars}, probes, expected employee id or None per probe)"""
+    store = face_store.open_store()
+    if store is None or not len(store):
+        raise CommandError("The face store is empty; use --synthetic")
+    mapping = {emp_id: np.asarray(encs, dtype=np.float64) for emp_id, encs in store.to_mapping().items()}
+    emp_ids = sorted(mapping)
+    impostors = set(rng.choice(emp_ids, size=int(len(emp_ids) * impostor_share), replace=False).tolist())
+    gallery, probes, owners = {}, [], []
+    for emp_id in emp_ids:
+        encs = mapping[emp_id]
+        if emp_id in impostors:
+            probes.append(encs[0])
+            owners.append(None)
+        elif len(encs) >= 2:
+            gallery[emp_id] = encs[:-1]
+            probes.append(encs[-1])
+            owners.append(emp_id)
+        else:
+            gallery[emp_id] = encs
+    return gallery, np.array(probes), owners
+
+
+def synthetic_held_out(employees, per_employee, impostor_share, rng, dim=face_store.ENCODING_DIM, spread=0.025):
+    """Unit-norm identities with exemplars scattered so that genuine distances are ~0.4, like dlib's"""
+    strangers = int(employees * impostor_share)
+    identities = rng.normal(size=(employees + strangers, dim))
+    identities /= np.linalg.norm(identities, axis=1, keepdims=True)
+    gallery = {
+        f"emp_{i:07d}": identities[i] + rng.normal(scale=spread, size=(per_employee, dim))
+        for i in range(employees)
+    }
+    owners = [f"emp_{i:07d}" for i in range(employees)] + [None] * strangers
+    probes = identities + rng.normal(scale=spread, size=identities.shape)
+    return gallery, probes, owners
+
+
+def reference_matches(gallery, probes, chunk=256):
+    """Exact float64 top-1 (employee id, distance) of every probe"""
+    emp_ids = list(gallery)
+    matrix = np.concatenate([gallery[emp_id] for emp_id in emp_ids])
+    offsets = np.concatenate([[0], np.cumsum([len(gallery[emp_id]) for emp_id in emp_ids])])
+    sq_norms = np.einsum('ij,ij->i', matrix, matrix)
+    results = []
+    for start in range(0, len(probes), chunk):
+        block = probes[start:start + chunk]
+        sq = sq_norms[None, :] - 2.0 * block @ matrix.T + np.einsum('ij,ij->i', block, block)[:, None]
+        per_employee = np.minimum.reduceat(np.maximum(sq, 0.0), offsets[:-1], axis=1)
+        best = per_employee.argmin(axis=1)
+        results.extend((emp_ids[i], float(np.sqrt(per_employee[row, i]))) for row, i in enumerate(best))
+    return results
+
+
+def _accuracy(decisions, owners):
+    """Share of probes decided correctly: genuine probes matched to their owner, impostors rejected"""
+    return round(sum(decision == owner for decision, owner in zip(decisions, owners)) / len(owners), 4)
+
+
+class Command(BaseCommand):
+    help = "Compare match decisions of float32/float16/int8 gallery storage against float64 on held-out probes"
+
+    def add_arguments(self, parser):
+        parser.add_argument('--synthetic', action='store_true', help='Use a synthetic gallery instead of the store')
+        parser.add_argument('--employees', type=int, default=10000, help='Synthetic employees')
+        parser.add_argument('--per-employee', type=int, default=3, help='Synthetic exemplars per employee')
+        parser.add_argument('--impostors', type=float, default=0.1, help='Share of probes that are not enrolled')
+        parser.add_argument('--precisions', default=','.join(PRECISIONS), help='Comma separated precisions')
+        parser.add_argument('--tolerance', type=float, help='Match tolerance (default FACE_MATCH_TOLERANCE)')
+        parser.add_argument('--shortlist', type=int, help='Centroid shortlist (default FACE_MATCH_SHORTLIST)')
+        parser.add_argument('--seed', type=int, default=0)
+        parser.add_argument('--json', action='store_true', help='Emit the report as JSON')
+
+    def handle(self, *args, **options):
+        precisions = [p.strip() for p in options['precisions'].split(',') if p.strip()]
+        unknown = set(precisions) - set(PRECISIONS)
+        if unknown:
+            raise CommandError(f"Unknown precision(s): {', '.join(sorted(unknown))}")
+        tolerance = options['tolerance'] or getattr(settings, 'FACE_MATCH_TOLERANCE', 0.6)
+        shortlist = options['shortlist']
+        if shortlist is None:
+            shortlist = getattr(settings, 'FACE_MATCH_SHORTLIST', 64)
+        rng = np.random.default_rng(options['seed'])
+
+        if options['synthetic']:
+            gallery, probes, owners = synthetic_held_out(options['employees'], options['per_employee'],
+                                                         options['impostors'], rng)
+        else:
+            gallery, probes, owners = held_out_from_store(options['impostors'], rng)
+        if not gallery or not len(probes):
+            raise CommandError("Not enough exemplars to hold any out")
+
+        reference = reference_matches(gallery, probes)
+        reference_decisions = [emp_id if dist <= tolerance else None for emp_id, dist in reference]
+        float32 = GalleryIndex.from_mapping(gallery)
+        float32.centroids()
+
+        rows = [{
+            'precision': 'float64', 'bytes_per_exemplar': 8 * face_store.ENCODING_DIM,
+            'gallery_mb': round(sum(len(encs) for encs in gallery.values()) * 8 * face_store.ENCODING_DIM / 2**20, 2),
+            'decision_changes': 0, 'top1_changes': 0, 'mean_abs_distance_error': 0.0,
+            'max_abs_distance_error': 0.0, 'accuracy': _accuracy(reference_decisions, owners), 'mean_ms': None,
+        }]
+        for precision in precisions:
+            index = float32.quantized(Codec.fit(precision, float32.matrix))
+            results = []
+            start = time.perf_counter()
+            for probe in probes:
+                results.append(index.search(probe, k=1, shortlist=shortlist)[0])
+            mean_ms = (time.perf_counter() - start) * 1000 / len(probes)
+            decisions = [emp_id if dist <= tolerance else None for emp_id, dist in results]
+            errors = np.abs(np.array([dist for _, dist in results]) - np.array([dist for _, dist in reference]))
+            rows.append({
+                'precision': precision,
+                'bytes_per_exemplar': index.stored().itemsize * face_store.ENCODING_DIM,
+                'gallery_mb': round(index.stored().nbytes / 2**20, 2),
+                'decision_changes': sum(a != b for a, b in zip(decisions, reference_decisions)),
+                'top1_changes': sum(a[0] != b[0] for a, b in zip(results, reference)),
+                'mean_abs_distance_error': float(errors.mean()),
+                'max_abs_distance_error': float(errors.max()),
+                'accuracy': _accuracy(decisions, owners),
+                'mean_ms': round(mean_ms, 4),
+            })
+
+        report = {
+            'source': 'synthetic' if options['synthetic'] else 'store',
+            'employees': len(gallery), 'probes': len(probes), 'impostor_probes': owners.count(None),
+            'tolerance': tolerance, 'shortlist': shortlist, 'results': rows,
+        }
+        if options['json']:
+            self.stdout.write(json.dumps(report, indent=2))
+            return
+
+        self.stdout.write(f"{report['employees']} employees, {report['probes']} held-out probes "
+                          f"({report['impostor_probes']} impostors), tolerance {tolerance}, shortlist {shortlist}")
+        self.stdout.write(f"{'precision':>9} {'B/exemplar':>10} {'MB':>8} {'decisions':>9} {'top-1':>6} "
+                          f"{'mean err':>9} {'max err':>9} {'accuracy':>8} {'mean ms':>8}")
+        for row in rows:
+            mean_ms = '-' if row['mean_ms'] is None else f"{row['mean_ms']:.3f}"
+            self.stdout.write(
+                f"{row['precision']:>9} {row['bytes_per_exemplar']:>10} {row['gallery_mb']:>8.2f} "
+                f"{row['decision_changes']:>9} {row['top1_changes']:>6} {row['mean_abs_distance_error']:>9.5f} "
+                f"{row['max_abs_distance_error']:>9.5f} {row['accuracy']:>8.4f} {mean_ms:>8}"
+            )
+        self.stdout.write("decisions / top-1: probes whose match decision / nearest employee differs from float64")
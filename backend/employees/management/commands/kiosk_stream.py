@@ -0,0 +1,93 @@
+"""
+Drive the kiosk face-login stream in-process with synthetic frames:
+
+    python manage.py kiosk_stream --image media/faces/employee_<id>_face_1.jpg --frames 30 --fps 15
+    python manage.py kiosk_stream --frames 60 --fps 0      # unknown faces, as fast as possible
+    python manage.py kiosk_stream --frames 60 --fps 0 --no-quality-gate   # without the quality gate
+
+Frames are fed to the same ASGI application backend/asgi.py routes
+/ws/employees/kiosk/ to, and every message pushed back is printed.
+"""
+import asyncio
+import io
+import json
+import time
+
+import numpy as np
+from django.core.management.base import BaseCommand, CommandError
+from django.test import override_settings
+from PIL import Image
+
+from employees.kiosk import kiosk_application
+from employees.management.commands.bench_face_preprocess import synthetic_frame
+
+
+def synthetic_frames(count, base=None, width=1280, height=720, seed=0):
+    """
+    Yield count JPEG frames: the base image re-sent as a camera would (same face,
+    same position) or, without a base, random camera-like frames.
+    """
+    rng = np.random.default_rng(seed)
+    for _ in range(count):
+        if base is not None:
+            yield base
+        else:
+            yield synthetic_frame(width, height, rng)
+
+
+async def stream(frames, company_id=None, fps=15.0, settle=1.0):
+    """Feed frames to kiosk_application; returns the messages it pushed back"""
+    inbox = asyncio.Queue()
+    replies = []
+
+    async def receive():
+        return await inbox.get()
+
+    async def send(message):
+        if message['type'] == 'websocket.send':
+            replies.append(json.loads(message['text']))
+
+    query = f"company_id={company_id}" if company_id is not None else ''
+    scope = {'type': 'websocket', 'path': '/ws/employees/kiosk/', 'query_string': query.encode()}
+    app = asyncio.ensure_future(kiosk_application(scope, receive, send))
+    await inbox.put({'type': 'websocket.connect'})
+    for frame in frames:
+        await inbox.put({'type': 'websocket.receive', 'bytes': frame})
+        await asyncio.sleep(1.0 / fps if fps else 0)
+    await asyncio.sleep(settle)
+    await inbox.put({'type': 'websocket.disconnect', 'code': 1000})
+    await app
+    return replies
+
+
+class Command(BaseCommand):
+    help = "Stream synthetic frames through the kiosk WebSocket application and print its replies"
+
+    def add_arguments(self, parser):
+        parser.add_argument('--image', help='JPEG to stream repeatedly (e.g. an enrollment photo)')
+        parser.add_argument('--frames', type=int, default=30)
+        parser.add_argument('--fps', type=float, default=15.0, help='Frames per second to send (0: no pacing)')
+        parser.add_argument('--company-id', type=int)
+        parser.add_argument('--no-quality-gate', action='store_true',
+                            help='Turn the kiosk quality gate off (FACE_QUALITY_GATE) for this run')
+
+    def handle(self, *args, **options):
+        base = None
+        if options['image']:
+            try:
+                with open(options['image'], 'rb') as f:
+                    base = f.read()
+                Image.open(io.BytesIO(base)).verify()
+            except (OSError, SyntaxError) as e:
+                raise CommandError(f"Cannot read {options['image']}: {e}")
+
+        start = time.perf_counter()
+        gate = {'FACE_QUALITY_GATE': False} if options['no_quality_gate'] else {}
+        with override_settings(**gate):
+            replies = asyncio.run(stream(synthetic_frames(options['frames'], base),
+                                         options['company_id'], options['fps']))
+        elapsed = time.perf_counter() - start
+        for reply in replies:
+            self.stdout.write(json.dumps(reply))
+        self.stdout.write(f"{options['frames']} frame(s) in {elapsed:.2f} s, "
+                          f"{sum(r['type'] == 'match' for r in replies)} match(es)")
@@ -0,0 +1,59 @@
+"""
+Migrate the legacy pickle encodings into the binary face store:
+
+    python manage.py migrate_face_encodings [--dry-run] [--remove-legacy]
+"""
+import os
+
+from django.conf import settings
+from django.core.management.base import BaseCommand
+
+from employees import face_store
+from employees.gallery import employee_companies
+
+
+class Command(BaseCommand):
+    help = "Import every legacy encodings pickle into the memory-mapped face store"
+
+    def add_arguments(self, parser):
+        parser.add_argument('--dry-run', action='store_true', help='Report what would be migrated without writing')
+        parser.add_argument('--remove-legacy', action='store_true',
+                            help='Delete the legacy pickle files after a successful migration')
+
+    def handle(self, *args, **options):
+        legacy_files = list(face_store.legacy_encoding_files())
+        if not legacy_files:
+            self.stdout.write("No legacy encodings found.")
+            return
+
+        legacy = face_store.read_legacy_encodings()
+        self.stdout.write(f"Found {len(legacy_files)} legacy file(s) covering {len(legacy)} employee(s).")
+
+        store = face_store.open_store()
+        stored = store.to_mapping() if store is not None else {}
+        # Encodings already in the store were written by the new code paths and win over the pickles
+        new_ids = [emp_id for emp_id in legacy if emp_id not in stored]
+
+        if options['dry_run']:
+            self.stdout.write(f"Would import {len(new_ids)} employee(s) into {face_store.store_path()}.")
+            return
+
+        # Merged under the store's write lock: stored employees are kept, and an employee
+        # enrolled since the store was read above keeps that enrollment (baseline)
+        face_store.replace_all({emp_id: legacy[emp_id] for emp_id in new_ids}, employee_companies(new_ids),
+                               keep_others=True, baseline=face_store.employee_checksums(store))
+        store = face_store.open_store()
+        rows = sum(len(encs) for encs in store.to_mapping().values())
+        self.stdout.write(self.style.SUCCESS(
+            f"Imported {len(new_ids)} employee(s); store now holds {len(store)} employee(s), {rows} encoding(s)."
+        ))
+
+        if options['remove_legacy']:
+            encodings_dir = os.path.join(settings.MEDIA_ROOT, 'employee_encodings')
+            for _, path in legacy_files:
+                os.remove(path)
+                # Drop the now empty employee_encodings/<id>/ folders
+                parent = os.path.dirname(path)
+                if os.path.dirname(parent) == encodings_dir and not os.listdir(parent):
+                    os.rmdir(parent)
+            self.stdout.write(f"Removed {len(legacy_files)} legacy file(s).")
@@ -0,0 +1,124 @@
+"""
+Re-encode every active employee's stored face images into a new face store
+generation, e.g. after changing the detector, the encoder or the exemplar
+settings:
+
+    python manage.py rebuild_face_index --workers 16
+    python manage.py rebuild_face_index            # after an interruption: resumes
+    python manage.py rebuild_face_index --restart  # discard the checkpoint
+
+Progress (employees, images/s, ETA) is printed as batches finish; see
+employees/face_rebuild.py for the checkpoint and the swap.
+"""
+import multiprocessing
+import os
+import time
+from concurrent.futures import FIRST_COMPLETED, ProcessPoolExecutor, wait
+
+from django.core.management.base import BaseCommand, CommandError
+
+from employees import face_store
+from employees.enrollment import _warm_worker
+from employees.face_rebuild import Checkpoint, encode_batch, face_image_paths, fingerprint, swap_in
+from employees.models import Employee
+
+
+class Command(BaseCommand):
+    help = "Re-encode all active employees' face images in parallel (resumable) and swap in a new generation"
+
+    def add_arguments(self, parser):
+        parser.add_argument('--workers', type=int, default=os.cpu_count() or 1, help='Encoding processes')
+        parser.add_argument('--batch-size', type=int, default=16, help='Employees per task and checkpoint file')
+        parser.add_argument('--restart', action='store_true', help='Ignore an existing checkpoint and start over')
+        parser.add_argument('--drop-missing', action='store_true',
+                            help='Drop stored encodings of employees that have no usable image '
+                                 '(by default they keep their current encodings)')
+        parser.add_argument('--progress-every', type=float, default=5.0, help='Seconds between progress lines')
+
+    def handle(self, *args, **options):
+        checkpoint = Checkpoint()
+        current = fingerprint()
+        manifest = checkpoint.manifest()
+        if manifest is not None and not options['restart']:
+            if manifest['fingerprint'] != current:
+                raise CommandError(
+                    f"The checkpoint in {checkpoint.path} was made with {manifest['fingerprint']}, "
+                    f"now {current}; rerun with --restart"
+                )
+            try:
+                baseline = checkpoint.baseline()
+            except face_store.FaceStoreError as e:
+                raise CommandError(f"{e}; rerun with --restart")
+            self.stdout.write(f"Resuming the rebuild started {manifest['started']} "
+                              f"({len(checkpoint.batches())} batch(es) done).")
+        else:
+            manifest = {'fingerprint': current, 'started': time.strftime('%Y-%m-%dT%H:%M:%S')}
+            baseline = face_store.employee_checksums()
+            checkpoint.start(manifest, baseline)
+
+        employees = list(Employee.objects.filter(is_active=True).order_by('id').values_list('id', 'company_id'))
+        _, _, done = checkpoint.load()
+        pending = [(str(emp_id), company_id) for emp_id, company_id in employees if str(emp_id) not in done]
+        paths = face_image_paths(emp_id for emp_id, _ in pending)
+        tasks = [(emp_id, company_id, paths[emp_id]) for emp_id, company_id in pending]
+        batch_size = max(options['batch_size'], 1)
+        batches = [tasks[i:i + batch_size] for i in range(0, len(tasks), batch_size)]
+        total_images = sum(len(task[2]) for task in tasks)
+        self.stdout.write(f"{len(employees)} active employee(s), {len(done)} already done; encoding "
+                          f"{total_images} image(s) of {len(tasks)} employee(s) with {options['workers']} worker(s).")
+
+        start = time.perf_counter()
+        if batches:
+            self._encode(checkpoint, batches, checkpoint.next_number(), total_images, options)
+        elapsed = time.perf_counter() - start
+
+        encodings, companies, stats = checkpoint.load()
+        images, faces, errors = (sum(values) for values in zip(*stats.values())) if stats else (0, 0, 0)
+        without = sum(1 for emp_id, _ in employees if str(emp_id) not in encodings)
+        generation = swap_in(encodings, companies, baseline, drop_missing=options['drop_missing'])
+        checkpoint.clear()
+
+        rate = f", {total_images / elapsed:.1f} images/s this run" if elapsed and total_images else ''
+        self.stdout.write(self.style.SUCCESS(
+            f"Rebuilt {len(encodings)} employee(s) from {faces}/{images} image(s) with a face ({errors} error(s)) "
+            f"in {elapsed:.1f} s{rate}; generation {generation} is live ({face_store.store_path()})."
+        ))
+        if without:
+            action = 'dropped' if options['drop_missing'] else 'kept their previous encodings'
+            self.stdout.write(f"{without} active employee(s) had no usable face image and {action}.")
+
+    def _encode(self, checkpoint, batches, numbered_from, total_images, options):
+        workers = max(options['workers'], 1)
+        pool = ProcessPoolExecutor(max_workers=workers, mp_context=multiprocessing.get_context('spawn'),
+                                   initializer=_warm_worker)
+        queue = iter(enumerate(batches, start=numbered_from))
+        in_flight = {}
+        images_done = 0
+        start = last_report = time.perf_counter()
+        try:
+            # A bounded window of tasks keeps the checkpoint close behind the work actually done
+            for number, batch in queue:
+                in_flight[pool.submit(encode_batch, batch)] = (number, batch)
+                if len(in_flight) >= 2 * workers:
+                    break
+            while in_flight:
+                finished, _ = wait(in_flight, return_when=FIRST_COMPLETED)
+                for future in finished:
+                    number, batch = in_flight.pop(future)
+                    results = future.result()
+                    checkpoint.save_batch(number, results)
+                    images_done += sum(len(paths) for _, _, paths in batch)
+                    following = next(queue, None)
+                    if following is not None:
+                        in_flight[pool.submit(encode_batch, following[1])] = following
+                now = time.perf_counter()
+                if now - last_report >= options['progress_every'] or not in_flight:
+                    last_report = now
+                    rate = images_done / (now - start) if now > start else 0.0
+                    eta = (total_images - images_done) / rate if rate else 0.0
+                    self.stdout.write(f"  {images_done}/{total_images} image(s), {rate:.1f} images/s, "
+                                      f"ETA {eta:.0f} s")
+        except KeyboardInterrupt:
+            pool.shutdown(wait=False, cancel_futures=True)
+            raise CommandError("Interrupted; finished batches are checkpointed, rerun to resume")
+        pool.shutdown()
@@ -0,0 +1,42 @@
+"""
+Load the ML models ahead of the first request and report readiness:
+
+    python manage.py warm_models                      # FACE_WARM_MODELS
+    python manage.py warm_models --models fer --json
+
+Exits with an error if a requested model failed to load (a model whose
+package is not installed is reported as unavailable, not as a failure).
+"""
+import json
+
+from django.core.management.base import BaseCommand, CommandError
+
+from employees.ml_models import registry, warm_models
+
+
+class Command(BaseCommand):
+    help = "Load the face/emotion/resume models and report their state and load time"
+
+    def add_arguments(self, parser):
+        parser.add_argument('--models', default='',
+                            help=f"Comma separated subset of: {', '.join(registry.names())} (default: FACE_WARM_MODELS)")
+        parser.add_argument('--json', action='store_true', help='Emit the status as JSON')
+
+    def handle(self, *args, **options):
+        names = [n.strip() for n in options['models'].split(',') if n.strip()] or warm_models()
+        unknown = set(names) - set(registry.names())
+        if unknown:
+            raise CommandError(f"Unknown model(s): {', '.join(sorted(unknown))}")
+
+        status = registry.warm_up(names)
+        if options['json']:
+            self.stdout.write(json.dumps({'ready': registry.ready(names), 'models': status}, indent=2))
+        else:
+            self.stdout.write(f"{'model':>18} {'state':>12} {'load ms':>9}  implementation / error")
+            for name, item in status.items():
+                load_ms = f"{item['load_ms']:.1f}" if item['load_ms'] is not None else '-'
+                self.stdout.write(f"{name:>18} {item['state']:>12} {load_ms:>9}  {item['error'] or item['implementation']}")
+
+        failed = [name for name, item in status.items() if item['state'] == 'failed']
+        if failed:
+            raise CommandError(f"Failed to load: {', '.join(failed)}")
@@ -0,0 +1,160 @@
+"""
+Registry of the heavy libraries and models the employees app uses.
+
+Importing face_recognition (dlib + its model files), building FER(mtcnn=True)
+(TensorFlow) and importing PyMuPDF / python-docx used to happen when
+employees.views was imported, so every management command, migration and
+worker boot paid for them. They are now loaded on first use through this
+registry:
+
+    registry.get('fer')          load (once, thread-safe) and return the model
+    registry.available('fer')    whether it can be loaded, without importing it
+    registry.warm_up(names)      load ahead of the first request
+    registry.status()            per-model state, load time and error
+
+Workers warm FACE_WARM_MODELS in the background right after they start (see
+gunicorn.conf.py and start_warm_up); `manage.py warm_models` does the same in
+the foreground and reports readiness, and GET /api/employees/models/status/
+answers 503 until the warm-up has finished.
+"""
+import importlib
+import importlib.util
+import threading
+import time
+
+from django.conf import settings
+
+
+class ModelUnavailable(Exception):
+    pass
+
+
+class _Entry:
+    def __init__(self, name, loader, module=None, description=''):
+        self.name = name
+        self.loader = loader
+        self.module = module
+        self.description = description
+        self.lock = threading.Lock()
+        self.state = 'unloaded'  # unloaded, loading, ready, unavailable, failed
+        self.model = None
+        self.implementation = None
+        self.load_ms = None
+        self.error = None
+
+
+class ModelRegistry:
+    def __init__(self):
+        self._entries = {}
+
+    def register(self, name, loader, module=None, description=''):
+        """loader() returns the model; module is the import name used to check availability cheaply"""
+        self._entries[name] = _Entry(name, loader, module, description)
+
+    def names(self):
+        return list(self._entries)
+
+    def available(self, name):
+        entry = self._entries[name]
+        if entry.state == 'ready':
+            return True
+        if entry.state in ('unavailable', 'failed'):
+            return False
+        return entry.module is None or importlib.util.find_spec(entry.module) is not None
+
+    def get(self, name):
+        """Return the model, loading it on first use; raises ModelUnavailable if it cannot be loaded"""
+        entry = self._entries[name]
+        if entry.state == 'ready':
+            return entry.model
+        with entry.lock:
+            if entry.state == 'ready':
+                return entry.model
+            if entry.state in ('unavailable', 'failed'):
+                raise ModelUnavailable(f"{name}: {entry.error}")
+            entry.state = 'loading'
+            start = time.perf_counter()
+            try:
+                model = entry.loader()
+            except ImportError as e:
+                entry.state, entry.error = 'unavailable', str(e)
+                raise ModelUnavailable(f"{name}: {e}") from e
+            except Exception as e:
+                entry.state, entry.error = 'failed', str(e)
+                print(f"Loading model {name} failed: {e}")
+                raise ModelUnavailable(f"{name}: {e}") from e
+            entry.load_ms = round((time.perf_counter() - start) * 1000, 2)
+            entry.model = model
+            entry.implementation = getattr(model, '__name__', type(model).__name__)
+            entry.state = 'ready'
+            print(f"Loaded model {name} ({entry.implementation}) in {entry.load_ms} ms")
+            return model
+
+    def warm_up(self, names=None):
+        """Load the given models (all by default) and return status()"""
+        for name in names if names is not None else self.names():
+            try:
+                self.get(name)
+            except ModelUnavailable:
+                pass
+        return self.status(names)
+
+    def status(self, names=None):
+        return {
+            name: {
+                'state': entry.state,
+                'implementation': entry.implementation,
+                'load_ms': entry.load_ms,
+                'error': entry.error,
+                'description': entry.description,
+            }
+            for name, entry in self._entries.items() if names is None or name in names
+        }
+
+    def ready(self, names=None):
+        """True once none of the given models is still unloaded or loading"""
+        return all(item['state'] not in ('unloaded', 'loading') for item in self.status(names).values())
+
+
+class LazyModel:
+    """Module-like stand-in that loads a registered model on first attribute access"""
+
+    def __init__(self, name):
+        self._name = name
+
+    def __getattr__(self, attr):
+        return getattr(registry.get(self._name), attr)
+
+
+def _load_face_recognition():
+    try:
+        return importlib.import_module('face_recognition')
+    except ImportError:
+        # Development fallback, see recognition.py
+        from .recognition import MockFaceRecognition
+        return MockFaceRecognition()
+
+
+def _load_fer():
+    from fer import FER
+    return FER(mtcnn=True)
+
+
+registry = ModelRegistry()
+registry.register('face_recognition', _load_face_recognition,
+                  description='dlib face detector and encoder (mock when not installed)')
+registry.register('fer', _load_fer, module='fer', description='FER emotion classifier with MTCNN')
+registry.register('pymupdf', lambda: importlib.import_module('fitz'), module='fitz', description='PDF resume text')
+registry.register('docx', lambda: importlib.import_module('docx'), module='docx', description='DOCX resume text')
+
+
+def warm_models():
+    return getattr(settings, 'FACE_WARM_MODELS', ['face_recognition', 'fer'])
+
+
+def start_warm_up(names=None):
+    """Warm the models in a background thread (per worker process, after the fork)"""
+    names = warm_models() if names is None else names
+    thread = threading.Thread(target=registry.warm_up, args=(names,), name='model-warm-up', daemon=True)
+    thread.start()
+    return thread
@@ -0,0 +1,139 @@
+"""
+Frame preprocessing shared by face_login, capture_emotion and enrollment.
+
+Camera frames arrive as 720p/1080p JPEGs, but HOG detection cost grows with
+the pixel count while a face only needs ~150 px to be encoded reliably.
+process_frame() therefore:
+
+    decode   JPEGs are decoded at a reduced scale (PIL draft mode) so that the
+             longest side is at least FACE_DECODE_MAX_SIDE
+    detect   faces are located on a copy downscaled to FACE_DETECT_MAX_SIDE
+             and the boxes are mapped back to the decoded image
+    encode   only the face crop (plus FACE_CROP_MARGIN) is handed to the encoder
+
+Each stage's duration is recorded in the returned timings dict.
+"""
+import io
+import time
+
+import numpy as np
+from django.conf import settings
+from PIL import Image
+
+from .recognition import face_recognition
+
+
+def _elapsed_ms(start):
+    return round((time.perf_counter() - start) * 1000, 2)
+
+
+def as_bytes(data):
+    """bytes of a bytes-like object, without copying a memoryview that spans a whole bytes object"""
+    if isinstance(data, memoryview):
+        if isinstance(data.obj, bytes) and data.nbytes == len(data.obj):
+            return data.obj
+        return data.tobytes()
+    return bytes(data)
+
+
+def frame_stream(data):
+    """
+    A file object over the frame bytes for PIL. io.BytesIO shares an immutable
+    bytes object instead of copying it, so whole-bytes memoryviews (uploads.py)
+    are unwrapped first; only views into mutable or partial buffers are copied.
+    """
+    return io.BytesIO(as_bytes(data))
+
+
+def decode_frame(data, max_side=None, timings=None):
+    """Decode JPEG/PNG bytes (or a memoryview of them) to an RGB array, letting libjpeg skip detail beyond max_side"""
+    start = time.perf_counter()
+    if max_side is None:
+        max_side = getattr(settings, 'FACE_DECODE_MAX_SIDE', 1280)
+    img = Image.open(frame_stream(data))
+    if max_side and img.format == 'JPEG' and max(img.size) > max_side:
+        # draft() picks the smallest 1/2, 1/4 or 1/8 scale that is still >= the requested size
+        scale = max_side / max(img.size)
+        img.draft('RGB', (int(img.width * scale), int(img.height * scale)))
+    image = np.asarray(img.convert('RGB'))
+    if timings is not None:
+        timings['decode_ms'] = _elapsed_ms(start)
+    return image
+
+
+def downscale(image, max_side):
+    """
+    Return (copy whose longest side is at most max_side, factor to map its coordinates back).
+    Uses an integer box reduction, which is several times cheaper than a resampling resize.
+    """
+    height, width = image.shape[:2]
+    if not max_side or max(height, width) <= max_side:
+        return image, 1
+    factor = -(-max(height, width) // max_side)
+    return np.asarray(Image.fromarray(image).reduce(factor)), factor
+
+
+def detect_faces(image, max_side=None):
+    """face_recognition boxes (top, right, bottom, left) in image coordinates, found on a downscaled copy"""
+    if max_side is None:
+        max_side = getattr(settings, 'FACE_DETECT_MAX_SIDE', 640)
+    small, factor = downscale(image, max_side)
+    height, width = image.shape[:2]
+    boxes = []
+    for top, right, bottom, left in face_recognition.face_locations(small):
+        boxes.append((max(0, top * factor), min(width, right * factor),
+                      min(height, bottom * factor), max(0, left * factor)))
+    return boxes
+
+
+def crop_face(image, box, margin=None):
+    """Return (crop around box with a margin, box relative to the crop)"""
+    if margin is None:
+        margin = getattr(settings, 'FACE_CROP_MARGIN', 0.25)
+    top, right, bottom, left = box
+    pad_y = int((bottom - top) * margin)
+    pad_x = int((right - left) * margin)
+    height, width = image.shape[:2]
+    y0, x0 = max(0, top - pad_y), max(0, left - pad_x)
+    y1, x1 = min(height, bottom + pad_y), min(width, right + pad_x)
+    return np.ascontiguousarray(image[y0:y1, x0:x1]), (top - y0, right - x0, bottom - y0, left - x0)
+
+
+def encode_faces(image, boxes):
+    """Encode each face from its crop only"""
+    encodings = []
+    for box in boxes:
+        crop, local_box = crop_face(image, box)
+        encs = face_recognition.face_encodings(crop, [local_box])
+        if len(encs) > 0:
+            encodings.append(encs[0])
+    return encodings
+
+
+def analyze_frame(image, encode=True, timings=None, on_detect=None):
+    """
+    Detect and (optionally) encode faces in a decoded frame.
+    Returns {'image', 'locations', 'encodings', 'timings'}; only the first face is encoded.
+    on_detect(locations) is called between detection and encoding, so other
+    consumers of the boxes (the emotion classifier) can start on them.
+    """
+    timings = {} if timings is None else timings
+    start = time.perf_counter()
+    locations = detect_faces(image)
+    timings['detect_ms'] = _elapsed_ms(start)
+    if on_detect is not None:
+        on_detect(locations)
+
+    encodings = []
+    if encode and locations:
+        start = time.perf_counter()
+        encodings = encode_faces(image, locations[:1])
+        timings['encode_ms'] = _elapsed_ms(start)
+    return {'image': image, 'locations': locations, 'encodings': encodings, 'timings': timings}
+
+
+def process_frame(data, encode=True):
+    """Decode, detect and (optionally) encode one frame; see analyze_frame"""
+    timings = {}
+    image = decode_frame(data, timings=timings)
+    return analyze_frame(image, encode, timings)
@@ -0,0 +1,95 @@
+"""
+Reduced-precision storage of gallery exemplars (FACE_GALLERY_PRECISION).
+
+The face store keeps float32 encodings; the searchable gallery can hold them
+as:
+
+    float32   4 bytes per dimension (no codec)
+    float16   2 bytes per dimension
+    int8      1 byte per dimension, per-dimension affine scaling:
+              x ~ offset[d] + scale[d] * code[d], with offset/scale chosen so
+              the gallery's range of every dimension spans the codes -127..127
+
+Distances are computed on the dequantized vectors without materializing
+them: m.q = offset.q + code.(scale * q), evaluated block by block so that
+only a cache-sized float32 copy of the codes exists at any time. Squared
+norms are taken from the dequantized vectors, so |m - q| is exact for the
+vector actually stored. The face_precision_report command measures how often
+match decisions change against float64.
+"""
+import numpy as np
+
+PRECISIONS = ('float32', 'float16', 'int8')
+# Precision codes stored in the packed shared gallery header
+PRECISION_CODES = {name: code for code, name in enumerate(PRECISIONS)}
+# Rows converted to float32 at a time when scoring (512 KB of float32 per block)
+BLOCK_ROWS = 1024
+
+
+class Codec:
+    def __init__(self, precision, offset=None, scale=None):
+        if precision not in PRECISIONS[1:]:
+            raise ValueError(f"Unsupported gallery precision {precision!r}; expected one of {', '.join(PRECISIONS)}")
+        self.precision = precision
+        self.dtype = np.dtype('<f2') if precision == 'float16' else np.dtype('i1')
+        self.offset = None if offset is None else np.asarray(offset, dtype=np.float32)
+        self.scale = None if scale is None else np.asarray(scale, dtype=np.float32)
+
+    def __eq__(self, other):
+        if not isinstance(other, Codec):
+            return NotImplemented
+        # float16 codecs carry no parameters; int8 codecs are equal when fitted to the same range
+        if self.precision != other.precision:
+            return False
+        return self.precision == 'float16' or (np.array_equal(self.offset, other.offset)
+                                               and np.array_equal(self.scale, other.scale))
+
+    def __hash__(self):
+        return hash(self.precision)
+
+    @classmethod
+    def fit(cls, precision, matrix):
+        """Codec for the given precision fitted to the range of matrix (None for float32)"""
+        if precision == 'float32':
+            return None
+        if precision == 'float16':
+            return cls(precision)
+        matrix = np.asarray(matrix, dtype=np.float32)
+        if not len(matrix):
+            return cls(precision, np.zeros(matrix.shape[1], np.float32), np.ones(matrix.shape[1], np.float32))
+        low, high = matrix.min(axis=0), matrix.max(axis=0)
+        scale = np.maximum((high - low) / 254.0, np.float32(1e-12))
+        return cls(precision, (high + low) / 2.0, scale)
+
+    def params(self, dim):
+        """(offset, scale) as stored in the packed file; identity for float16"""
+        if self.offset is None:
+            return np.zeros(dim, np.float32), np.ones(dim, np.float32)
+        return self.offset, self.scale
+
+    def encode(self, matrix):
+        matrix = np.asarray(matrix, dtype=np.float32)
+        if self.precision == 'float16':
+            return matrix.astype(self.dtype)
+        codes = np.rint((matrix - self.offset) / self.scale)
+        return np.clip(codes, -127, 127).astype(self.dtype)
+
+    def decode(self, codes):
+        values = np.asarray(codes, dtype=np.float32)
+        if self.precision == 'float16':
+            return values
+        return values * self.scale + self.offset
+
+    def dot(self, codes, q):
+        """Dequantized codes @ q, without materializing the dequantized matrix"""
+        q = np.asarray(q, dtype=np.float32)
+        if self.precision == 'float16':
+            weights, base = q, np.float32(0.0)
+        else:
+            weights, base = q * self.scale, np.float32(np.dot(self.offset, q))
+        out = np.empty(len(codes), dtype=np.float32)
+        for start in range(0, len(codes), BLOCK_ROWS):
+            stop = start + BLOCK_ROWS
+            np.dot(codes[start:stop].astype(np.float32), weights, out=out[start:stop])
+        out += base
+        return out
@@ -0,0 +1,335 @@
+"""
+Packed gallery shared by every worker process.
+
+Without it each gunicorn worker packs its own copy of the company partitions
+(plus squared norms and centroids), so gallery memory grows with workers x
+employees x exemplars. With FACE_GALLERY_SHARED, one process packs the
+partitions into a file and every worker maps that file read-only; the pages
+live once in the page cache and each worker only keeps small per-company
+views of them.
+
+A packed file holds only searchable (active) employees, laid out company by
+company so that every partition is a contiguous slice:
+
+    header        192 bytes   magic, format, dim, precision, counts, store
+                              version and the byte offsets of the sections below
+    matrix        precision   n_rows x dim exemplars (FACE_GALLERY_PRECISION:
+                              float32, float16 or int8 codes, see quantize.py)
+    sq_norms      float32     n_rows squared (dequantized) exemplar norms
+    centroids     precision   n_employees x dim
+    centroid_sq   float32     n_employees squared centroid norms
+    offsets       int64       n_employees + 1 row offsets into the whole matrix
+    local         int64       n_employees + n_companies row offsets relative to
+                              each company's first row
+    employee_ids  S64         n_employees
+    companies     records     (company_id, first employee, employee count)
+    codec         float32     2 x dim int8 offset and scale (identity otherwise)
+    slot_versions uint64      the store's per-company version counters the
+                              file was packed from
+
+Generation handshake: PACKED names the current file and the store version
+(face_store.read_version) it was built from. A worker that finds the file
+behind the store version keeps searching the file it maps and starts a
+background thread that takes the '.pack' lock and, if PACKED is still behind
+(otherwise another worker already did it), packs a new file, swaps PACKED with
+os.replace() and lets the workers attach to it on their next request. Only
+the companies whose version slot moved since the previous file are rebuilt
+from the face store; the other partitions are copied over from the previous
+file as they are, codec included. A request only packs by itself when there
+is no usable file at all (first start, or a precision or format change).
+Workers switch by replacing one reference, so a search sees either the old
+mapping or the new one; old files are unlinked once superseded and stay
+readable for workers that still map them.
+
+FACE_GALLERY_SHARED_DIR can point the packed files at a tmpfs such as
+/dev/shm; by default they sit next to the face store.
+"""
+import mmap
+import os
+import struct
+import threading
+import zlib
+
+import numpy as np
+from django.conf import settings
+from django.db import connection
+
+from . import face_store
+from .quantize import PRECISION_CODES, PRECISIONS, Codec
+
+PACKED_MAGIC = b'FGPACK\0\0'
+PACKED_FORMAT = 3
+# magic, format, dim, precision, n_rows, n_employees, n_companies, store version, then 10 section offsets
+PACKED_HEADER = struct.Struct('<8sIIIQQQQ10Q')
+PACKED_HEADER_SIZE = 192
+COMPANY_DTYPE = np.dtype([('company_id', '<i8'), ('first', '<i8'), ('count', '<i8')])
+SECTIONS = ('matrix', 'sq_norms', 'centroids', 'centroid_sq', 'offsets', 'local', 'employee_ids', 'companies',
+            'codec', 'slot_versions')
+
+_build_counter = 0
+_build_lock = threading.Lock()
+_repack_thread = None
+
+
+def shared_dir():
+    base = getattr(settings, 'FACE_GALLERY_SHARED_DIR', None)
+    if not base:
+        return os.path.join(face_store.store_dir(), 'shared')
+    # One subdirectory per face store, so galleries of different MEDIA_ROOTs never mix
+    return os.path.join(base, f"face_gallery-{zlib.crc32(os.path.abspath(face_store.store_dir()).encode()):08x}")
+
+
+def _pointer_path():
+    return os.path.join(shared_dir(), 'PACKED')
+
+
+def read_pointer():
+    """(file name, store version) of the current packed gallery, or None"""
+    try:
+        with open(_pointer_path()) as f:
+            name, version = f.read().split()
+        return name, int(version)
+    except (FileNotFoundError, ValueError):
+        return None
+
+
+def _write_pointer(name, version):
+    path = _pointer_path()
+    tmp_path = f"{path}.tmp.{os.getpid()}"
+    with open(tmp_path, 'w') as f:
+        f.write(f"{name} {version}\n")
+        f.flush()
+        os.fsync(f.fileno())
+    os.replace(tmp_path, path)
+
+
+def write_packed(path, partitions, version, precision='float32', slot_versions=None, codec=None):
+    """
+    Write {company_id: GalleryIndex} partitions as one packed file, company by company.
+    Partitions are float32 or already stored with codec; without a codec one is fitted.
+    """
+    parts = [(company_id, partitions[company_id]) for company_id in sorted(partitions, key=lambda c: c or 0)]
+    parts = [(company_id, part) for company_id, part in parts if len(part)]
+    dim = face_store.ENCODING_DIM
+    if codec is None:
+        codec = Codec.fit(precision, np.concatenate([part.matrix for _, part in parts]) if parts
+                          else np.empty((0, dim), np.float32))
+    if slot_versions is None:
+        slot_versions = np.zeros(face_store.VERSION_SLOTS, dtype=np.uint64)
+    dtype = np.dtype('<f4') if codec is None else codec.dtype
+    parts = [(company_id, part.quantized(codec)) for company_id, part in parts]
+    blocks, sq_norms, centroids, centroid_sq, local, ids = [], [], [], [], [], []
+    companies = np.empty(len(parts), dtype=COMPANY_DTYPE)
+    first = 0
+    for i, (company_id, part) in enumerate(parts):
+        blocks.append(part.stored())
+        sq_norms.append(part.sq_norms())
+        centroids.append(part.stored_centroids())
+        centroid_sq.append(part.centroid_sq_norms())
+        local.append(part.offsets)
+        ids.append(part.labels())
+        companies[i] = (company_id or face_store.UNKNOWN_COMPANY, first, len(part))
+        first += len(part)
+
+    matrix = np.concatenate(blocks) if blocks else np.empty((0, dim), dtype=dtype)
+    counts = np.concatenate([np.diff(offsets) for offsets in local]) if local else np.empty(0, dtype=np.int64)
+    arrays = {
+        'matrix': matrix,
+        'sq_norms': np.concatenate(sq_norms).astype('<f4') if sq_norms else np.empty(0, dtype='<f4'),
+        'centroids': np.concatenate(centroids).astype(dtype) if centroids else np.empty((0, dim), dtype=dtype),
+        'centroid_sq': np.concatenate(centroid_sq).astype('<f4') if centroid_sq else np.empty(0, dtype='<f4'),
+        'offsets': np.concatenate([[0], np.cumsum(counts)]).astype('<i8'),
+        'local': np.concatenate(local).astype('<i8') if local else np.empty(0, dtype='<i8'),
+        'employee_ids': np.array([str(emp_id) for part_ids in ids for emp_id in part_ids], dtype='S64'),
+        'companies': companies,
+        'codec': np.stack(codec.params(dim) if codec is not None else (np.zeros(dim), np.ones(dim))).astype('<f4'),
+        'slot_versions': np.asarray(slot_versions, dtype='<u8'),
+    }
+
+    section_offsets = []
+    position = PACKED_HEADER_SIZE
+    for name in SECTIONS:
+        position = face_store._align(position)
+        section_offsets.append(position)
+        position += arrays[name].nbytes
+    header = PACKED_HEADER.pack(PACKED_MAGIC, PACKED_FORMAT, dim, PRECISION_CODES[precision], len(matrix),
+                                len(arrays['employee_ids']), len(companies), version, *section_offsets)
+
+    tmp_path = f"{path}.tmp.{os.getpid()}.{threading.get_ident()}"
+    with open(tmp_path, 'wb') as f:
+        f.write(header.ljust(PACKED_HEADER_SIZE, b'\0'))
+        for name, offset in zip(SECTIONS, section_offsets):
+            f.write(b'\0' * (offset - f.tell()))
+            f.write(arrays[name].tobytes())
+        f.flush()
+        os.fsync(f.fileno())
+    os.replace(tmp_path, path)
+
+
+class PackedGallery:
+    """Read-only mapping of a packed file: the whole index and zero-copy company partitions"""
+
+    def __init__(self, path):
+        from .gallery import GalleryIndex
+
+        self.path = path
+        with open(path, 'rb') as f:
+            size = os.fstat(f.fileno()).st_size
+            self._map = mmap.mmap(f.fileno(), size, access=mmap.ACCESS_READ) if size else None
+        if self._map is None or size < PACKED_HEADER_SIZE:
+            raise face_store.FaceStoreError(f"{path}: truncated packed gallery")
+        magic, fmt = PACKED_HEADER.unpack_from(self._map)[:2]
+        if magic != PACKED_MAGIC or fmt != PACKED_FORMAT:
+            raise face_store.FaceStoreError(f"{path}: not a packed face gallery of format {PACKED_FORMAT}")
+        _, _, dim, precision, n_rows, n_employees, n_companies, version, *offsets = PACKED_HEADER.unpack_from(self._map)
+        self.version = version
+        self.precision = PRECISIONS[precision]
+        dtype = '<f4' if self.precision == 'float32' else Codec(self.precision).dtype
+        shapes = {
+            'matrix': (dtype, (n_rows, dim)),
+            'sq_norms': ('<f4', (n_rows,)),
+            'centroids': (dtype, (n_employees, dim)),
+            'centroid_sq': ('<f4', (n_employees,)),
+            'offsets': ('<i8', (n_employees + 1,)),
+            'local': ('<i8', (n_employees + n_companies,)),
+            'employee_ids': ('S64', (n_employees,)),
+            'companies': (COMPANY_DTYPE, (n_companies,)),
+            'codec': ('<f4', (2, dim)),
+            'slot_versions': ('<u8', (face_store.VERSION_SLOTS,)),
+        }
+        sections = {}
+        for name, offset in zip(SECTIONS, offsets):
+            dtype, shape = shapes[name]
+            count = int(np.prod(shape))
+            sections[name] = np.frombuffer(self._map, dtype=dtype, count=count, offset=offset).reshape(shape)
+
+        codec = None
+        if self.precision != 'float32':
+            codec = Codec(self.precision, *sections['codec']) if self.precision == 'int8' else Codec(self.precision)
+        self.codec = codec
+        self.slot_versions = sections['slot_versions']
+        self.index = GalleryIndex(sections['employee_ids'], sections['matrix'], sections['offsets'],
+                                  sq_norms=sections['sq_norms'], centroids=sections['centroids'],
+                                  centroid_sq_norms=sections['centroid_sq'], codec=codec)
+        self.partitions = {}
+        global_offsets = sections['offsets']
+        for i, (company_id, first, count) in enumerate(sections['companies'].tolist()):
+            last = first + count
+            rows = slice(global_offsets[first], global_offsets[last])
+            self.partitions[company_id] = GalleryIndex(
+                sections['employee_ids'][first:last], sections['matrix'][rows],
+                sections['local'][first + i:last + i + 1],
+                sq_norms=sections['sq_norms'][rows], centroids=sections['centroids'][first:last],
+                centroid_sq_norms=sections['centroid_sq'][first:last], codec=codec,
+            )
+
+
+def _open_current():
+    """Map the file PACKED names; None if there is none, it was replaced while opening or has an older format"""
+    pointer = read_pointer()
+    if pointer is None:
+        return None
+    try:
+        return PackedGallery(os.path.join(shared_dir(), pointer[0]))
+    except FileNotFoundError:
+        return None
+    except face_store.FaceStoreError as e:
+        print(f"Repacking the shared face gallery: {e}")
+        return None
+
+
+def _remove_superseded(keep):
+    for name in os.listdir(shared_dir()):
+        if name.startswith('packed-') and name not in keep:
+            try:
+                os.remove(os.path.join(shared_dir(), name))
+            except FileNotFoundError:
+                pass
+
+
+def repack(build_partitions, precision='float32'):
+    """
+    Publish a packed file, stored in `precision`, for the current store version
+    unless another process already did, and return the current PackedGallery.
+    build_partitions(slots) -> {company_id: float32 GalleryIndex} packs the
+    companies in the given version slots (every company if None); only the
+    slots that moved since the previous file are asked for.
+    """
+    global _build_counter
+
+    os.makedirs(shared_dir(), exist_ok=True)
+    with face_store._locked('pack'):
+        # Read before building: a change made meanwhile leaves the new file behind, and it is repacked again
+        version = face_store.read_version()
+        slot_versions = face_store.read_slot_versions()
+        pointer = read_pointer()
+        previous = _open_current()
+        if previous is not None and previous.precision != precision:
+            previous = None
+        if previous is not None and previous.version >= version:
+            return previous
+
+        changed = None
+        if previous is not None:
+            changed = set(np.flatnonzero(slot_versions != previous.slot_versions).tolist())
+            if len(changed) == face_store.VERSION_SLOTS:
+                changed = None  # everything moved (a rebuild or compaction): pack afresh and refit the codec
+        if changed is None:
+            partitions, codec = build_partitions(None), None
+        else:
+            partitions = {company_id: partition for company_id, partition in previous.partitions.items()
+                          if face_store.version_slot(company_id) not in changed}
+            partitions.update(build_partitions(changed))
+            codec = previous.codec
+        with _build_lock:
+            _build_counter += 1
+            name = f"packed-{version:012d}-{os.getpid()}-{_build_counter}.fgp"
+        write_packed(os.path.join(shared_dir(), name), partitions, version, precision, slot_versions, codec)
+        _write_pointer(name, version)
+        # Keep the previous file for workers that read PACKED just before the swap
+        _remove_superseded({name, pointer[0]} if pointer else {name})
+        print(f"Packed shared face gallery {name} (store version {version})")
+        packed = _open_current()
+    if packed is None:
+        raise face_store.FaceStoreError(f"{_pointer_path()}: packed gallery disappeared")
+    return packed
+
+
+def _repack_in_background(build_partitions, precision):
+    try:
+        repack(build_partitions, precision)
+    except Exception as e:
+        print(f"Repacking the shared face gallery failed: {e}")
+    finally:
+        connection.close()
+
+
+def attach(version, build_partitions, precision='float32', current=None, wait=False):
+    """
+    Return the newest PackedGallery stored in `precision`; current is the one
+    the caller maps already, returned as is while PACKED still names it. If
+    the file is older than store version `version`, a background thread
+    repacks it (see repack) and the older file is served until the new one is
+    published. Only without any usable file, or with wait, does the caller
+    pack one itself.
+    """
+    global _repack_thread
+
+    pointer = read_pointer()
+    if (current is not None and current.precision == precision and pointer is not None
+            and pointer[0] == os.path.basename(current.path)):
+        packed = current
+    else:
+        packed = _open_current()
+        if packed is not None and packed.precision != precision:
+            packed = None
+    if packed is None or (wait and packed.version < version):
+        return repack(build_partitions, precision)
+
+    if packed.version < version:
+        with _build_lock:
+            if _repack_thread is None or not _repack_thread.is_alive():
+                _repack_thread = threading.Thread(target=_repack_in_background, args=(build_partitions, precision),
+                                                  name='shared-gallery-repack', daemon=True)
+                _repack_thread.start()
+    return packed
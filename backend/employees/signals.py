@@ -0,0 +1,79 @@
+from django.db import transaction
+from django.db.models.signals import m2m_changed, post_delete, post_init, post_save, pre_delete
+from django.dispatch import receiver
+
+from . import face_store
+from .gallery import get_gallery
+from .last_login import pending_last_login
+from .login_profile import invalidate_login_profiles
+from .models import Employee, Project
+
+
+@receiver(post_init, sender=Employee)
+def remember_gallery_membership(sender, instance, **kwargs):
+    # Read through __dict__ so deferred fields are not fetched
+    instance._gallery_membership = (instance.__dict__.get('company_id'), instance.__dict__.get('is_active'))
+
+
+@receiver(post_init, sender=Employee)
+def apply_pending_last_login(sender, instance, **kwargs):
+    """Show a face login that has not been flushed to the database yet"""
+    if 'last_login' not in instance.__dict__ or instance.pk is None:
+        return
+    pending = pending_last_login(instance.pk)
+    if pending is not None and (instance.last_login is None or pending > instance.last_login):
+        instance.last_login = pending
+
+
+@receiver(post_save, sender=Employee)
+def refresh_gallery_membership(sender, instance, created, **kwargs):
+    """Re-partition the face gallery when an employee moves company or is (de)activated"""
+    membership = (instance.company_id, instance.is_active)
+    previous = getattr(instance, '_gallery_membership', None)
+    if not created and membership != previous:
+        companies = [instance.company_id, previous[0] if previous else None]
+
+        def publish():
+            # Other workers see the bump on their next face_login
+            face_store.bump_version(companies)
+            get_gallery().refresh()
+
+        transaction.on_commit(publish)
+    instance._gallery_membership = membership
+
+
+@receiver(post_delete, sender=Employee)
+def drop_gallery_encodings(sender, instance, **kwargs):
+    get_gallery().remove_employee(instance.pk)
+
+
+# ---------------- Login profile cache ----------------
+
+@receiver(post_save, sender=Employee)
+@receiver(post_delete, sender=Employee)
+def drop_employee_login_profile(sender, instance, **kwargs):
+    invalidate_login_profiles([instance.pk])
+
+
+@receiver(m2m_changed, sender=Project.employees.through)
+def drop_project_member_login_profiles(sender, instance, action, reverse, pk_set, **kwargs):
+    if action not in ('post_add', 'post_remove', 'pre_clear'):
+        return
+    if reverse:
+        # instance is the Employee whose projects changed
+        invalidate_login_profiles([instance.pk])
+    elif action == 'pre_clear':
+        invalidate_login_profiles(instance.employees.values_list('id', flat=True))
+    else:
+        invalidate_login_profiles(pk_set or [])
+
+
+@receiver(post_save, sender=Project)
+@receiver(pre_delete, sender=Project)
+def drop_project_login_profiles(sender, instance, **kwargs):
+    invalidate_login_profiles(instance.employees.values_list('id', flat=True))
+
+
+@receiver(post_save, sender='company.Company')
+def drop_company_login_profiles(sender, instance, **kwargs):
+    invalidate_login_profiles(Employee.objects.filter(company=instance).values_list('id', flat=True))
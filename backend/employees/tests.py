@@ -1,3 +1,1000 @@
-from django.test import TestCase
+import base64
+import io
+import json
+import os
+import shutil
+import tempfile
+import threading
+import time
+from concurrent.futures import Future
+from datetime import timedelta
+from unittest import mock
 
-# Create your tests here.
+import numpy as np
+from PIL import Image
+from django.core.files.uploadedfile import SimpleUploadedFile
+from django.core.management import call_command
+from django.core.management.base import CommandError
+from django.test import RequestFactory, SimpleTestCase, TestCase, TransactionTestCase, override_settings
+from django.utils import timezone
+from rest_framework.parsers import FormParser, JSONParser, MultiPartParser
+from rest_framework.request import Request
+
+from company.models import Company
+from employees import (emotion, enrollment, face_rebuild, face_store, last_login, login_profile, preprocess, quality,
+                       shared_gallery, views, write_behind)
+from employees.ann import IVFIndex
+from employees.exemplars import k_medoids, reduce_exemplars
+from employees.gallery import FaceGallery, GalleryIndex
+from employees.kiosk import KioskSession
+from employees.management.commands.rebuild_face_index import Command as RebuildCommand
+from employees.models import EmotionData, Employee, Project
+from employees.quantize import Codec
+from employees.uploads import ImageUploadError, request_image, request_images
+
+
+def encodings(seed, rows=2):
+    return np.random.default_rng(seed).normal(size=(rows, face_store.ENCODING_DIM)).astype(np.float32)
+
+
+def jpeg(seed, size=(64, 64)):
+    pixels = np.random.default_rng(seed).integers(0, 256, size=(size[1], size[0], 3), dtype=np.uint8)
+    buffer = io.BytesIO()
+    Image.fromarray(pixels).save(buffer, 'JPEG')
+    return buffer.getvalue()
+
+
+class MediaRootMixin:
+    """Runs each test against an empty MEDIA_ROOT"""
+
+    def setUp(self):
+        super().setUp()
+        self.media_root = tempfile.mkdtemp()
+        self.addCleanup(shutil.rmtree, self.media_root, ignore_errors=True)
+        media = override_settings(MEDIA_ROOT=self.media_root, FACE_STORE_COMPACT_RECORDS=0)
+        media.enable()
+        self.addCleanup(media.disable)
+
+
+class FakeFER:
+    """detect_emotions-only FER stand-in; answers 'happy' for every face"""
+
+    def __init__(self):
+        self.detect_calls = 0
+
+    def detect_emotions(self, image, face_rectangles=None):
+        self.detect_calls += 1
+        return [{'box': (0, 0, 10, 10), 'emotions': {'happy': 0.9, 'neutral': 0.1}}]
+
+
+class BatchingFER(FakeFER):
+    def __init__(self, scores):
+        super().__init__()
+        self.scores = scores
+        self.batches = []
+
+    def _classify_emotions(self, gray_faces):
+        self.batches.append(len(gray_faces))
+        return self.scores(len(gray_faces))
+
+
+class ClassifyEmotionsTests(SimpleTestCase):
+    def setUp(self):
+        self.images = [np.full((120, 120, 3), 128, dtype=np.uint8) for _ in range(3)]
+        self.boxes = [(20, 100, 100, 20)] * 3
+
+    def classify(self, model):
+        with mock.patch.object(emotion.registry, 'get', return_value=model):
+            return emotion.classify_emotions(self.images, self.boxes)
+
+    def test_one_batch_through_the_classifier(self):
+        surprise = np.eye(len(emotion.EMOTION_LABELS))[emotion.EMOTION_LABELS.index('surprise')]
+        model = BatchingFER(lambda n: np.tile(surprise, (n, 1)))
+        self.assertEqual(self.classify(model), [('surprise', 1.0)] * 3)
+        self.assertEqual(model.batches, [3])
+        self.assertEqual(model.detect_calls, 0)
+
+    def test_fallback_without_private_classifier(self):
+        model = FakeFER()
+        self.assertEqual(self.classify(model), [('happy', 0.9)] * 3)
+        self.assertEqual(model.detect_calls, 3)
+
+    def test_fallback_when_classifier_signature_changed(self):
+        def changed(gray_faces, batch_size):
+            raise AssertionError("not reached")
+
+        model = FakeFER()
+        model._classify_emotions = changed
+        self.assertEqual(self.classify(model), [('happy', 0.9)] * 3)
+        self.assertEqual(model.detect_calls, 3)
+
+    def test_fallback_on_unexpected_scores(self):
+        model = BatchingFER(lambda n: np.zeros((n, 3)))
+        self.assertEqual(self.classify(model), [('happy', 0.9)] * 3)
+        self.assertEqual(model.detect_calls, 3)
+
+
+class FaceStoreJournalTests(MediaRootMixin, SimpleTestCase):
+    def test_torn_tail_is_ignored_and_cut_by_the_next_append(self):
+        face_store.save_employee_encodings('a', encodings(1), 1)
+        face_store.save_employee_encodings('b', encodings(2), 1)
+        path = face_store.journal_path(face_store.current_generation())
+        valid_size = os.path.getsize(path)
+        # A writer that crashed half way through its record
+        record = face_store._pack_record(face_store.OP_PUT, 'c', 1, encodings(3))
+        with open(path, 'ab') as f:
+            f.write(record[:len(record) // 2])
+
+        self.assertEqual(sorted(face_store.open_store().employee_ids), ['a', 'b'])
+        self.assertEqual(face_store.read_journal(path)[1], valid_size)
+
+        face_store.save_employee_encodings('d', encodings(4), 1)
+        records, end = face_store.read_journal(path)
+        self.assertEqual([emp_id for _, emp_id, _, _ in records], ['a', 'b', 'd'])
+        self.assertEqual(end, os.path.getsize(path))
+
+    def test_corrupt_record_stops_replay(self):
+        face_store.save_employee_encodings('a', encodings(1), 1)
+        face_store.save_employee_encodings('b', encodings(2), 1)
+        path = face_store.journal_path(face_store.current_generation())
+        with open(path, 'r+b') as f:
+            f.seek(-1, os.SEEK_END)
+            last = f.read(1)
+            f.seek(-1, os.SEEK_END)
+            f.write(bytes([last[0] ^ 0xFF]))
+        self.assertEqual(face_store.open_store().employee_ids, ['a'])
+
+    def test_compaction_carries_over_records_appended_meanwhile(self):
+        face_store.save_employee_encodings('a', encodings(1), 1)
+        face_store.save_employee_encodings('b', encodings(2), 1)
+        write_segment = face_store.write_segment
+
+        def enroll_while_writing(*args, **kwargs):
+            face_store.save_employee_encodings('late', encodings(3), 2)
+            face_store.remove_employee_encodings('a')
+            return write_segment(*args, **kwargs)
+
+        with mock.patch.object(face_store, 'write_segment', enroll_while_writing):
+            generation = face_store.compact()
+
+        self.assertEqual(generation, 1)
+        store = face_store.open_store()
+        self.assertEqual(store.generation, 1)
+        self.assertEqual(store.journal_records, 2)
+        self.assertEqual(sorted(store.employee_ids), ['b', 'late'])
+        np.testing.assert_array_equal(store.to_mapping()['late'], encodings(3))
+        self.assertEqual(store.companies()['late'], 2)
+
+    def test_compaction_without_journal_records_is_a_no_op(self):
+        self.assertIsNone(face_store.compact())
+        face_store.replace_all({'a': encodings(1)}, {'a': 1})
+        self.assertIsNone(face_store.compact())
+
+
+class FaceStoreGenerationTests(MediaRootMixin, SimpleTestCase):
+    def setUp(self):
+        super().setUp()
+        for i in range(3):
+            face_store.save_employee_encodings(f'emp{i}', encodings(i), 1)
+        self.writing = threading.Event()
+        self.release = threading.Event()
+        write_segment = face_store.write_segment
+
+        def slow_first_write(*args, **kwargs):
+            if not self.writing.is_set():
+                self.writing.set()
+                self.release.wait(5)
+            return write_segment(*args, **kwargs)
+
+        patcher = mock.patch.object(face_store, 'write_segment', slow_first_write)
+        patcher.start()
+        self.addCleanup(patcher.stop)
+        self.addCleanup(self.release.set)
+
+    def start_compaction(self):
+        compaction = threading.Thread(target=face_store.compact)
+        compaction.start()
+        self.assertTrue(self.writing.wait(5))
+        return compaction
+
+    def test_enrollment_is_not_blocked_while_compacting(self):
+        compaction = self.start_compaction()
+        start = time.perf_counter()
+        face_store.save_employee_encodings('new', encodings(9), 1)
+        elapsed = time.perf_counter() - start
+        self.release.set()
+        compaction.join(5)
+        self.assertLess(elapsed, 2)
+        self.assertIn('new', face_store.open_store().employee_ids)
+
+    def test_replace_all_waits_for_a_running_compaction(self):
+        compaction = self.start_compaction()
+        rebuild = threading.Thread(target=face_store.replace_all, args=({'rebuilt': encodings(7)}, {'rebuilt': 1}))
+        rebuild.start()
+        rebuild.join(0.2)
+        self.assertTrue(rebuild.is_alive())
+
+        self.release.set()
+        compaction.join(5)
+        rebuild.join(5)
+        store = face_store.open_store()
+        self.assertEqual(store.employee_ids, ['rebuilt'])
+        self.assertEqual(store.generation, face_store.current_generation())
+        self.assertFalse(os.path.exists(face_store.segment_path(store.generation + 1)))
+
+
+class CompanyPartitionTests(MediaRootMixin, TestCase):
+    def setUp(self):
+        super().setUp()
+        self.company_a = Company.objects.create(name='A', email='a@example.com', password='x')
+        self.company_b = Company.objects.create(name='B', email='b@example.com', password='x')
+        self.alice = self.enroll(self.company_a, 'alice', 1)
+        self.bob = self.enroll(self.company_b, 'bob', 2)
+        self.carol = self.enroll(self.company_a, 'carol', 3, is_active=False)
+        self.gallery = FaceGallery(shared=False)
+
+    def enroll(self, company, name, seed, **fields):
+        employee = Employee.objects.create(company=company, first_name=name, last_name='L',
+                                           email=f'{name}@example.com', **fields)
+        face_store.save_employee_encodings(employee.pk, encodings(seed), company.pk)
+        return employee
+
+    def matches(self, seed, company_id):
+        return [emp_id for emp_id, _ in self.gallery.search(encodings(seed)[0], k=3, company_id=company_id)]
+
+    def test_login_only_searches_its_company(self):
+        self.assertEqual(self.matches(2, self.company_a.pk), [str(self.alice.pk)])
+        self.assertEqual(self.matches(1, self.company_b.pk), [str(self.bob.pk)])
+        self.assertEqual(self.matches(2, self.company_b.pk), [str(self.bob.pk)])
+
+    def test_inactive_employees_are_not_searchable(self):
+        self.assertNotIn(str(self.carol.pk), self.matches(3, self.company_a.pk))
+        self.assertNotIn(str(self.carol.pk), self.matches(3, None))
+        self.assertEqual(len(self.gallery.index()), 2)
+
+
+class RebuildCheckpointTests(MediaRootMixin, TestCase):
+    def setUp(self):
+        super().setUp()
+        self.company = Company.objects.create(name='A', email='a@example.com', password='x')
+        self.employees = []
+        for i in range(3):
+            employee = Employee.objects.create(company=self.company, first_name=f'emp{i}', last_name='L',
+                                               email=f'emp{i}@example.com')
+            face_store.save_employee_encodings(employee.pk, encodings(i), self.company.pk)
+            self.employees.append(str(employee.pk))
+        self.checkpoint = face_rebuild.Checkpoint()
+        self.encoded = []
+
+        def encode(command, checkpoint, batches, numbered_from, total_images, options):
+            for number, batch in enumerate(batches, start=numbered_from):
+                self.encoded.extend(emp_id for emp_id, _, _ in batch)
+                checkpoint.save_batch(number, [self.rebuilt(emp_id, company_id) for emp_id, company_id, _ in batch])
+
+        patcher = mock.patch.object(RebuildCommand, '_encode', encode)
+        patcher.start()
+        self.addCleanup(patcher.stop)
+
+    def rebuilt(self, emp_id, company_id):
+        return emp_id, company_id, encodings(100 + self.employees.index(emp_id)), 1, 1, 0
+
+    def rebuild(self, **options):
+        call_command('rebuild_face_index', workers=1, batch_size=1, stdout=io.StringIO(), **options)
+
+    def start_checkpoint(self):
+        self.checkpoint.start({'fingerprint': face_rebuild.fingerprint(), 'started': 'x'},
+                              face_store.employee_checksums())
+
+    def test_resumed_rebuild_only_encodes_unfinished_employees(self):
+        self.start_checkpoint()
+        self.checkpoint.save_batch(0, [self.rebuilt(self.employees[0], self.company.pk)])
+        generation = face_store.current_generation()
+
+        self.rebuild()
+
+        self.assertCountEqual(self.encoded, self.employees[1:])
+        store = face_store.open_store()
+        self.assertEqual(store.generation, generation + 1)
+        self.assertEqual(store.journal_records, 0)
+        self.assertFalse(os.path.exists(face_store.segment_path(generation)))
+        mapping = store.to_mapping()
+        for i, emp_id in enumerate(self.employees):
+            np.testing.assert_array_equal(mapping[emp_id], encodings(100 + i))
+        self.assertFalse(os.path.exists(self.checkpoint.path))
+
+    def test_swap_keeps_entries_changed_since_the_baseline(self):
+        self.start_checkpoint()
+        face_store.save_employee_encodings(self.employees[1], encodings(11), self.company.pk)
+        face_store.save_employee_encodings('enrolled', encodings(12), self.company.pk)
+        face_store.remove_employee_encodings(self.employees[2])
+
+        self.rebuild()
+
+        mapping = face_store.open_store().to_mapping()
+        self.assertCountEqual(mapping, [self.employees[0], self.employees[1], 'enrolled'])
+        np.testing.assert_array_equal(mapping[self.employees[0]], encodings(100))
+        np.testing.assert_array_equal(mapping[self.employees[1]], encodings(11))
+
+    def test_checkpoint_without_baseline_is_not_resumed(self):
+        self.start_checkpoint()
+        os.remove(os.path.join(self.checkpoint.path, 'baseline.json'))
+        with self.assertRaises(face_store.FaceStoreError):
+            self.checkpoint.baseline()
+        with self.assertRaisesMessage(CommandError, '--restart'):
+            self.rebuild()
+        self.assertEqual(self.encoded, [])
+
+        self.rebuild(restart=True)
+        self.assertCountEqual(self.encoded, self.employees)
+
+
+class IVFIndexTests(SimpleTestCase):
+    @classmethod
+    def setUpClass(cls):
+        super().setUpClass()
+        # Identities spread around a few dozen groups, two exemplars each, probes near the identities
+        rng = np.random.default_rng(0)
+        groups = rng.normal(size=(32, face_store.ENCODING_DIM))
+        identities = groups[rng.integers(len(groups), size=1000)]
+        identities += rng.normal(scale=0.35, size=identities.shape)
+        cls.exact = GalleryIndex.from_mapping({
+            f'emp{i}': identity + rng.normal(scale=0.05, size=(2, face_store.ENCODING_DIM))
+            for i, identity in enumerate(identities)
+        })
+        cls.probes = identities[:100] + rng.normal(scale=0.05, size=(100, face_store.ENCODING_DIM))
+
+    def build(self, **params):
+        return IVFIndex(nlist=32, nprobe=4, **params).build(self.exact.matrix, self.exact.row_labels())
+
+    def recall(self, ivf):
+        hits = [ivf.search(probe, k=1)[0][0] == self.exact.search(probe, k=1)[0][0] for probe in self.probes]
+        return np.mean(hits)
+
+    def test_recall_against_brute_force(self):
+        self.assertGreaterEqual(self.recall(self.build()), 0.95)
+        self.assertGreaterEqual(self.recall(self.build(pq_m=16)), 0.9)
+
+    def test_save_load_round_trip(self):
+        for params in ({}, {'pq_m': 16}):
+            with self.subTest(**params), tempfile.TemporaryDirectory() as folder:
+                ivf = self.build(**params)
+                path = os.path.join(folder, 'ivf.npz')
+                ivf.save(path, checksums=np.arange(3.0))
+                loaded = IVFIndex.load(path)
+                self.assertEqual(len(loaded), len(ivf))
+                np.testing.assert_array_equal(loaded.metadata['checksums'], np.arange(3.0))
+                for probe in self.probes[:20]:
+                    self.assertEqual(loaded.search(probe, k=3), ivf.search(probe, k=3))
+
+
+class QuantizedGalleryTests(SimpleTestCase):
+    def setUp(self):
+        rng = np.random.default_rng(0)
+        identities = rng.normal(size=(300, face_store.ENCODING_DIM))
+        identities /= np.linalg.norm(identities, axis=1, keepdims=True)
+        self.index = GalleryIndex.from_mapping({
+            f'emp{i}': identities[i] + rng.normal(scale=0.025, size=(3, face_store.ENCODING_DIM))
+            for i in range(len(identities))
+        })
+        self.probes = identities[:50] + rng.normal(scale=0.025, size=(50, face_store.ENCODING_DIM))
+
+    def assert_same_matches(self, precision, max_error):
+        quantized = self.index.quantized(Codec.fit(precision, self.index.matrix))
+        self.assertEqual(quantized.stored().dtype, np.dtype(precision))
+        for i, probe in enumerate(self.probes):
+            for shortlist in (None, 16):
+                expected = self.index.search(probe, k=3, shortlist=shortlist)
+                found = quantized.search(probe, k=3, shortlist=shortlist)
+                self.assertEqual(found[0][0], f'emp{i}')
+                self.assertEqual(found[0][0], expected[0][0])
+                self.assertAlmostEqual(found[0][1], expected[0][1], delta=max_error)
+
+    def test_float16_round_trip(self):
+        self.assert_same_matches('float16', 1e-3)
+
+    def test_int8_round_trip(self):
+        self.assert_same_matches('int8', 1e-2)
+
+    def test_int8_decode_stays_within_half_a_step(self):
+        codec = Codec.fit('int8', self.index.matrix)
+        decoded = codec.decode(codec.encode(self.index.matrix))
+        self.assertTrue(np.all(np.abs(decoded - self.index.matrix) <= codec.scale / 2 + 1e-6))
+
+    def test_subset_keeps_the_codec(self):
+        quantized = self.index.quantized(Codec.fit('int8', self.index.matrix))
+        subset = quantized.subset(np.arange(10))
+        self.assertEqual(subset.stored().dtype, np.int8)
+        self.assertEqual(subset.search(self.probes[3], k=1)[0][0], 'emp3')
+
+    def test_float32_needs_no_codec(self):
+        self.assertIsNone(Codec.fit('float32', self.index.matrix))
+        with self.assertRaises(ValueError):
+            Codec('float64')
+
+    def test_concat_keeps_a_shared_codec(self):
+        codec = Codec.fit('int8', self.index.matrix)
+        quantized = self.index.quantized(codec)
+        stacked = GalleryIndex.concat([quantized.subset(np.arange(100)), quantized.subset(np.arange(100, 300))])
+        self.assertIs(stacked.codec, codec)
+        self.assertEqual(stacked.stored().dtype, np.int8)
+        np.testing.assert_array_equal(stacked.stored(), quantized.stored())
+        self.assertEqual(stacked.search(self.probes[7], k=1), quantized.search(self.probes[7], k=1))
+
+    def test_concat_refuses_mixed_codecs(self):
+        int8 = self.index.subset(np.arange(100)).quantized(Codec.fit('int8', self.index.matrix))
+        rest = self.index.subset(np.arange(100, 200))
+        for other in (rest, rest.quantized(Codec('float16')), rest.quantized(Codec.fit('int8', rest.matrix))):
+            with self.assertRaises(ValueError):
+                GalleryIndex.concat([int8, other])
+
+
+class GalleryReloadTests(MediaRootMixin, TestCase):
+    def setUp(self):
+        super().setUp()
+        self.company_a = Company.objects.create(name='A', email='a@example.com', password='x')
+        self.company_b = Company.objects.create(name='B', email='b@example.com', password='x')
+        self.alice = self.enroll(self.company_a, 'alice', 1)
+        self.bob = self.enroll(self.company_b, 'bob', 2)
+        self.gallery = FaceGallery(shared=False)
+        self.gallery.load()
+
+    def enroll(self, company, name, seed):
+        employee = Employee.objects.create(company=company, first_name=name, last_name='L', email=f'{name}@example.com')
+        face_store.save_employee_encodings(employee.pk, encodings(seed), company.pk)
+        return employee
+
+    def test_only_changed_companies_are_queried_and_rebuilt(self):
+        partition_a = self.gallery.index(self.company_a.pk)
+        queried = []
+        membership = self.gallery._membership
+
+        def recording_membership(slots=None):
+            queried.append(slots)
+            return membership(slots)
+
+        self.gallery._membership = recording_membership
+        carol = self.enroll(self.company_b, 'carol', 3)
+        self.assertTrue(self.gallery.check_version())
+
+        self.assertEqual(queried, [{face_store.version_slot(self.company_b.pk)}])
+        self.assertIs(self.gallery.index(self.company_a.pk), partition_a)
+        self.assertCountEqual(self.gallery.index(self.company_b.pk).labels(), [str(self.bob.pk), str(carol.pk)])
+        self.assertEqual(self.gallery.search(encodings(3)[0], company_id=None)[0][0], str(carol.pk))
+        self.assertEqual(len(self.gallery.index()), 3)
+
+    def test_quantized_partitions_keep_their_codec(self):
+        with override_settings(FACE_GALLERY_PRECISION='int8'):
+            self.gallery.load()
+            codec = self.gallery.index().codec
+            self.enroll(self.company_b, 'carol', 3)
+            self.gallery.check_version()
+        self.assertIs(self.gallery.index(self.company_b.pk).codec, codec)
+        self.assertIs(self.gallery.index().codec, codec)
+
+
+class SharedGalleryRepackTests(MediaRootMixin, SimpleTestCase):
+    def setUp(self):
+        super().setUp()
+        self.members = {'a1': 1, 'a2': 1, 'b1': 2}
+        for seed, (emp_id, company_id) in enumerate(self.members.items()):
+            face_store.save_employee_encodings(emp_id, encodings(seed), company_id)
+        self.gallery = FaceGallery(membership=lambda slots=None: dict(self.members), shared=True)
+        self.requested = []
+        build = self.gallery._company_partitions
+
+        def recording_build(store, slots=None):
+            self.requested.append(slots)
+            return build(store, slots)
+
+        self.gallery._company_partitions = recording_build
+        self.gallery.load()
+
+    def wait_for_repack(self):
+        if shared_gallery._repack_thread is not None:
+            shared_gallery._repack_thread.join(10)
+
+    def test_stale_file_is_served_while_the_change_is_packed_in_the_background(self):
+        first = self.gallery._packed
+        self.members['b2'] = 2
+        face_store.save_employee_encodings('b2', encodings(9), 2)
+        release = threading.Event()
+        repack = shared_gallery.repack
+
+        def held_repack(*args, **kwargs):
+            release.wait(5)
+            return repack(*args, **kwargs)
+
+        with mock.patch.object(shared_gallery, 'repack', held_repack):
+            self.assertTrue(self.gallery.check_version())
+            self.assertIs(self.gallery._packed, first)
+            self.assertNotIn('b2', self.gallery.index(2).labels())
+            release.set()
+            self.wait_for_repack()
+
+        self.gallery.check_version()
+        self.assertIsNot(self.gallery._packed, first)
+        self.assertCountEqual(self.gallery.index(2).labels(), ['b1', 'b2'])
+        self.assertEqual(self.gallery.search(encodings(9)[0], company_id=2)[0][0], 'b2')
+        # Company 1 was copied over from the previous file, only company 2's slot was rebuilt
+        self.assertEqual(self.requested, [None, {face_store.version_slot(2)}])
+        self.assertCountEqual(self.gallery.index(1).labels(), ['a1', 'a2'])
+
+    def test_quantized_file_keeps_its_codec_across_repacks(self):
+        with override_settings(FACE_GALLERY_PRECISION='int8'):
+            self.gallery.load()
+            codec = self.gallery._packed.codec
+            face_store.save_employee_encodings('a1', encodings(7), 1)
+            self.gallery.check_version()
+            self.wait_for_repack()
+            self.gallery.check_version()
+        self.assertEqual(self.gallery._packed.precision, 'int8')
+        self.assertEqual(self.gallery._packed.codec, codec)
+        self.assertEqual(self.gallery.search(encodings(7)[0], company_id=1)[0][0], 'a1')
+
+
+@override_settings(FACE_ENROLL_WORKERS=2)
+class EnrollmentPoolTests(SimpleTestCase):
+    def setUp(self):
+        self.addCleanup(enrollment._reset_pool)
+
+    def test_results_in_input_order_with_per_image_errors(self):
+        images = [jpeg(0), b'not an image', jpeg(1), io.BytesIO(jpeg(2))]
+        results = enrollment.encode_images(images)
+
+        self.assertIsNotNone(enrollment._pool)
+        self.assertEqual([result['index'] for result in results], [0, 1, 2, 3])
+        self.assertIsNotNone(results[1]['error'])
+        self.assertFalse(results[1]['face_found'])
+        self.assertIsNone(results[1]['encoding'])
+        for i, data in ((0, jpeg(0)), (2, jpeg(1)), (3, jpeg(2))):
+            with self.subTest(index=i):
+                self.assertIsNone(results[i]['error'])
+                self.assertTrue(results[i]['face_found'])
+                np.testing.assert_allclose(results[i]['encoding'], enrollment.encode_image(i, data)['encoding'])
+        # File-like inputs are rewound for the caller
+        self.assertEqual(images[3].tell(), 0)
+
+
+@override_settings(FACE_DETECT_MAX_SIDE=320, FACE_CROP_MARGIN=0.25)
+class AnalyzeFrameTests(SimpleTestCase):
+    def setUp(self):
+        self.image = np.zeros((960, 1280, 3), dtype=np.uint8)
+        self.model = mock.Mock()
+        self.model.face_locations.return_value = [(10, 60, 50, 20), (0, 320, 240, 300)]
+        self.model.face_encodings.return_value = [np.ones(face_store.ENCODING_DIM)]
+        patcher = mock.patch('employees.preprocess.face_recognition', self.model)
+        patcher.start()
+        self.addCleanup(patcher.stop)
+
+    def test_boxes_found_on_the_downscaled_copy_map_back_to_full_resolution(self):
+        seen = []
+        frame = preprocess.analyze_frame(self.image, on_detect=seen.append)
+
+        detected_on = self.model.face_locations.call_args[0][0]
+        self.assertEqual(detected_on.shape, (240, 320, 3))
+        self.assertEqual(frame['locations'], [(40, 240, 200, 80), (0, 1280, 960, 1200)])
+        self.assertEqual(seen, [frame['locations']])
+        self.assertEqual(len(frame['encodings']), 1)
+        self.assertIn('detect_ms', frame['timings'])
+        self.assertIn('encode_ms', frame['timings'])
+
+        # Only the first face is encoded, from its full-resolution crop with the margin
+        crop, boxes = self.model.face_encodings.call_args[0]
+        self.assertEqual(crop.shape, (240, 240, 3))
+        self.assertEqual(boxes, [(40, 200, 200, 40)])
+
+    def test_small_frames_are_not_downscaled(self):
+        small = np.zeros((240, 320, 3), dtype=np.uint8)
+        self.model.face_locations.return_value = [(10, 60, 50, 20)]
+        frame = preprocess.analyze_frame(small, encode=False)
+        self.assertIs(self.model.face_locations.call_args[0][0], small)
+        self.assertEqual(frame['locations'], [(10, 60, 50, 20)])
+        self.assertEqual(frame['encodings'], [])
+        self.model.face_encodings.assert_not_called()
+
+    @override_settings(FACE_DECODE_MAX_SIDE=640)
+    def test_large_jpegs_are_decoded_at_a_reduced_scale(self):
+        self.assertEqual(preprocess.decode_frame(jpeg(0, size=(2560, 1920))).shape, (480, 640, 3))
+
+
+class FaceLoginEmotionJobTests(SimpleTestCase):
+    factory = RequestFactory()
+
+    def setUp(self):
+        self.job = (Future(), time.perf_counter())
+        self.gallery = mock.Mock()
+        self.gallery.index.return_value = [object()]
+        patches = [
+            mock.patch('employees.views.get_gallery', return_value=self.gallery),
+            mock.patch('employees.views.submit_emotion_detection', return_value=self.job),
+        ]
+        for patcher in patches:
+            patcher.start()
+            self.addCleanup(patcher.stop)
+
+    def login(self):
+        body = json.dumps({'image': 'data:image/jpeg;base64,' + base64.b64encode(jpeg(0)).decode()})
+        return views.face_login(self.factory.post('/', body, content_type='application/json'))
+
+    def test_job_is_cancelled_when_nobody_matches(self):
+        self.gallery.search.return_value = [('someone', 5.0)]
+        self.assertEqual(self.login().status_code, 401)
+        self.assertTrue(self.job[0].cancelled())
+
+    def test_job_is_cancelled_when_the_face_cannot_be_encoded(self):
+        def detected_but_not_encoded(image, timings=None, on_detect=None):
+            on_detect([(0, 10, 10, 0)])
+            return {'image': image, 'locations': [(0, 10, 10, 0)], 'encodings': [], 'timings': {}}
+
+        with mock.patch('employees.views.analyze_frame', detected_but_not_encoded):
+            self.assertEqual(self.login().status_code, 400)
+        self.assertTrue(self.job[0].cancelled())
+
+
+class WriteBehindTests(MediaRootMixin, TransactionTestCase):
+    def setUp(self):
+        super().setUp()
+        company = Company.objects.create(name='C', email='c@example.com', password='x')
+        self.alice = Employee.objects.create(company=company, first_name='A', last_name='L', email='a@example.com')
+        self.bob = Employee.objects.create(company=company, first_name='B', last_name='L', email='b@example.com')
+
+    def snapshot(self, employee, n):
+        return {'employee_id': employee.id, 'emotion': 'happy', 'confidence': 0.9, 'context': 'login',
+                'image_bytes': b'jpeg', 'image_name': f'emotions/snapshot_{n}.jpg'}
+
+    def stored_images(self):
+        folder = os.path.join(self.media_root, 'emotions')
+        return sorted(os.listdir(folder)) if os.path.isdir(folder) else []
+
+    def test_snapshots_of_deleted_employees_are_skipped(self):
+        snapshots = [self.snapshot(self.alice, 0), self.snapshot(self.bob, 1), self.snapshot(self.alice, 2)]
+        self.bob.delete()
+        self.assertEqual(write_behind.write_snapshots(snapshots), 2)
+        self.assertEqual(EmotionData.objects.count(), 2)
+        self.assertEqual(self.stored_images(), ['snapshot_0.jpg', 'snapshot_2.jpg'])
+
+    def test_failed_batch_insert_falls_back_to_single_rows(self):
+        snapshots = [self.snapshot(self.alice, 0), self.snapshot(self.bob, 1), self.snapshot(self.alice, 2)]
+        save = write_behind.default_storage.save
+
+        def delete_bob_meanwhile(name, content):
+            # The employee disappears after the existence check: the batch insert hits the foreign key
+            if name.endswith('snapshot_2.jpg'):
+                Employee.objects.filter(id=self.bob.id).delete()
+            return save(name, content)
+
+        with mock.patch.object(write_behind.default_storage, 'save', delete_bob_meanwhile):
+            self.assertEqual(write_behind.write_snapshots(snapshots), 2)
+        self.assertEqual(sorted(EmotionData.objects.values_list('employee_id', flat=True)), [self.alice.id] * 2)
+        self.assertEqual(self.stored_images(), ['snapshot_0.jpg', 'snapshot_2.jpg'])
+
+    def test_worker_counts_rows_not_batches(self):
+        writer = write_behind.EmotionWriteBehind(flush_interval=0.01)
+        snapshots = [self.snapshot(self.alice, 0), self.snapshot(self.bob, 1)]
+        self.bob.delete()
+        writer._write(snapshots)
+        self.assertEqual(writer.stats()['written'], 1)
+        self.assertEqual(writer.stats()['failed'], 1)
+
+    def test_unexpected_error_removes_the_stored_images(self):
+        with mock.patch.object(EmotionData.objects, 'bulk_create', side_effect=RuntimeError('database down')):
+            with self.assertRaises(RuntimeError):
+                write_behind.write_snapshots([self.snapshot(self.alice, 0)])
+        self.assertEqual(self.stored_images(), [])
+
+
+class LastLoginTests(TestCase):
+    def setUp(self):
+        company = Company.objects.create(name='C', email='c@example.com', password='x')
+        self.employee = Employee.objects.create(company=company, first_name='A', last_name='L', email='a@example.com')
+        # A recorder whose background thread does not flush during the test
+        recorder = last_login.LastLoginRecorder(flush_interval=3600)
+        patcher = mock.patch.object(last_login, '_recorder', recorder)
+        patcher.start()
+        self.addCleanup(patcher.stop)
+        self.recorder = recorder
+
+    def stored_last_login(self):
+        return Employee.objects.filter(pk=self.employee.pk).values_list('last_login', flat=True).get()
+
+    def test_flush_writes_the_latest_login_only(self):
+        updated_at = Employee.objects.get(pk=self.employee.pk).updated_at
+        now = timezone.now()
+        last_login.record_login(self.employee.pk, now)
+        last_login.record_login(self.employee.pk, now - timedelta(minutes=5))
+        self.assertIsNone(self.stored_last_login())
+
+        self.assertEqual(self.recorder.flush(), 1)
+        self.assertEqual(self.stored_last_login(), now)
+        self.assertEqual(Employee.objects.get(pk=self.employee.pk).updated_at, updated_at)
+        self.assertEqual(self.recorder.stats()['pending'], 0)
+
+    def test_loaded_employees_show_the_pending_login(self):
+        now = timezone.now()
+        last_login.record_login(self.employee.pk, now)
+        self.assertEqual(Employee.objects.get(pk=self.employee.pk).last_login, now)
+
+        # A newer value already in the database is not overlaid with an older pending one
+        later = now + timedelta(minutes=1)
+        Employee.objects.filter(pk=self.employee.pk).update(last_login=later)
+        self.assertEqual(Employee.objects.get(pk=self.employee.pk).last_login, later)
+
+
+class LoginProfileCacheTests(TestCase):
+    def setUp(self):
+        self.company = Company.objects.create(name='Acme', email='c@example.com', password='x')
+        self.employee = Employee.objects.create(company=self.company, first_name='A', last_name='L',
+                                                email='a@example.com', designation='Engineer')
+        login_profile._cache().clear()
+        self.addCleanup(login_profile._cache().clear)
+
+    def profile(self):
+        return login_profile.get_login_profile(self.employee.pk)
+
+    def test_profile_is_cached(self):
+        self.assertEqual(self.profile()['designation'], 'Engineer')
+        with self.assertNumQueries(0):
+            self.assertEqual(self.profile()['designation'], 'Engineer')
+
+    def test_saving_the_employee_invalidates_it(self):
+        self.profile()
+        self.employee.designation = 'Lead'
+        self.employee.save()
+        self.assertEqual(self.profile()['designation'], 'Lead')
+
+    def test_saving_the_company_invalidates_it(self):
+        self.profile()
+        self.company.name = 'Acme Corp'
+        self.company.save()
+        self.assertEqual(self.profile()['company'], 'Acme Corp')
+
+    def test_project_membership_invalidates_it(self):
+        self.profile()
+        project = Project.objects.create(company=self.company, name='Apollo', status='active')
+        project.employees.add(self.employee)
+        self.assertEqual([p['name'] for p in self.profile()['current_projects']], ['Apollo'])
+
+
+class KioskResetTests(SimpleTestCase):
+    def test_reset_waits_for_the_next_frame(self):
+        session = KioskSession()
+        session.track = object()
+        session.reset()
+        self.assertIsNotNone(session.track)
+
+        def frame_without_faces(data):
+            return np.zeros((8, 8, 3), dtype=np.uint8)
+
+        with mock.patch('employees.kiosk.decode_frame', frame_without_faces), \
+                mock.patch('employees.kiosk.detect_faces', return_value=[]), \
+                override_settings(FACE_QUALITY_GATE=False):
+            session.process(b'frame')
+        self.assertIsNone(session.track)
+
+
+@override_settings(FACE_QUALITY_GATE=False, FACE_KIOSK_VOTE_FRAMES=1, FACE_KIOSK_VOTE_MIN=1,
+                   FACE_KIOSK_REVERIFY_FRAMES=3, FACE_KIOSK_REVERIFY_SECONDS=60)
+class KioskReverifyTests(SimpleTestCase):
+    def setUp(self):
+        self.gallery = mock.Mock()
+        patches = [
+            mock.patch('employees.kiosk.decode_frame', return_value=np.zeros((8, 8, 3), dtype=np.uint8)),
+            mock.patch('employees.kiosk.detect_faces', return_value=[(0, 100, 100, 0)]),
+            mock.patch('employees.kiosk.encode_faces', return_value=[np.zeros(face_store.ENCODING_DIM)]),
+            mock.patch('employees.kiosk.get_gallery', return_value=self.gallery),
+            mock.patch('employees.kiosk.get_login_profile', side_effect=lambda emp_id: {'employee_id': emp_id}),
+            mock.patch('employees.kiosk.record_login'),
+        ]
+        for patcher in patches:
+            patcher.start()
+            self.addCleanup(patcher.stop)
+        self.session = KioskSession()
+
+    def process(self, count, *results):
+        """Process count frames; the gallery answers results, in order, for the frames that get encoded"""
+        self.gallery.search.side_effect = [[result] for result in results]
+        return [self.session.process(b'frame') for _ in range(count)]
+
+    def types(self, replies):
+        return [[message['type'] for message in reply] for reply in replies]
+
+    def test_tracked_match_is_confirmed_every_few_frames(self):
+        replies = self.process(4, ('alice', 0.3), ('alice', 0.3))
+        self.assertEqual(self.types(replies), [['match'], [], [], []])
+        self.assertEqual(self.gallery.search.call_count, 2)
+        self.assertEqual(self.session.counters['reverified'], 1)
+        self.assertEqual(self.session.track.match, 'alice')
+
+    def test_someone_else_in_the_tracked_spot_drops_the_track(self):
+        replies = self.process(4, ('alice', 0.3), ('bob', 0.3))
+        self.assertEqual(self.types(replies), [['match'], [], [], ['lost', 'match']])
+        self.assertEqual(replies[3][1]['employee_id'], 'bob')
+        self.assertEqual(self.session.counters['swapped'], 1)
+
+    def test_unknown_face_in_the_tracked_spot_is_not_credited(self):
+        replies = self.process(4, ('alice', 0.3), ('alice', 0.9))
+        self.assertEqual(self.types(replies), [['match'], [], [], ['lost']])
+        self.assertIsNone(self.session.track.match)
+
+    @override_settings(FACE_KIOSK_REVERIFY_SECONDS=0)
+    def test_time_budget_forces_a_check(self):
+        self.session = KioskSession()
+        self.process(2, ('alice', 0.3), ('alice', 0.3))
+        self.assertEqual(self.gallery.search.call_count, 2)
+
+
+class DuplicateFaceTests(MediaRootMixin, TestCase):
+    factory = RequestFactory()
+
+    def setUp(self):
+        super().setUp()
+        self.company = Company.objects.create(name='A', email='a@example.com', password='x')
+        self.alice = Employee.objects.create(company=self.company, first_name='alice', last_name='L',
+                                            email='alice@example.com')
+        face_store.save_employee_encodings(self.alice.pk, encodings(1), self.company.pk)
+        self.gallery = FaceGallery(shared=False)
+        self.faces = encodings(1, rows=3)
+        patches = [
+            mock.patch('employees.views.get_gallery', return_value=self.gallery),
+            mock.patch('employees.duplicates.get_gallery', return_value=self.gallery),
+            mock.patch('employees.views.FACE_RECOGNITION_AVAILABLE', True),
+            mock.patch('employees.views.encode_images', lambda images: [
+                {'face_found': True, 'encoding': face} for face in self.faces]),
+        ]
+        for patcher in patches:
+            patcher.start()
+            self.addCleanup(patcher.stop)
+
+    def register(self):
+        body = json.dumps({
+            'first_name': 'bob', 'last_name': 'L', 'email': 'bob@example.com', 'password': 'password123',
+            'company_id': self.company.pk,
+            'face_images': ['data:image/jpeg;base64,' + base64.b64encode(jpeg(i)).decode() for i in range(3)],
+        })
+        return views.employee_register(self.factory.post('/', body, content_type='application/json'))
+
+    def test_reject_mode_refuses_a_face_enrolled_for_someone_else(self):
+        with override_settings(FACE_DUPLICATE_CHECK='reject'):
+            response = self.register()
+        self.assertEqual(response.status_code, 409)
+        self.assertFalse(Employee.objects.filter(email='bob@example.com').exists())
+        self.assertEqual(face_store.open_store().employee_ids, [str(self.alice.pk)])
+
+    def test_flag_mode_enrolls_and_reports_the_duplicate(self):
+        with override_settings(FACE_DUPLICATE_CHECK='flag'):
+            response = self.register()
+        self.assertEqual(response.status_code, 201)
+        self.assertTrue(response.data['duplicate_face'])
+        self.assertIn(response.data['employee_id'], face_store.open_store().employee_ids)
+
+    def test_a_new_face_is_not_a_duplicate(self):
+        self.faces = encodings(2, rows=3)
+        with override_settings(FACE_DUPLICATE_CHECK='reject'):
+            response = self.register()
+        self.assertEqual(response.status_code, 201)
+        self.assertFalse(response.data['duplicate_face'])
+
+
+@override_settings(FACE_UPLOAD_MAX_BYTES=1000)
+class UploadLimitTests(SimpleTestCase):
+    factory = RequestFactory()
+
+    def data_url(self, size):
+        return 'data:image/jpeg;base64,' + base64.b64encode(b'x' * size).decode()
+
+    def raw(self, size, content_length=True):
+        request = self.factory.post('/', data=b'x' * size, content_type='image/jpeg')
+        if not content_length:
+            del request.META['CONTENT_LENGTH']
+        return request_image(Request(request))
+
+    def multipart(self, size):
+        request = self.factory.post('/', {'image': SimpleUploadedFile('a.jpg', b'x' * size, 'image/jpeg')})
+        return request_image(Request(request, parsers=[MultiPartParser(), FormParser()]))
+
+    def json(self, size):
+        request = self.factory.post('/', json.dumps({'image': self.data_url(size)}), content_type='application/json')
+        return request_image(Request(request, parsers=[JSONParser()]))
+
+    def json_list(self, size):
+        body = json.dumps({'face_images': [self.data_url(10), self.data_url(size)]})
+        request = self.factory.post('/', body, content_type='application/json')
+        return request_images(Request(request, parsers=[JSONParser()]))[-1]
+
+    def multipart_list(self, size):
+        parts = [SimpleUploadedFile('a.jpg', b'x' * 10, 'image/jpeg'),
+                 SimpleUploadedFile('b.jpg', b'x' * size, 'image/jpeg')]
+        request = self.factory.post('/', {'face_images': parts})
+        return request_images(Request(request, parsers=[MultiPartParser(), FormParser()]), 'face_images')[-1]
+
+    def test_every_input_path(self):
+        paths = {
+            'raw': self.raw,
+            'raw without Content-Length': lambda size: self.raw(size, content_length=False),
+            'multipart': self.multipart,
+            'json': self.json,
+            'json list': self.json_list,
+            'multipart list': self.multipart_list,
+        }
+        for name, read in paths.items():
+            with self.subTest(name):
+                self.assertEqual(len(read(1000)), 1000)
+                with self.assertRaises(ImageUploadError):
+                    read(1001)
+
+
+class ExemplarTests(SimpleTestCase):
+    def setUp(self):
+        rng = np.random.default_rng(0)
+        centers = rng.normal(size=(3, face_store.ENCODING_DIM))
+        self.points = np.concatenate([center + rng.normal(scale=0.01, size=(10, face_store.ENCODING_DIM))
+                                      for center in centers])
+
+    def test_one_medoid_per_cluster(self):
+        medoids = k_medoids(self.points, 3)
+        self.assertEqual(medoids.tolist(), sorted(medoids.tolist()))
+        self.assertEqual(sorted(medoids // 10), [0, 1, 2])
+
+    def test_reduced_set_is_bounded_and_made_of_real_exemplars(self):
+        for limit in (1, 3, 5):
+            with self.subTest(limit=limit):
+                kept = reduce_exemplars(self.points, limit)
+                self.assertLessEqual(len(kept), limit)
+                self.assertGreaterEqual(len(kept), 1)
+                for exemplar in kept:
+                    self.assertTrue(np.any(np.all(self.points == exemplar, axis=1)))
+
+    @override_settings(FACE_MAX_EXEMPLARS=5)
+    def test_small_sets_are_kept_whole(self):
+        self.assertEqual(len(reduce_exemplars(self.points[:4])), 4)
+        self.assertEqual(len(reduce_exemplars(self.points)), 5)
+        self.assertEqual(len(k_medoids(self.points[:2], 5)), 2)
+
+
+class QualityGateTests(SimpleTestCase):
+    def frame(self, values):
+        return np.clip(values, 0, 255).astype(np.uint8)
+
+    def textured(self, mean, spread=60, color=(1.0, 1.0, 1.0), seed=0):
+        noise = np.random.default_rng(seed).normal(mean, spread, size=(240, 320, 1))
+        return self.frame(noise * np.array(color))
+
+    def test_threshold_reasons(self):
+        smooth = np.tile(np.linspace(40, 220, 320), (240, 1))[..., None].repeat(3, axis=2)
+        cases = {
+            'dark': (self.textured(8, spread=4), quality.TOO_DARK),
+            'bright': (self.textured(250, spread=4), quality.TOO_BRIGHT),
+            'flat': (self.frame(np.full((240, 320, 3), 128)), quality.LOW_CONTRAST),
+            'smooth': (self.frame(smooth), quality.TOO_BLURRY),
+            'textured': (self.textured(120), None),
+        }
+        for name, (image, reason) in cases.items():
+            with self.subTest(name):
+                result = quality.check_frame(image)
+                self.assertEqual(result['reason'], reason)
+                self.assertEqual(result['ok'], reason is None)
+
+    def test_dim_login_frames_pass_the_defaults(self):
+        # The darkest successful login snapshots: mean brightness ~18, contrast ~5
+        self.assertTrue(quality.check_frame(self.textured(18, spread=6))['ok'])
+
+    def test_skin_check_is_opt_in(self):
+        gray = self.textured(120)
+        self.assertTrue(quality.check_frame(gray)['ok'])
+        with override_settings(FACE_QUALITY_THRESHOLDS={'min_skin_ratio': 0.02}):
+            self.assertEqual(quality.check_frame(gray)['reason'], quality.NO_FACE)
+            skin = self.textured(150, spread=30, color=(1.0, 0.75, 0.6))
+            self.assertTrue(quality.check_frame(skin)['ok'])
+
+    def test_timing_is_recorded(self):
+        timings = {}
+        quality.check_frame(self.textured(120), timings=timings)
+        self.assertIn('quality_ms', timings)
+
+    def test_gate_defaults_per_source(self):
+        with override_settings():
+            from django.conf import settings
+            del settings.FACE_QUALITY_GATE
+            del settings.FACE_LOGIN_QUALITY_GATE
+            self.assertTrue(quality.gate_enabled('kiosk'))
+            self.assertFalse(quality.gate_enabled('face_login'))
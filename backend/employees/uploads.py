@@ -0,0 +1,98 @@
+"""
+Image payloads of face_login, capture_emotion and employee_register.
+
+Each endpoint accepts its images in three forms:
+
+    raw body    Content-Type: image/jpeg (or any image/*) with the frame as the
+                request body; other fields go in the query string
+    multipart   file parts (image, or face_images for employee_register)
+    JSON        base64 data URLs, the original API, kept for compatibility
+
+The raw and multipart forms skip the ~1.33x base64 string, its decode and the
+data URL split; the bytes are handed on as a memoryview that the decoder reads
+in place (see preprocess.frame_stream). In every form an image larger than
+FACE_UPLOAD_MAX_BYTES raises ImageUploadError, which the views answer with 413.
+"""
+import base64
+
+from django.conf import settings
+
+
+class ImageUploadError(Exception):
+    pass
+
+
+def is_raw_image(request):
+    return request.content_type.split(';')[0].strip().lower().startswith('image/')
+
+
+def request_fields(request):
+    """Non-image fields: the query string for raw bodies, the parsed body otherwise"""
+    if is_raw_image(request):
+        return request.query_params
+    return request.data
+
+
+def upload_limit():
+    return getattr(settings, 'FACE_UPLOAD_MAX_BYTES', 10 * 1024 * 1024)
+
+
+def _check_size(size, limit):
+    if size > limit:
+        raise ImageUploadError(f"image larger than {limit} bytes")
+
+
+def decode_data_url(value):
+    """Bytes of a base64 data URL (or of a bare base64 string)"""
+    # The 'data:image/jpeg;base64,' header is short; do not scan the whole payload for it
+    comma = value.find(',', 0, 64)
+    data = base64.b64decode(value[comma + 1:] if comma >= 0 else value)
+    _check_size(len(data), upload_limit())
+    return data
+
+
+def _read_raw_body(request):
+    limit = upload_limit()
+    try:
+        length = int(request.META.get('CONTENT_LENGTH') or 0)
+    except ValueError:
+        length = 0
+    _check_size(length, limit)
+    # Read the stream directly: request.body would also enforce DATA_UPLOAD_MAX_MEMORY_SIZE (2.5 MB).
+    # Without a Content-Length, one byte past the limit tells an oversized body from one that fits.
+    data = request._request.read(limit + 1) if length <= 0 else request._request.read(length)
+    _check_size(len(data), limit)
+    return data
+
+
+def _read_upload(upload):
+    _check_size(upload.size, upload_limit())
+    return memoryview(upload.read())
+
+
+def request_image(request, field='image'):
+    """
+    Return the uploaded image as a memoryview, or None if the request has none.
+    Raises ImageUploadError for an image larger than FACE_UPLOAD_MAX_BYTES, in any of the three forms.
+    """
+    if is_raw_image(request):
+        data = _read_raw_body(request)
+        return memoryview(data) if data else None
+    upload = request.FILES.get(field)
+    if upload is not None:
+        return _read_upload(upload)
+    value = request.data.get(field)
+    if not value:
+        return None
+    return memoryview(decode_data_url(value))
+
+
+def request_images(request, field='face_images'):
+    """Return every image of a multi-image field as memoryviews (multipart parts or JSON data URLs)"""
+    uploads = request.FILES.getlist(field) if hasattr(request.FILES, 'getlist') else []
+    if uploads:
+        return [_read_upload(upload) for upload in uploads]
+    values = request.data.get(field)
+    if not isinstance(values, list):
+        return values
+    return [memoryview(decode_data_url(value)) for value in values]
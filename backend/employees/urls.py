@@ -11,6 +11,8 @@ urlpatterns = [
     # Emotion detection endpoints
     path('<uuid:employee_id>/emotion-analytics/', views.employee_emotion_analytics, name='employee-emotion-analytics'),
     path('<uuid:employee_id>/capture-emotion/', views.capture_emotion, name='capture-emotion'),
+    path('emotion-write-behind/stats/', views.emotion_write_behind_stats, name='emotion-write-behind-stats'),
+    path('models/status/', views.model_status, name='model-status'),
     
     # New AI-powered endpoints
     path('analyze-resume/', views.analyze_resume, name='analyze-resume'),
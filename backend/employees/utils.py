@@ -1,9 +1,9 @@
 import os
-import pickle
-import numpy as np
-import face_recognition
 from django.conf import settings
 
+from .enrollment import encode_images
+from .gallery import get_gallery
+
 def _list_face_paths(emp_id):
     folder = os.path.join(settings.MEDIA_ROOT, 'faces', str(emp_id))
     if not os.path.exists(folder):
@@ -12,29 +12,18 @@ def _list_face_paths(emp_id):
     return files
 
 def update_encodings_for_employee(emp_id):
-    enc_path = os.path.join(settings.MEDIA_ROOT, 'encodings.pkl')
     face_files = _list_face_paths(emp_id)
-    encs = []
-
+    images = []
     for p in face_files:
-        img = face_recognition.load_image_file(p)
-        e = face_recognition.face_encodings(img)
-        if e:
-            encs.append(e[0])
+        with open(p, 'rb') as f:
+            images.append(f.read())
+
+    encs = [result['encoding'] for result in encode_images(images) if result['face_found']]
 
     if not encs:
         raise ValueError("No valid face encodings for employee")
 
-    avg = np.mean(encs, axis=0).tolist()
-
-    mapping = {}
-    if os.path.exists(enc_path):
-        with open(enc_path, 'rb') as f:
-            mapping = pickle.load(f)
-
-    mapping[str(emp_id)] = avg
-
-    with open(enc_path, 'wb') as f:
-        pickle.dump(mapping, f)
+    # Stored as a centroid plus up to FACE_MAX_EXEMPLARS exemplars, like every other enrollment path
+    get_gallery().set_employee(emp_id, encs)
 
     return True
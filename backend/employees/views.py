@@ -1,7 +1,6 @@
 import os
 import uuid
 import base64
-import pickle
 import numpy as np
 import json
 import re
@@ -20,73 +19,30 @@ from rest_framework import status
 
 from .models import Employee, InviteToken, EmotionData
 from .serializers import EmployeeSerializer, InviteTokenSerializer
+from .gallery import employee_companies, get_gallery
+from . import face_store
 
 from django.core.files.storage import default_storage
 from django.core.files.base import ContentFile
 
-# Resume processing imports
-try:
-    import fitz  # PyMuPDF
-    import docx  # python-docx
-    RESUME_PROCESSING_AVAILABLE = True
-except ImportError:
-    RESUME_PROCESSING_AVAILABLE = False
-
-# Face recognition imports
-try:
-    import face_recognition
-    from PIL import Image
-    FACE_RECOGNITION_AVAILABLE = True
-except ImportError:
-    FACE_RECOGNITION_AVAILABLE = False
-    # Create mock face_recognition module
-    class MockFaceRecognition:
-        @staticmethod
-        def load_image_file(file):
-            import cv2
-            import numpy as np
-            # Read image using OpenCV and convert to RGB
-            file_data = file.read()
-            file.seek(0)
-            nparr = np.frombuffer(file_data, np.uint8)
-            img = cv2.imdecode(nparr, cv2.IMREAD_COLOR)
-            return cv2.cvtColor(img, cv2.COLOR_BGR2RGB)
-        
-        @staticmethod
-        def face_locations(image, model='hog'):
-            # Mock face detection - return a dummy location
-            return [(0, 100, 100, 0)]  # top, right, bottom, left
-        
-        @staticmethod
-        def face_encodings(img, face_locations=None):
-            # Mock face encoding - return a consistent 128-dimension vector based on image hash
-            import numpy as np
-            import hashlib
-            if img is not None:
-                # Create a deterministic encoding based on image content
-                img_bytes = img.tobytes() if hasattr(img, 'tobytes') else b'mock_image'
-                hash_obj = hashlib.md5(img_bytes)
-                seed = int(hash_obj.hexdigest()[:8], 16)
-                np.random.seed(seed)
-            encoding = np.random.rand(128).astype(np.float64)
-            return [encoding]
-        
-        @staticmethod
-        def compare_faces(known_encodings, unknown_encoding, tolerance=0.6):
-            # Mock face comparison - always return True for demo
-            return [True] if known_encodings else [False]
-    
-    face_recognition = MockFaceRecognition()
-    FACE_RECOGNITION_AVAILABLE = True  # Enable with mock implementation
+# Resume processing (PyMuPDF, python-docx) and ML models are loaded on first use
+from .ml_models import registry as model_registry, warm_models
+RESUME_PROCESSING_AVAILABLE = model_registry.available('pymupdf') and model_registry.available('docx')
+
+# Face recognition imports (falls back to a deterministic mock when dlib is missing)
+from .recognition import FACE_RECOGNITION_AVAILABLE, MockFaceRecognition, face_recognition
+from .enrollment import encode_images, result_summary
+from .preprocess import analyze_frame, decode_frame, detect_faces
+from .quality import check_frame, gate_enabled
+from .duplicates import REJECT, check_duplicates
+from . import write_behind
+from .last_login import record_login
+from .uploads import ImageUploadError, request_fields, request_image, request_images
+from .login_profile import get_login_profile
 
 # Emotion detection imports
-try:
-    from fer import FER
-    EMOTION_DETECTION_AVAILABLE = True
-    emotion_detector = FER(mtcnn=True)
-except ImportError:
-    EMOTION_DETECTION_AVAILABLE = False
-    emotion_detector = None
+from .emotion import (EMOTION_DETECTION_AVAILABLE, cancel_emotion_detection, detect_emotion, emotion_result,
+                      submit_emotion_detection)
 
 # Utility: generate random token
 def random_token():
@@ -240,100 +196,86 @@ def employee_password_login(request):
 @csrf_exempt
 def face_login(request):
     """
-    Accepts JSON: { "image": "<data:image/jpeg;base64,...>" }
+    Accepts JSON: { "image": "<data:image/jpeg;base64,...>", "company_id": <optional> },
+    multipart with an "image" file part, or a raw image/jpeg body with
+    ?company_id=<optional> (see uploads.py).
+    When company_id is given (or FACE_LOGIN_COMPANY_ID is configured for a kiosk)
+    only that company's employees are searched.
     Returns matched employee info with voice greeting and project details.
     """
-    data = request.data
-    img_b64 = data.get('image')
-    if not img_b64:
+    try:
+        img_bytes = request_image(request)
+    except ImageUploadError as e:
+        return Response({"detail": str(e)}, status=413)
+    except ValueError:
+        return Response({"detail":"invalid image"}, status=400)
+    if not img_bytes:
         return Response({"detail":"image required"}, status=400)
 
-    # Load employee encodings from individual files
-    employee_encodings_dir = os.path.join(settings.MEDIA_ROOT, 'employee_encodings')
-    if not os.path.exists(employee_encodings_dir):
+    data = request_fields(request)
+    company_id = data.get('company_id') or getattr(settings, 'FACE_LOGIN_COMPANY_ID', None)
+    if company_id is not None:
+        try:
+            company_id = int(company_id)
+        except (TypeError, ValueError):
+            return Response({"detail":"invalid company_id"}, status=400)
+
+    # Encodings come from the process-resident gallery (loaded once per process)
+    gallery = get_gallery()
+    if not len(gallery.index(company_id)):
         return Response({"detail":"no encodings available"}, status=404)
 
-    # Load all employee encodings
-    enc_db = {}
-    for emp_id in os.listdir(employee_encodings_dir):
-        emp_dir = os.path.join(employee_encodings_dir, emp_id)
-        if os.path.isdir(emp_dir):
-            encodings_file = os.path.join(emp_dir, 'encodings.pkl')
-            if os.path.exists(encodings_file):
-                try:
-                    with open(encodings_file, 'rb') as f:
-                        enc_db[emp_id] = pickle.load(f)
-                except:
-                    continue
-
-    # Decode incoming image base64 (strip header)
-    if ',' in img_b64:
-        img_b64 = img_b64.split(',',1)[1]
-    img_bytes = base64.b64decode(img_b64)
-    
-    # Use face_recognition to compute encoding
-    import io
+    # Reduced-size decode, detection on a downscaled copy, encoding of the face crop only
+    timings = {}
     try:
-        from PIL import Image
-        img = Image.open(io.BytesIO(img_bytes)).convert('RGB')
-        img_arr = np.array(img)
-    except ImportError:
-        # Use OpenCV as fallback
-        import cv2
-        nparr = np.frombuffer(img_bytes, np.uint8)
-        img = cv2.imdecode(nparr, cv2.IMREAD_COLOR)
-        img_arr = cv2.cvtColor(img, cv2.COLOR_BGR2RGB)
-    
-    # Use mock face_recognition if available
-    encs = face_recognition.face_encodings(img_arr)
+        img_arr = decode_frame(img_bytes, timings=timings)
+    except Exception as e:
+        print(f"Face login decode error: {e}")
+        return Response({"detail":"invalid image"}, status=400)
+
+    # Blurry, dark or empty frames are turned away before any model runs
+    if gate_enabled('face_login'):
+        quality = check_frame(img_arr, timings=timings)
+        if not quality['ok']:
+            return Response({"detail":"poor frame quality", "reason":quality['reason'], "quality":quality['metrics']}, status=400)
+
+    # The detected face goes to the emotion batcher (no second detector pass) while this thread encodes and matches it
+    emotion_jobs = []
+
+    def start_emotion(locations):
+        if locations:
+            emotion_jobs.append(submit_emotion_detection(img_arr, locations[0]))
+
+    frame = analyze_frame(img_arr, timings=timings, on_detect=start_emotion)
+    emotion_job = emotion_jobs[0] if emotion_jobs else None
+    print(f"Face login preprocessing: {frame['timings']}")
+    encs = frame['encodings']
     if not encs:
+        cancel_emotion_detection(emotion_job)
         return Response({"detail":"no face detected"}, status=400)
     qenc = encs[0]
 
-    # Detect emotion from the face
-    detected_emotion = "neutral"
-    emotion_confidence = 0.0
-    if EMOTION_DETECTION_AVAILABLE and emotion_detector:
-        try:
-            # Detect emotions
-            emotions = emotion_detector.detect_emotions(img_arr)
-            if emotions and len(emotions) > 0:
-                # Get the dominant emotion
-                emotion_data = emotions[0]
-                if 'emotions' in emotion_data:
-                    emotions_dict = emotion_data['emotions']
-                    # Find the emotion with highest confidence
-                    detected_emotion = max(emotions_dict, key=emotions_dict.get)
-                    emotion_confidence = emotions_dict[detected_emotion]
-        except Exception as e:
-            print(f"Emotion detection error: {e}")
-
-    # Compare using mock face recognition
-    best = {"emp_id": None, "dist": 999}
-    for emp_id, enc in enc_db.items():
-        # Use mock compare_faces
-        matches = face_recognition.compare_faces(enc, qenc)
-        if matches and matches[0]:  # If face matches
-            best = {"emp_id": emp_id, "dist": 0.0}  # Perfect match for demo
-            break
+    # Score the probe against the whole gallery in one batched distance computation
+    tolerance = getattr(settings, 'FACE_MATCH_TOLERANCE', 0.6)
+    candidates = gallery.search(qenc, k=getattr(settings, 'FACE_MATCH_TOP_K', 3), company_id=company_id)
+    best = {"emp_id": None, "dist": None}
+    if candidates:
+        best_id, best_dist = candidates[0]
+        best["dist"] = round(best_dist, 4)
+        if best_dist <= tolerance:
+            best["emp_id"] = best_id
     
-    # For mock, always accept if we found a match
     if best["emp_id"] is not None:
         try:
-            emp = Employee.objects.get(id=best["emp_id"])
+            # Profile fields and active projects come from the login profile cache
+            profile = get_login_profile(best["emp_id"])
+
+            # Use the emotion only if it arrived within FACE_EMOTION_DEADLINE_MS
+            emotion_outcome = emotion_result(emotion_job)
+            emotion_included = emotion_outcome is not None
+            detected_emotion, emotion_confidence = emotion_outcome or ("neutral", 0.0)
             
-            # Get employee's current projects
-            current_projects = []
-            projects = emp.projects.filter(status='active')
-            for project in projects:
-                current_projects.append({
-                    'name': project.name,
-                    'description': project.description,
-                    'status': project.status,
-                    'progress': project.progress_percentage,
-                    'deadline': project.deadline.strftime('%Y-%m-%d') if project.deadline else None,
-                    'role': 'Team Member'  # You can enhance this with EmployeeProject model
-                })
+            current_projects = profile['current_projects']
             
             # Generate emotion-based greeting
             def get_emotion_based_greeting(emotion, confidence, emp_name, designation, projects):
@@ -387,14 +329,14 @@ def face_login(request):
             greeting_data = get_emotion_based_greeting(
                 detected_emotion, 
                 emotion_confidence, 
-                emp.first_name or emp.name, 
-                emp.designation or '', 
+                profile['first_name'] or profile['name'], 
+                profile['designation'] or '', 
                 current_projects
             )
             
-            # Update last login
-            emp.last_login = timezone.now()
-            emp.save()
+            # Update last login (coalesced into a periodic bulk UPDATE of last_login only)
+            login_time = timezone.now()
+            record_login(profile['employee_id'], login_time)
             
             # Store emotion data in database
             emotion_data = {
@@ -403,23 +345,10 @@ def face_login(request):
                 'timestamp': timezone.now().isoformat()
             }
             
-            # Save emotion data to database
+            # Save emotion data (and the captured image) off the request thread
             try:
-                # Save the captured image for emotion analysis
-                emotion_image_path = None
-                if img_bytes:
-                    emotion_filename = f"emotion_{emp.id}_{timezone.now().strftime('%Y%m%d_%H%M%S')}.jpg"
-                    emotion_image_path = default_storage.save(f"emotions/{emotion_filename}", ContentFile(img_bytes))
-                
-                EmotionData.objects.create(
-                    employee=emp,
-                    emotion=detected_emotion,
-                    confidence=emotion_confidence,
-                    image=emotion_image_path,
-                    context='login'
-                )
-                
-                print(f"Emotion data saved: {detected_emotion} with {emotion_confidence:.2f} confidence")
+                if write_behind.record_emotion(profile['employee_id'], detected_emotion, emotion_confidence, 'login', img_bytes):
+                    print(f"Emotion data queued: {detected_emotion} with {emotion_confidence:.2f} confidence")
                 
             except Exception as e:
                 print(f"Failed to save emotion data: {e}")
@@ -428,35 +357,41 @@ def face_login(request):
             # Prepare response
             payload = {
                 "success": True,
-                "employee_id": str(emp.id),
-                "name": emp.name,
-                "first_name": emp.first_name,
-                "last_name": emp.last_name,
-                "email": emp.email,
-                "designation": emp.designation,
-                "department": emp.department,
-                "company": emp.company.name,
+                "employee_id": profile['employee_id'],
+                "name": profile['name'],
+                "first_name": profile['first_name'],
+                "last_name": profile['last_name'],
+                "email": profile['email'],
+                "designation": profile['designation'],
+                "department": profile['department'],
+                "company": profile['company'],
                 "greeting": greeting_data['greeting'],
                 "voice_greeting": greeting_data['greeting'],  # For text-to-speech
                 "voice_params": greeting_data['voice_params'],  # For dynamic voice settings
                 "current_projects": current_projects,
-                "skills": emp.get_skills_list(),
-                "experience": emp.experience,
-                "photo_url": emp.photo.url if emp.photo else None,
-                "login_time": emp.last_login.isoformat() if emp.last_login else None,
-                "token": f"employee_{emp.id}_{emp.email}",  # Simple token for session
+                "skills": profile['skills'],
+                "experience": profile['experience'],
+                "photo_url": profile['photo_url'],
+                "login_time": login_time.isoformat(),
+                "token": f"employee_{profile['employee_id']}_{profile['email']}",  # Simple token for session
+                "distance": best["dist"],
+                "timings": frame['timings'],
                 "emotion_detection": {
                     "detected_emotion": detected_emotion,
                     "confidence": emotion_confidence,
-                    "available": EMOTION_DETECTION_AVAILABLE
+                    "available": EMOTION_DETECTION_AVAILABLE,
+                    "included": emotion_included
                 }
             }
             
             return Response(payload, status=200)
             
         except Employee.DoesNotExist:
+            cancel_emotion_detection(emotion_job)
             return Response({"detail":"employee not found"}, status=404)
     else:
+        # Nobody to greet: the emotion is not needed
+        cancel_emotion_detection(emotion_job)
         return Response({"detail":"no match found", "distance": best["dist"]}, status=401)
 
 
@@ -562,52 +497,32 @@ def capture_emotion(request, employee_id):
     try:
         employee = get_object_or_404(Employee, id=employee_id)
         
-        img_b64 = request.data.get('image')
-        context = request.data.get('context', 'task_update')  # login, task_update, break, etc.
+        # JSON data URL, multipart "image" part or raw image/jpeg body (?context=...)
+        try:
+            img_bytes = request_image(request)
+        except ImageUploadError as e:
+            return Response({'success': False, 'message': str(e)}, status=413)
+        context = request_fields(request).get('context', 'task_update')  # login, task_update, break, etc.
         
-        if not img_b64:
+        if not img_bytes:
             return Response({'success': False, 'message': 'image required'}, status=400)
         
-        # Decode image
-        if ',' in img_b64:
-            img_b64 = img_b64.split(',',1)[1]
-        img_bytes = base64.b64decode(img_b64)
-        
         # Detect emotion
         detected_emotion = "neutral"
         emotion_confidence = 0.0
         
-        if EMOTION_DETECTION_AVAILABLE and emotion_detector:
+        if EMOTION_DETECTION_AVAILABLE:
             try:
-                import face_recognition
-                from PIL import Image
-                img = Image.open(io.BytesIO(img_bytes)).convert('RGB')
-                img_arr = np.array(img)
-                
-                # Detect emotions
-                emotions = emotion_detector.detect_emotions(img_arr)
-                if emotions and len(emotions) > 0:
-                    emotion_data = emotions[0]
-                    if 'emotions' in emotion_data:
-                        emotions_dict = emotion_data['emotions']
-                        detected_emotion = max(emotions_dict, key=emotions_dict.get)
-                        emotion_confidence = emotions_dict[detected_emotion]
+                # The HOG detector used for face encoding locates the face; FER only classifies it
+                image = decode_frame(img_bytes)
+                locations = detect_faces(image)
+                if locations:
+                    detected_emotion, emotion_confidence = detect_emotion(image, locations[0])
             except Exception as e:
                 print(f"Emotion detection error: {e}")
         
-        # Save emotion data
-        emotion_image_path = None
-        if img_bytes:
-            emotion_filename = f"emotion_{employee.id}_{context}_{timezone.now().strftime('%Y%m%d_%H%M%S')}.jpg"
-            emotion_image_path = default_storage.save(f"emotions/{emotion_filename}", ContentFile(img_bytes))
-        
-        EmotionData.objects.create(
-            employee=employee,
-            emotion=detected_emotion,
-            confidence=emotion_confidence,
-            image=emotion_image_path,
-            context=context
-        )
+        # Save emotion data (written in the background)
+        write_behind.record_emotion(employee.id, detected_emotion, emotion_confidence, context, img_bytes)
         
         return Response({
             'success': True,
@@ -624,6 +539,22 @@ def capture_emotion(request, employee_id):
         }, status=500)
 
 
+@api_view(['GET'])
+@permission_classes([IsAuthenticated])
+def emotion_write_behind_stats(request):
+    """Queue depth and drop counters of this worker's emotion write-behind queue"""
+    return Response(write_behind.stats())
+
+
+@api_view(['GET'])
+@permission_classes([AllowAny])
+def model_status(request):
+    """Readiness of this worker's ML models: 503 until the FACE_WARM_MODELS warm-up has finished"""
+    names = warm_models()
+    ready = model_registry.ready(names)
+    return Response({'ready': ready, 'models': model_registry.status()}, status=200 if ready else 503)
+
+
 # New AI-powered endpoints
 
 @api_view(['POST'])
@@ -688,7 +619,7 @@ def extract_text_from_resume(resume_file):
         
         if file_extension == 'pdf':
             # Extract text from PDF
-            pdf_document = fitz.open(stream=resume_file.read(), filetype="pdf")
+            pdf_document = model_registry.get('pymupdf').open(stream=resume_file.read(), filetype="pdf")
             text_content = ""
             for page_num in range(pdf_document.page_count):
                 page = pdf_document.load_page(page_num)
@@ -699,7 +630,7 @@ def extract_text_from_resume(resume_file):
             # Extract text from Word document
             import io
             if file_extension == 'docx':
-                doc = docx.Document(io.BytesIO(resume_file.read()))
+                doc = model_registry.get('docx').Document(io.BytesIO(resume_file.read()))
                 text_content = '\n'.join([paragraph.text for paragraph in doc.paragraphs])
             else:
                 # For .doc files, you might need to use python-docx2txt or other library
@@ -1021,87 +952,66 @@ def generate_encodings(request):
         }, status=500)
     
     try:
-        images = []
-        image_files = []
-        
         # Collect all uploaded images
-        for key in request.FILES:
-            if key.startswith('image_'):
-                image_file = request.FILES[key]
-                image_files.append(image_file)
-                
-                # Load image
-                try:
-                    image = face_recognition.load_image_file(image_file)
-                    images.append(image)
-                    print(f"Successfully loaded image: {key}")
-                except Exception as e:
-                    print(f"Failed to load image {key}: {e}")
-                    continue
-        
-        print(f"Total images loaded: {len(images)}")
-        
-        if len(images) == 0:
+        image_keys = [key for key in request.FILES if key.startswith('image_')]
+        if not image_keys:
             return Response({
                 'success': False,
                 'message': 'No valid images found. Please capture photos with your camera.'
             }, status=400)
-        
-        # Generate encodings from all images
-        all_encodings = []
-        successful_images = 0
-        
-        for idx, image in enumerate(images):
-            try:
-                face_locations = face_recognition.face_locations(image)
-                print(f"Image {idx}: Found {len(face_locations)} face(s)")
-                
-                if len(face_locations) == 0:
-                    print(f"No face found in image {idx}")
-                    continue  # No face found in this image
-                
-                face_encodings = face_recognition.face_encodings(image, face_locations)
-                
-                if len(face_encodings) > 0:
-                    # Use the first face found
-                    all_encodings.append(face_encodings[0])
-                    successful_images += 1
-                    print(f"Successfully generated encoding for image {idx}")
-            except Exception as e:
-                print(f"Error processing image {idx}: {e}")
-                continue
-        
+
+        # Detection and encoding run in parallel across the enrollment pool
+        results = encode_images([request.FILES[key] for key in image_keys])
+        for key, result in zip(image_keys, results):
+            if result['error']:
+                print(f"Error processing image {key}: {result['error']}")
+            elif not result['face_found']:
+                print(f"No face found in image {key}")
+
+        all_encodings = [result['encoding'] for result in results if result['face_found']]
+        successful_images = len(all_encodings)
+
         if len(all_encodings) == 0:
             return Response({
                 'success': False,
-                'message': 'No faces detected in the uploaded images. Please ensure your face is clearly visible in the photos.'
+                'message': 'No faces detected in the uploaded images. Please ensure your face is clearly visible in the photos.',
+                'images': [result_summary(result) for result in results]
             }, status=400)
         
-        # Average the encodings to get a more robust representation
-        avg_encoding = np.mean(all_encodings, axis=0)
-        
-        # Store encodings in pickle file
+        # Store encodings in the face store
         token = request.POST.get('token')
-        employee_id = request.POST.get('employee_id', 'temp')
+        employee_id = request.POST.get('employee_id')
         
+        duplicates = {'action': None}
         if token:
-            # Create employee-specific directory
-            employee_dir = os.path.join(settings.MEDIA_ROOT, 'employee_encodings', employee_id)
-            os.makedirs(employee_dir, exist_ok=True)
-            
-            encodings_path = os.path.join(employee_dir, 'encodings.pkl')
-            
-            # Save encodings
-            with open(encodings_path, 'wb') as f:
-                pickle.dump(all_encodings, f)  # Save all encodings, not just average
-            
-            print(f"Encodings saved to: {encodings_path}")
+            if employee_id:
+                company_id = employee_companies([employee_id]).get(str(employee_id))
+            else:
+                company_id = InviteToken.objects.filter(token=token).values_list('company_id', flat=True).first()
+            duplicates = check_duplicates(all_encodings, company_id, exclude=employee_id)
+            if duplicates['action'] == REJECT:
+                return Response({
+                    'success': False,
+                    'message': 'This face is already enrolled for another employee.',
+                    'duplicate_face': True,
+                    'images': [result_summary(result) for result in results]
+                }, status=409)
+
+            if employee_id:
+                get_gallery().set_employee(employee_id, all_encodings, company_id)  # Reduced to FACE_MAX_EXEMPLARS exemplars
+                print(f"Encodings saved to face store for employee {employee_id}")
+            else:
+                # Employee does not exist yet: stage until onboard_employee creates it
+                staged_path = face_store.stage_encodings(token, all_encodings)
+                print(f"Encodings staged at: {staged_path}")
         
         return Response({
             'success': True,
             'message': f'Face encodings generated successfully from {successful_images} image(s)',
             'encodings_count': len(all_encodings),
-            'successful_images': successful_images
+            'successful_images': successful_images,
+            'duplicate_face': duplicates['action'] is not None,
+            'images': [result_summary(result) for result in results]
         })
         
     except Exception as e:
@@ -1143,6 +1053,17 @@ def onboard_employee(request):
             except:
                 resume_analysis = None
         
+        # Refuse a face that is already enrolled before creating anything
+        duplicates = {'action': None}
+        if request.POST.get('encodings_generated') == 'true':
+            duplicates = check_duplicates(face_store.load_staged_encodings(token), invite.company_id)
+            if duplicates['action'] == REJECT:
+                return Response({
+                    'success': False,
+                    'message': 'This face is already enrolled for another employee.',
+                    'duplicate_face': True
+                }, status=409)
+
         # Create employee with all fields
         emp = Employee.objects.create(
             company=invite.company,
@@ -1199,30 +1120,12 @@ def onboard_employee(request):
         if 'resume' in request.FILES:
             emp.resume = request.FILES['resume']
         
-        # Handle face encodings - create proper encodings.pkl file
+        # Handle face encodings - move the staged encodings into the face store
         if request.POST.get('encodings_generated') == 'true':
-            encodings_filename = f"encodings_{token}.pkl"
-            encodings_path = os.path.join(settings.MEDIA_ROOT, 'encodings', encodings_filename)
-            
-            if os.path.exists(encodings_path):
-                # Create employee-specific directory
-                employee_dir = os.path.join(settings.MEDIA_ROOT, 'employee_encodings', str(emp.id))
-                os.makedirs(employee_dir, exist_ok=True)
-                
-                # Create the final encodings.pkl file
-                final_encodings_path = os.path.join(employee_dir, 'encodings.pkl')
-                
-                import shutil
-                shutil.move(encodings_path, final_encodings_path)
-                emp.face_encodings_path = final_encodings_path
-                
-                # Also save a copy with employee ID for easy lookup
-                backup_encodings_path = os.path.join(
-                    settings.MEDIA_ROOT, 
-                    'employee_encodings', 
-                    f"employee_{emp.id}_encodings.pkl"
-                )
-                shutil.copy2(final_encodings_path, backup_encodings_path)
+            staged_encodings = face_store.pop_staged_encodings(token)
+            if staged_encodings is not None:
+                get_gallery().set_employee(emp.id, staged_encodings, emp.company_id)
+                emp.face_encodings_path = face_store.store_path()
         
         # Store resume analysis as JSON string
         if resume_analysis:
@@ -1251,7 +1154,8 @@ def onboard_employee(request):
         return Response({
             'success': True,
             'message': 'Employee onboarded successfully',
-            'employee_id': str(emp.id)
+            'employee_id': str(emp.id),
+            'duplicate_face': duplicates['action'] is not None
         })
         
     except Exception as e:
@@ -1267,7 +1171,8 @@ def onboard_employee(request):
 def employee_register(request):
     """
     Direct employee registration with face verification
-    Accepts JSON with employee details and face images
+    Accepts JSON with employee details and face images (base64 data URLs), or
+    multipart form fields with three "face_images" file parts
     """
     from django.core.validators import validate_email
     from django.core.exceptions import ValidationError
@@ -1278,10 +1183,22 @@ def employee_register(request):
     
     try:
         data = request.data
+        try:
+            face_images = request_images(request, "face_images")
+        except ImageUploadError as e:
+            return Response({
+                "success": False,
+                "error": "Image too large",
+                "errors": {"face_images": str(e)}
+            }, status=status.HTTP_413_REQUEST_ENTITY_TOO_LARGE)
+        except ValueError:
+            face_images = None
         
         # Validate required fields
-        required_fields = ["first_name", "last_name", "email", "password", "face_images"]
+        required_fields = ["first_name", "last_name", "email", "password"]
         missing_fields = [field for field in required_fields if not data.get(field)]
+        if not face_images:
+            missing_fields.append("face_images")
         
         if missing_fields:
             return Response({
@@ -1318,7 +1235,6 @@ def employee_register(request):
             }, status=status.HTTP_400_BAD_REQUEST)
 
         # Validate face images
-        face_images = data.get("face_images", [])
         if not isinstance(face_images, list) or len(face_images) != 3:
             return Response({
                 "success": False,
@@ -1382,13 +1298,10 @@ def employee_register(request):
         # Process face images and create encodings
         if FACE_RECOGNITION_AVAILABLE and len(face_images) == 3:
             try:
-                face_encodings = []
+                # Already decoded by request_images (file parts or base64 data URLs)
+                image_bytes_list = face_images
                 
-                for i, image_data in enumerate(face_images):
-                    # Decode base64 image
-                    image_data = image_data.split(',')[1] if ',' in image_data else image_data
-                    image_bytes = base64.b64decode(image_data)
-                    
+                for i, image_bytes in enumerate(image_bytes_list):
                     # Save face photo
                     face_filename = f"employee_{employee.id}_face_{i+1}.jpg"
                     face_path = os.path.join(settings.MEDIA_ROOT, 'faces', face_filename)
@@ -1398,13 +1311,12 @@ def employee_register(request):
                     
                     with open(face_path, 'wb') as f:
                         f.write(image_bytes)
-                    
-                    # Load image and find face encodings
-                    image = face_recognition.load_image_file(face_path)
-                    encodings = face_recognition.face_encodings(image)
-                    
-                    if encodings:
-                        face_encodings.append(encodings[0])
+
+                # Find face encodings for all three images in parallel
+                face_encodings = []
+                for i, result in enumerate(encode_images(image_bytes_list)):
+                    if result['face_found']:
+                        face_encodings.append(result['encoding'])
                     else:
                         # Clean up created employee if no face found
                         employee.delete()
@@ -1414,13 +1326,18 @@ def employee_register(request):
                             "errors": {"face_images": f"No face detected in image {i+1}"}
                         }, status=status.HTTP_400_BAD_REQUEST)
 
-                # Save face encodings
+                # Save face encodings, unless the face already belongs to another employee of the company
+                duplicates = check_duplicates(face_encodings, company.id, exclude=employee.id)
+                if duplicates['action'] == REJECT:
+                    employee.delete()
+                    return Response({
+                        "success": False,
+                        "error": "Face already enrolled",
+                        "errors": {"face_images": "This face is already enrolled for another employee"}
+                    }, status=status.HTTP_409_CONFLICT)
+
                 if len(face_encodings) == 3:
-                    encodings_filename = f"employee_{employee.id}_encodings.pkl"
-                    encodings_path = os.path.join(settings.MEDIA_ROOT, 'faces', encodings_filename)
-                    
-                    with open(encodings_path, 'wb') as f:
-                        pickle.dump(face_encodings, f)
+                    get_gallery().set_employee(employee.id, face_encodings, company.id)
                     
                     # Update employee with face photo path
                     employee.face_photo = f"faces/{face_filename}"
@@ -1468,6 +1385,7 @@ def employee_register(request):
             "employee_email": employee.email,
             "company_id": str(company.id),
             "company_name": company.name,
+            "duplicate_face": duplicates['action'] is not None,
             "message": "Registration successful"
         }, status=status.HTTP_201_CREATED)
 
@@ -0,0 +1,221 @@
+"""
+Write-behind persistence of emotion snapshots.
+
+face_login and capture_emotion used to save the captured JPEG and insert an
+EmotionData row before answering. Neither has anything to do with
+authenticating the employee, so they are queued here instead and a single
+background thread writes the images and inserts the rows in batches with
+bulk_create.
+
+The queue is bounded (FACE_WRITE_BEHIND_QUEUE_SIZE). When it is full a
+request blocks for up to FACE_WRITE_BEHIND_PUT_TIMEOUT_MS (backpressure) and
+the snapshot is dropped after that. Pending items are flushed at interpreter
+exit. stats() returns the counters. With FACE_WRITE_BEHIND = False,
+snapshots are written synchronously.
+"""
+import atexit
+import queue
+import threading
+import time
+
+from django.conf import settings
+from django.core.files.base import ContentFile
+from django.core.files.storage import default_storage
+from django.db import IntegrityError, close_old_connections, transaction
+from django.utils import timezone
+
+_STOP = object()
+
+
+class EmotionWriteBehind:
+    """Bounded queue of emotion snapshots drained by one worker thread"""
+
+    def __init__(self, maxsize=1000, batch_size=100, flush_interval=0.5):
+        self.batch_size = batch_size
+        self.flush_interval = flush_interval
+        self._queue = queue.Queue(maxsize=maxsize)
+        self._thread = None
+        self._lock = threading.Lock()
+        self.counters = {'enqueued': 0, 'written': 0, 'dropped': 0, 'failed': 0, 'batches': 0, 'max_depth': 0}
+
+    def _count(self, name, n=1):
+        with self._lock:
+            self.counters[name] += n
+
+    def _ensure_worker(self):
+        with self._lock:
+            if self._thread is None or not self._thread.is_alive():
+                self._thread = threading.Thread(target=self._run, name='emotion-write-behind', daemon=True)
+                self._thread.start()
+
+    def put(self, snapshot, timeout=0.05):
+        """Queue a snapshot; returns False if it was dropped because the queue stayed full"""
+        self._ensure_worker()
+        try:
+            self._queue.put(snapshot, timeout=timeout)
+        except queue.Full:
+            self._count('dropped')
+            print(f"Emotion write-behind queue full, dropped snapshot for employee {snapshot['employee_id']}")
+            return False
+        with self._lock:
+            self.counters['enqueued'] += 1
+            self.counters['max_depth'] = max(self.counters['max_depth'], self._queue.qsize())
+        return True
+
+    def _run(self):
+        while True:
+            batch = []
+            stop = False
+            deadline = None
+            while len(batch) < self.batch_size:
+                timeout = None if deadline is None else max(deadline - time.monotonic(), 0)
+                try:
+                    item = self._queue.get(timeout=timeout)
+                except queue.Empty:
+                    break
+                if item is _STOP:
+                    self._queue.task_done()
+                    stop = True
+                    break
+                batch.append(item)
+                if deadline is None:
+                    # Collect whatever else arrives within flush_interval into the same insert
+                    deadline = time.monotonic() + self.flush_interval
+            if batch:
+                self._write(batch)
+                for _ in batch:
+                    self._queue.task_done()
+            if stop:
+                return
+
+    def _write(self, batch):
+        close_old_connections()
+        try:
+            written = write_snapshots(batch)
+            self._count('written', written)
+            self._count('failed', len(batch) - written)
+            self._count('batches')
+        except Exception as e:
+            self._count('failed', len(batch))
+            print(f"Emotion write-behind failed for {len(batch)} snapshot(s): {e}")
+        finally:
+            close_old_connections()
+
+    def flush(self):
+        """Block until everything queued so far is written"""
+        if self._thread is not None and self._thread.is_alive():
+            self._queue.join()
+
+    def close(self):
+        """Flush pending snapshots and stop the worker"""
+        if self._thread is not None and self._thread.is_alive():
+            self._queue.put(_STOP)
+            self._thread.join(timeout=getattr(settings, 'FACE_WRITE_BEHIND_SHUTDOWN_TIMEOUT', 10))
+
+    def stats(self):
+        with self._lock:
+            return {**self.counters, 'depth': self._queue.qsize(), 'capacity': self._queue.maxsize}
+
+
+def _delete_image(path):
+    if path:
+        try:
+            default_storage.delete(path)
+        except OSError as e:
+            print(f"Could not remove emotion image {path}: {e}")
+
+
+def write_snapshots(snapshots):
+    """
+    Save the images and insert the EmotionData rows of several snapshots at once.
+    Snapshots of employees deleted since they were queued are skipped, and if the
+    batch insert still fails on a constraint the rows are inserted one at a time,
+    so one bad row does not cost the whole batch. The image of every row that is
+    not written is removed again. Returns the number of rows written.
+    """
+    from .models import Employee, EmotionData
+
+    existing = {str(emp_id) for emp_id in Employee.objects.filter(
+        id__in={str(snapshot['employee_id']) for snapshot in snapshots}).values_list('id', flat=True)}
+    skipped = sum(str(snapshot['employee_id']) not in existing for snapshot in snapshots)
+    if skipped:
+        print(f"Emotion write-behind skipped {skipped} snapshot(s) of deleted employees")
+
+    rows = []
+    for snapshot in snapshots:
+        if str(snapshot['employee_id']) not in existing:
+            continue
+        image_path = None
+        if snapshot['image_bytes']:
+            image_path = default_storage.save(snapshot['image_name'], ContentFile(snapshot['image_bytes']))
+        rows.append(EmotionData(
+            employee_id=snapshot['employee_id'],
+            emotion=snapshot['emotion'],
+            confidence=snapshot['confidence'],
+            image=image_path,
+            context=snapshot['context'],
+        ))
+    if not rows:
+        return 0
+
+    try:
+        with transaction.atomic():
+            EmotionData.objects.bulk_create(rows)
+        return len(rows)
+    except IntegrityError as e:
+        print(f"Emotion write-behind batch insert failed ({e}), inserting {len(rows)} row(s) one by one")
+    except Exception:
+        for row in rows:
+            _delete_image(row.image.name)
+        raise
+
+    written = 0
+    for row in rows:
+        row.pk = None
+        try:
+            with transaction.atomic():
+                row.save()
+            written += 1
+        except IntegrityError as e:
+            print(f"Emotion snapshot for employee {row.employee_id} not written: {e}")
+            _delete_image(row.image.name)
+    return written
+
+
+_writer = None
+_writer_lock = threading.Lock()
+
+
+def get_writer():
+    global _writer
+    with _writer_lock:
+        if _writer is None:
+            _writer = EmotionWriteBehind(
+                maxsize=getattr(settings, 'FACE_WRITE_BEHIND_QUEUE_SIZE', 1000),
+                batch_size=getattr(settings, 'FACE_WRITE_BEHIND_BATCH_SIZE', 100),
+                flush_interval=getattr(settings, 'FACE_WRITE_BEHIND_FLUSH_INTERVAL', 0.5),
+            )
+            atexit.register(_writer.close)
+        return _writer
+
+
+def record_emotion(employee_id, emotion, confidence, context, image_bytes=None):
+    """Persist an emotion snapshot (and its image) without making the request wait for it"""
+    snapshot = {
+        'employee_id': employee_id,
+        'emotion': emotion,
+        'confidence': confidence,
+        'context': context,
+        'image_bytes': image_bytes,
+        # Named at capture time so the file reflects when the frame was taken
+        'image_name': f"emotions/emotion_{employee_id}_{context}_{timezone.now().strftime('%Y%m%d_%H%M%S')}.jpg",
+    }
+    if not getattr(settings, 'FACE_WRITE_BEHIND', True):
+        write_snapshots([snapshot])
+        return True
+    timeout = getattr(settings, 'FACE_WRITE_BEHIND_PUT_TIMEOUT_MS', 50) / 1000
+    return get_writer().put(snapshot, timeout=timeout)
+
+
+def stats():
+    return get_writer().stats()
@@ -0,0 +1,35 @@
+"""
+Gunicorn settings for the backend:
+
+    gunicorn -c gunicorn.conf.py backend.wsgi
+
+With GUNICORN_PRELOAD=1 the master imports Django and the URLconf once and
+workers fork with them loaded. The ML models (dlib, TensorFlow) are never
+loaded in the master: their state is not fork-safe, so each worker warms
+FACE_WARM_MODELS in a background thread right after the fork, and
+/api/employees/models/status/ reports when it is ready.
+"""
+import os
+
+bind = os.environ.get('GUNICORN_BIND', '0.0.0.0:8000')
+workers = int(os.environ.get('WEB_CONCURRENCY', 3))
+timeout = int(os.environ.get('GUNICORN_TIMEOUT', 120))
+preload_app = os.environ.get('GUNICORN_PRELOAD', '0') == '1'
+
+
+def on_starting(server):
+    os.environ.setdefault('DJANGO_SETTINGS_MODULE', 'backend.settings')
+
+
+def when_ready(server):
+    if preload_app:
+        # Resolve the URLconf (and with it every view module) before forking
+        from django.urls import get_resolver
+        get_resolver().url_patterns
+
+
+def post_fork(server, worker):
+    import django
+    django.setup()
+    from employees.ml_models import start_warm_up
+    start_warm_up()